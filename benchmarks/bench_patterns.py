@@ -0,0 +1,102 @@
+"""
+Micro-benchmark: per-pattern `re.search` loops vs. the single-pass PatternSet.
+
+    python -m benchmarks.bench_patterns --rules 300 --texts 2000
+
+The baseline reproduces how the safety layers used to scan text (one
+`re.search` call per raw pattern string, per request).
+"""
+import argparse
+import random
+import re
+import time
+from typing import Callable, List
+
+from src.orchestration.patterns import PatternSet
+from src.orchestration.safety import SafetyGuardrails
+from src.orchestration.hallucination_controls import DIAGNOSTIC_PATTERNS
+from src.monitoring.failure_detector import EMOTIONAL_FAILURE_PATTERNS
+
+FILLER = (
+    "It sounds like you have been carrying a lot lately. I wonder what it would feel like "
+    "to tell your partner how the last few weeks have been for you. Sometimes naming the "
+    "feeling first makes the conversation easier. What do you think is holding you back? "
+).split()
+
+
+def build_rules(extra: int, seed: int) -> List[str]:
+    guardrails = SafetyGuardrails()
+    rules = (
+        guardrails.crisis_keywords
+        + guardrails.prohibited_topics
+        + [p for p, _ in guardrails.forbidden_response_patterns]
+        + DIAGNOSTIC_PATTERNS
+        + [p for p, _ in EMOTIONAL_FAILURE_PATTERNS]
+    )
+    rng = random.Random(seed)
+    for i in range(extra):
+        a, b = rng.sample(FILLER, 2)
+        rules.append(rf"\b{a}\w* (?:really )?{b}{i}\b")
+    return rules
+
+
+def build_texts(count: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        words = [rng.choice(FILLER) for _ in range(rng.randint(60, 220))]
+        if rng.random() < 0.05:
+            words.insert(rng.randrange(len(words)), "definitely")
+        texts.append(" ".join(words))
+    return texts
+
+
+def per_pattern_loop(rules: List[str]) -> Callable[[str], List[int]]:
+    def scan(text: str) -> List[int]:
+        return [i for i, p in enumerate(rules) if re.search(p, text, re.IGNORECASE)]
+    return scan
+
+
+def single_pass(rules: List[str]) -> Callable[[str], List[int]]:
+    pattern_set = PatternSet(rules)
+    def scan(text: str) -> List[int]:
+        return sorted({hit.index for hit in pattern_set.scan(text)})
+    return scan
+
+
+def timed(fn: Callable[[str], List[int]], texts: List[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rules", type=int, default=300, help="synthetic rules added to the shipped ones")
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rules = build_rules(args.rules, args.seed)
+    texts = build_texts(args.texts, args.seed)
+    baseline, candidate = per_pattern_loop(rules), single_pass(rules)
+
+    mismatches = sum(1 for t in texts if baseline(t) != candidate(t))
+
+    loop_s = timed(baseline, texts, args.repeat)
+    pass_s = timed(candidate, texts, args.repeat)
+    per_text = lambda s: s / len(texts) * 1e6
+
+    print(f"rules={len(rules)} texts={len(texts)} mismatches={mismatches}")
+    print(f"per-pattern loop : {loop_s:8.3f}s  ({per_text(loop_s):8.1f} us/text)")
+    print(f"single pass      : {pass_s:8.3f}s  ({per_text(pass_s):8.1f} us/text)")
+    print(f"speedup          : {loop_s / pass_s:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+from uuid import UUID
+
+from src.database.client import MAX_PROGRESS_NOTES, _merge_updates
+
+
+class InMemoryDatabaseClient:
+    """
+    Stand-in for DatabaseClient with the same async interface, for benchmarks
+    without Postgres. `latency_ms` simulates the round-trip of each call.
+    """
+
+    def __init__(self, latency_ms: float = 1.0):
+        self.latency = latency_ms / 1000
+        self.pool = None
+        self.memory: Dict[UUID, Dict[str, Any]] = {}
+        self.audit_log: List[Dict[str, Any]] = []
+        self.round_trips = 0
+        self._memory_listeners: List[Callable[[Optional[UUID]], None]] = []
+
+    async def _round_trip(self):
+        self.round_trips += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        pass
+
+    @property
+    def memory_listener_active(self) -> bool:
+        return bool(self._memory_listeners)
+
+    async def listen_memory_updates(self, callback: Callable[[Optional[UUID]], None]):
+        """In-process stand-in for LISTEN/NOTIFY: called after every write."""
+        if callback not in self._memory_listeners:
+            self._memory_listeners.append(callback)
+
+    async def get_user_memory(self, user_id: UUID) -> Optional[Dict[str, Any]]:
+        await self._round_trip()
+        row = self.memory.get(user_id)
+        return dict(row) if row else None
+
+    async def create_user_memory(self, user_id: UUID):
+        await self._round_trip()
+        self._row(user_id)
+
+    def _row(self, user_id: UUID) -> Dict[str, Any]:
+        return self.memory.setdefault(user_id, {
+            "user_id": user_id,
+            "relationship_context": {},
+            "recurring_themes": {},
+            "emotional_patterns": {},
+            "progress_notes": [],
+            "updated_at": datetime.now(timezone.utc),
+        })
+
+    async def update_user_memory(
+        self,
+        user_id: UUID,
+        relationship_context: Optional[dict] = None,
+        recurring_themes: Optional[dict] = None,
+        emotional_patterns: Optional[dict] = None,
+        new_progress_note: Optional[str] = None
+    ):
+        await self.bulk_update_user_memory([{
+            "user_id": user_id,
+            "relationship_context": relationship_context,
+            "recurring_themes": recurring_themes,
+            "emotional_patterns": emotional_patterns,
+            "new_progress_note": new_progress_note
+        }])
+
+    async def bulk_update_user_memory(self, updates: List[Dict[str, Any]]):
+        """Same merge semantics as UPSERT_MEMORY_SQL, one round trip per batch."""
+        if not updates:
+            return
+        await self._round_trip()
+        for entry in _merge_updates(updates):
+            row = self._row(entry["user_id"])
+            for field in ("relationship_context", "recurring_themes", "emotional_patterns"):
+                row[field] = {**row[field], **entry[field]}
+            row["progress_notes"] = (row["progress_notes"] + entry["progress_notes"])[-MAX_PROGRESS_NOTES:]
+            row["updated_at"] = datetime.now(timezone.utc)
+            self.audit_log.append({"user_id": entry["user_id"], "action": "UPDATE"})
+            for listener in self._memory_listeners:
+                listener(entry["user_id"])
+
+    async def log_crisis_event(self, user_id: UUID, details: str):
+        await self._round_trip()
+        self.audit_log.append({"user_id": user_id, "action": "CRISIS_ALERT", "details": json.dumps({"note": details})})
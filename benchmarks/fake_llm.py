@@ -0,0 +1,269 @@
+"""
+Local OpenAI-compatible provider for load tests. No API key or network needed.
+
+    python -m benchmarks.fake_llm --port 8900 --latency-ms 150 --tokens-per-second 80
+
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:8900/v1 and any
+OPENAI_API_KEY. Classification calls are answered from the keyword markers in
+benchmarks/traffic.py, so expected risk levels can be checked end to end.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass
+
+import numpy as np
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import ClientDisconnect, Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from benchmarks.traffic import LEVEL_MARKERS
+
+EMBEDDING_DIMENSIONS = 256
+
+# Canned counselling reply: passes Layer 2 and the humility rewrites unchanged
+REPLY = (
+    "It sounds like this has been weighing on you for a while. I wonder what it would "
+    "feel like to share that with your partner in a calm moment. What do you think "
+    "makes it hardest to start that conversation? Sometimes naming the feeling first "
+    "helps both people slow down and listen."
+)
+
+# Keys follow the numbered sections of the summarizer prompt
+SUMMARY = json.dumps({
+    "1": {"status": "in a relationship"},
+    "2": {"communication": "recurring"},
+    "3": {},
+    "4": "Discussed how to raise a difficult topic."
+})
+
+
+@dataclass
+class FakeProviderConfig:
+    latency_ms: float = 150.0       # time to first token
+    jitter_ms: float = 50.0         # uniform +/- on the latency
+    tokens_per_second: float = 80.0 # streaming/generation speed; 0 = instant
+    error_rate: float = 0.0         # share of requests answered with 429/500
+    tail_rate: float = 0.0          # share of requests delayed by an extra tail_ms
+    tail_ms: float = 0.0
+    seed: int = 0
+
+
+def _words(text: str):
+    # Keep the trailing space on each word so chunks concatenate back to the text
+    return [w + " " for w in text.split(" ")[:-1]] + [text.split(" ")[-1]]
+
+
+def _approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _classify(message: str) -> str:
+    lowered = message.lower()
+    for level in ("CRISIS", "HIGH_RISK", "MEDIUM_RISK"):
+        if any(marker in lowered for marker in LEVEL_MARKERS[level]):
+            return level
+    return "LOW_RISK"
+
+
+def _classification(message: str) -> dict:
+    return {
+        "risk_level": _classify(message),
+        "confidence_score": 0.9,
+        "topic_categorization": "relationship",
+        "crisis_indicators": [],
+        "recommended_action": "respond"
+    }
+
+
+def _embedding(text: str) -> list:
+    """Deterministic hashed bag-of-words vector; identical texts get identical vectors."""
+    vec = np.zeros(EMBEDDING_DIMENSIONS, dtype=np.float32)
+    for word in text.lower().split():
+        digest = hashlib.blake2b(word.encode("utf-8"), digest_size=4).digest()
+        vec[int.from_bytes(digest, "little") % EMBEDDING_DIMENSIONS] += 1.0
+    norm = float(np.linalg.norm(vec))
+    return (vec / norm if norm else vec).tolist()
+
+
+def create_app(config: FakeProviderConfig = None) -> Starlette:
+    config = config or FakeProviderConfig()
+    rng = random.Random(config.seed)
+    stats = {"requests": 0, "errors": 0, "batched_items": 0}
+
+    async def _delay():
+        jitter = rng.uniform(-config.jitter_ms, config.jitter_ms)
+        tail = config.tail_ms if config.tail_rate and rng.random() < config.tail_rate else 0.0
+        await asyncio.sleep(max(0.0, config.latency_ms + jitter + tail) / 1000)
+
+    def _injected_error():
+        if config.error_rate and rng.random() < config.error_rate:
+            stats["errors"] += 1
+            status = rng.choice([429, 500])
+            return JSONResponse(
+                {"error": {"message": "injected failure", "type": "fake_error", "code": status}},
+                status_code=status
+            )
+        return None
+
+    def _reply_for(messages: list) -> str:
+        system = next((m["content"] for m in messages if m["role"] == "system"), "")
+        user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        if "RISK LEVELS" in system:
+            if "BATCHED INPUT" in system:
+                items = json.loads(user)
+                stats["batched_items"] += len(items)
+                return json.dumps({"results": [dict(_classification(item["message"]), id=item["id"]) for item in items]})
+            return json.dumps(_classification(user))
+        if "progress note" in system.lower():
+            return SUMMARY
+        return REPLY
+
+    def _usage(messages: list, completion: str) -> dict:
+        prompt_tokens = sum(_approx_tokens(m.get("content") or "") for m in messages)
+        completion_tokens = _approx_tokens(completion)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+
+    async def chat_completions(request: Request):
+        stats["requests"] += 1
+        try:
+            body = await request.json()
+        except ClientDisconnect:
+            # The client gave up early (e.g. a hedged request that lost the race)
+            return Response(status_code=499)
+        error = _injected_error()
+        if error is not None:
+            return error
+
+        messages = body.get("messages", [])
+        model = body.get("model", "fake-model")
+        reply = _reply_for(messages)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        await _delay()
+
+        if not body.get("stream"):
+            if config.tokens_per_second:
+                await asyncio.sleep(_approx_tokens(reply) / config.tokens_per_second)
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": reply},
+                    "finish_reason": "stop"
+                }],
+                "usage": _usage(messages, reply)
+            })
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        def chunk(delta: dict, finish_reason=None, usage=None, choices=True) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if choices else [],
+            }
+            if usage is not None:
+                payload["usage"] = usage
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def events():
+            yield chunk({"role": "assistant", "content": ""})
+            for word in _words(reply):
+                if config.tokens_per_second:
+                    await asyncio.sleep(_approx_tokens(word) / config.tokens_per_second)
+                yield chunk({"content": word})
+            yield chunk({}, finish_reason="stop")
+            if include_usage:
+                yield chunk({}, usage=_usage(messages, reply), choices=False)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def embeddings(request: Request):
+        stats["requests"] += 1
+        body = await request.json()
+        error = _injected_error()
+        if error is not None:
+            return error
+        inputs = body.get("input", "")
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        await asyncio.sleep(config.latency_ms / 4000) # embeddings are much faster than chat
+        return JSONResponse({
+            "object": "list",
+            "model": body.get("model", "fake-embedding"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": _embedding(text)}
+                for i, text in enumerate(inputs)
+            ],
+            "usage": {
+                "prompt_tokens": sum(_approx_tokens(t) for t in inputs),
+                "total_tokens": sum(_approx_tokens(t) for t in inputs)
+            }
+        })
+
+    async def models(request: Request):
+        return JSONResponse({"object": "list", "data": [{"id": "fake-model", "object": "model"}]})
+
+    async def fake_stats(request: Request):
+        return JSONResponse(stats)
+
+    app = Starlette(routes=[
+        Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+        Route("/v1/embeddings", embeddings, methods=["POST"]),
+        Route("/v1/models", models),
+        Route("/stats", fake_stats),
+    ])
+    app.state.config = config
+    app.state.stats = stats
+    return app
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency-ms", type=float, default=150.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="share of requests that are slow")
+    parser.add_argument("--tail-ms", type=float, default=0.0, help="extra latency of a slow request")
+
+
+def config_from_args(args: argparse.Namespace) -> FakeProviderConfig:
+    return FakeProviderConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        tail_rate=args.tail_rate,
+        tail_ms=args.tail_ms,
+        seed=getattr(args, "seed", 0)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible LLM provider.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--seed", type=int, default=0)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+"""
+End-to-end load test and latency benchmark.
+
+    # In-process orchestrator against a spawned fake provider, fake Redis and DB
+    python -m benchmarks.load_test --spawn-fake-llm --concurrency 50 --requests 2000
+
+    # Streaming endpoint of a running server (python start.py; --url defaults to
+    # http://127.0.0.1:$PORT, the port start.py listens on)
+    python -m benchmarks.load_test --target http --endpoint stream
+
+Traffic is generated from --seed (see benchmarks/traffic.py) or replayed from
+--replay, so runs are comparable. Reports p50/p95/p99 latency, time to first
+chunk for streams, throughput, errors, per-risk-level results and (for the
+orchestrator target) the per-stage breakdown recorded by StageTimer.
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmarks import fake_llm, traffic
+
+# Set per request so the log_request hook can attribute results to it
+_current_result: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar(
+    "_current_result", default=None
+)
+
+# Limits that would otherwise reject synthetic traffic from a few hundred users.
+# Applied with setdefault, so values from the environment win.
+LOAD_TEST_ENV = {
+    "USER_REQUESTS_PER_MINUTE": "0",
+    "GLOBAL_REQUESTS_PER_MINUTE": "0",
+    "MAX_DAILY_CONVERSATIONS": "0",
+    "USER_TOKEN_BUDGET_PER_DAY": "0",
+    "TOKEN_BUDGET_PER_DAY": "1000000000",
+}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile; 0.0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_fake_llm(args: argparse.Namespace, seed: int) -> Tuple[subprocess.Popen, str]:
+    """
+    Run a fake provider in its own process so it doesn't share our event loop.
+    Returns the process and its base URL.
+    """
+    port = _free_port()
+    proc = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.fake_llm",
+        "--port", str(port),
+        "--latency-ms", str(args.latency_ms),
+        "--jitter-ms", str(args.jitter_ms),
+        "--tokens-per-second", str(args.tokens_per_second),
+        "--error-rate", str(args.error_rate),
+        "--tail-rate", str(args.tail_rate),
+        "--tail-ms", str(args.tail_ms),
+        "--seed", str(seed),
+    ])
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("Fake LLM provider exited during startup")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                break
+        except OSError:
+            time.sleep(0.1)
+    else:
+        proc.terminate()
+        raise RuntimeError("Fake LLM provider did not start")
+    return proc, f"http://127.0.0.1:{port}/v1"
+
+
+async def build_orchestrator(args: argparse.Namespace):
+    """
+    ConversationOrchestrator wired to fake Redis and an in-memory database
+    unless --real-redis / --real-db are given.
+    """
+    for name, value in LOAD_TEST_ENV.items():
+        os.environ.setdefault(name, value)
+
+    # Imported late: settings are read from the environment at import time
+    from src.orchestration.orchestrator import ConversationOrchestrator
+    from src.cost.budget import BudgetLimiter
+    from benchmarks.fake_db import InMemoryDatabaseClient
+
+    orch = ConversationOrchestrator()
+
+    if not args.real_redis:
+        import fakeredis # benchmark-only dependency
+
+        server = fakeredis.FakeServer()
+        orch.cache.redis = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+        store = getattr(orch.semantic_cache.store, "redis", None)
+        if store is not None:
+            orch.semantic_cache.store.redis = fakeredis.aioredis.FakeRedis(server=server)
+        orch.cost_opt.limiter = BudgetLimiter(fakeredis.aioredis.FakeRedis(server=server, decode_responses=True))
+
+    if not args.real_db:
+        orch.db = InMemoryDatabaseClient(latency_ms=args.db_latency_ms)
+        orch.memory_retrieval.db = orch.db
+        orch.memory_worker.db = orch.db
+
+    log_request = orch.monitor.log_request
+
+    def record_request(latency_ms, risk_level, model, stages=None):
+        result = _current_result.get()
+        if result is not None:
+            result["risk_level"] = risk_level
+            result["model"] = model
+            result["stages"] = dict(stages or {})
+        log_request(latency_ms, risk_level, model, stages)
+
+    orch.monitor.log_request = record_request
+    await orch.startup()
+    return orch
+
+
+async def run_orchestrator_request(orch, item: traffic.TrafficItem, endpoint: str) -> Dict[str, Any]:
+    from src.orchestration.orchestrator import TECHNICAL_DIFFICULTIES_RESPONSE
+
+    result: Dict[str, Any] = {"expected_level": item.expected_level}
+    _current_result.set(result)
+    user_id = uuid.UUID(item.user_id)
+    started = time.perf_counter()
+    try:
+        if endpoint == "stream":
+            chunks = []
+            async for delta in orch.process_message_stream(user_id, item.message, item.session_id):
+                if not chunks:
+                    result["first_chunk_ms"] = (time.perf_counter() - started) * 1000
+                chunks.append(delta)
+            response = "".join(chunks)
+        else:
+            response = await orch.process_message(user_id, item.message, item.session_id)
+        result["error"] = response == TECHNICAL_DIFFICULTIES_RESPONSE
+    except Exception as e:
+        result["error"] = True
+        result["exception"] = repr(e)
+    result["latency_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+async def run_http_request(client, item: traffic.TrafficItem, endpoint: str) -> Dict[str, Any]:
+    result: Dict[str, Any] = {"expected_level": item.expected_level}
+    body = {"message": item.message, "user_id": item.user_id, "session_id": item.session_id}
+    started = time.perf_counter()
+    try:
+        if endpoint == "stream":
+            async with client.stream("POST", "/chat/stream", json=body) as response:
+                result["error"] = response.status_code != 200
+                async for line in response.aiter_lines():
+                    if line.startswith("data:") and "first_chunk_ms" not in result:
+                        result["first_chunk_ms"] = (time.perf_counter() - started) * 1000
+                    if line.startswith("event: error"):
+                        result["error"] = True
+        else:
+            response = await client.post("/chat", json=body)
+            result["error"] = response.status_code != 200
+    except Exception as e:
+        result["error"] = True
+        result["exception"] = repr(e)
+    result["latency_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+async def drive(items: List[traffic.TrafficItem], concurrency: int, send) -> List[Dict[str, Any]]:
+    """Closed-loop load: `concurrency` workers, each sending its next request when the last completes."""
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in items:
+        queue.put_nowait(item)
+    results: List[Dict[str, Any]] = []
+
+    async def worker():
+        while True:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            # Fresh context per request so results aren't attributed across requests
+            results.append(await asyncio.create_task(send(item), context=contextvars.copy_context()))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+def summarize(results: List[Dict[str, Any]], elapsed_s: float) -> Dict[str, Any]:
+    latencies = [r["latency_ms"] for r in results]
+    first_chunk = [r["first_chunk_ms"] for r in results if "first_chunk_ms" in r]
+    errors = sum(1 for r in results if r.get("error"))
+
+    def latency_stats(values: List[float]) -> Dict[str, float]:
+        return {
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "max": max(values) if values else 0.0,
+        }
+
+    by_level: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for r in results:
+        by_level[r["expected_level"]].append(r)
+    levels = {}
+    for level, rs in sorted(by_level.items()):
+        # UNKNOWN: answered before classification (Layer 1, budget or a failure)
+        classified = [r for r in rs if r.get("risk_level", "UNKNOWN") != "UNKNOWN"]
+        levels[level] = {
+            "requests": len(rs),
+            "errors": sum(1 for r in rs if r.get("error")),
+            "short_circuited": sum(1 for r in rs if r.get("risk_level") == "UNKNOWN"),
+            "latency_ms": latency_stats([r["latency_ms"] for r in rs]),
+            # Only known for the orchestrator target
+            "classified_as_expected": (
+                sum(1 for r in classified if r["risk_level"] == level) / len(classified)
+                if classified else None
+            ),
+        }
+
+    stages: Dict[str, List[float]] = defaultdict(list)
+    for r in results:
+        for name, ms in (r.get("stages") or {}).items():
+            stages[name].append(ms)
+
+    return {
+        "requests": len(results),
+        "errors": errors,
+        "error_rate": errors / len(results) if results else 0.0,
+        "elapsed_s": elapsed_s,
+        "throughput_rps": len(results) / elapsed_s if elapsed_s else 0.0,
+        "latency_ms": latency_stats(latencies),
+        "first_chunk_ms": latency_stats(first_chunk) if first_chunk else None,
+        "levels": levels,
+        "stages_ms": {name: latency_stats(values) for name, values in sorted(stages.items())},
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    def row(name: str, stats: Dict[str, float]) -> str:
+        return f"{name:<24}{stats['p50']:>10.1f}{stats['p95']:>10.1f}{stats['p99']:>10.1f}{stats['max']:>10.1f}"
+
+    header = f"{'':<24}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}"
+    print(f"requests={report['requests']} errors={report['errors']} ({report['error_rate']:.1%}) "
+          f"elapsed={report['elapsed_s']:.2f}s throughput={report['throughput_rps']:.1f} req/s")
+    print()
+    print(header)
+    print(row("latency (ms)", report["latency_ms"]))
+    if report["first_chunk_ms"]:
+        print(row("first chunk (ms)", report["first_chunk_ms"]))
+    for level, stats in report["levels"].items():
+        print(row(f"  {level}", stats["latency_ms"]))
+    if report["stages_ms"]:
+        print()
+        print(f"{'stage (ms)':<24}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+        for name, stats in report["stages_ms"].items():
+            print(row(f"  {name}", stats))
+    if report.get("memory"):
+        print()
+        print("memory updates: " + " ".join(f"{name}={count}" for name, count in report["memory"].items()))
+    if report.get("providers"):
+        print("llm providers: " + " ".join(f"{name}={count}" for name, count in report["providers"].items()))
+    if report.get("http"):
+        print("llm http: " + " ".join(f"{name}={value}" for name, value in report["http"].items()))
+    if report.get("single_flight"):
+        print("single flight: " + " ".join(f"{name}={count}" for name, count in report["single_flight"].items()))
+    print()
+    for level, stats in report["levels"].items():
+        accuracy = stats["classified_as_expected"]
+        accuracy_str = f" classified_as_expected={accuracy:.1%}" if accuracy is not None else ""
+        print(f"{level:<12} requests={stats['requests']} errors={stats['errors']} "
+              f"short_circuited={stats['short_circuited']}{accuracy_str}")
+
+
+async def main_async(args: argparse.Namespace) -> Dict[str, Any]:
+    items = traffic.load(args.replay) if args.replay else traffic.generate(args.requests, args.seed, args.users)
+    if args.save_traffic:
+        traffic.save(items, args.save_traffic)
+
+    if args.target == "http":
+        import httpx
+        from config.settings import get_settings
+
+        url = args.url or f"http://127.0.0.1:{get_settings().PORT}"
+
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+            started = time.perf_counter()
+            results = await drive(items, args.concurrency, lambda item: run_http_request(client, item, args.endpoint))
+            elapsed = time.perf_counter() - started
+        return summarize(results, elapsed)
+
+    orch = await build_orchestrator(args)
+    provider_events: Dict[str, int] = {}
+
+    def count_provider_event(provider: str, event: str, latency: Optional[float]):
+        name = f"{provider}.{event}"
+        provider_events[name] = provider_events.get(name, 0) + 1
+
+    orch.llm.add_provider_listener(count_provider_event)
+    # Connections opened after startup (prewarmed ones are not counted) and peak in-flight requests
+    http_stats: Dict[str, float] = {}
+
+    def count_http_event(provider: str, event: str, value: float):
+        if event == "connect":
+            name = f"{provider}.connections_opened"
+            http_stats[name] = http_stats.get(name, 0) + 1
+        elif event == "in_flight":
+            name = f"{provider}.max_in_flight"
+            http_stats[name] = max(http_stats.get(name, 0), value)
+
+    orch.llm.add_connection_listener(count_http_event)
+    try:
+        if args.warmup:
+            await drive(traffic.generate(args.warmup, args.seed + 1, args.users), args.concurrency,
+                        lambda item: run_orchestrator_request(orch, item, args.endpoint))
+        started = time.perf_counter()
+        results = await drive(items, args.concurrency, lambda item: run_orchestrator_request(orch, item, args.endpoint))
+        elapsed = time.perf_counter() - started
+    finally:
+        # Drains the memory update worker too
+        await orch.shutdown()
+    report = summarize(results, elapsed)
+    counters = orch.monitor.get_counters()
+    report["memory"] = {
+        name: counters.get(f"memory_{name}", 0)
+        for name in ("turns_submitted", "turns_dropped", "summaries", "writes", "update_failed")
+    }
+    report["providers"] = dict(sorted(provider_events.items()))
+    report["http"] = {name: int(value) for name, value in sorted(http_stats.items())}
+    report["single_flight"] = {
+        f"{name}.{role}": count
+        for name, flight in (("classify", orch.classification_flight), ("generate", orch.cache.single_flight))
+        for role, count in flight.counts.items() if count
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load test.")
+    parser.add_argument("--target", choices=["orchestrator", "http"], default="orchestrator")
+    parser.add_argument("--endpoint", choices=["chat", "stream"], default="chat")
+    parser.add_argument("--url", help="server for --target http (default: http://127.0.0.1:<settings.PORT>)")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=0, help="requests sent before measuring")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--replay", help="traffic JSONL file to replay instead of generating")
+    parser.add_argument("--save-traffic", help="write the generated traffic to this JSONL file")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--json-out", help="write the report as JSON")
+    parser.add_argument("--real-redis", action="store_true", help="use REDIS_URL instead of fakeredis")
+    parser.add_argument("--real-db", action="store_true", help="use DATABASE_URL instead of the in-memory DB")
+    parser.add_argument("--db-latency-ms", type=float, default=1.0)
+    parser.add_argument("--spawn-fake-llm", action="store_true", help="start benchmarks.fake_llm and point OPENAI_BASE_URL at it")
+    parser.add_argument(
+        "--fake-fallback", action="store_true",
+        help="with --spawn-fake-llm, start a second fake provider as the Groq fallback (exercises hedging/failover)"
+    )
+    parser.add_argument("--log-level", default="WARNING")
+    fake_llm.add_arguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level)
+
+    providers = []
+    if args.spawn_fake_llm:
+        proc, base_url = spawn_fake_llm(args, args.seed)
+        providers.append(proc)
+        os.environ["OPENAI_BASE_URL"] = base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+        if args.fake_fallback:
+            proc, base_url = spawn_fake_llm(args, args.seed + 1)
+            providers.append(proc)
+            os.environ["GROQ_BASE_URL"] = base_url
+            os.environ["GROQ_API_KEY"] = "gsk-fake"
+            os.environ["LLM_PROVIDER_ORDER"] = "openai,groq"
+        else:
+            # Never fail over to a real provider from a load test
+            os.environ["LLM_PROVIDER_ORDER"] = "openai"
+    try:
+        report = asyncio.run(main_async(args))
+    finally:
+        for proc in providers:
+            proc.terminate()
+            proc.wait()
+
+    print_report(report)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
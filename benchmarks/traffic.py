@@ -0,0 +1,108 @@
+"""
+Replayable traffic mix of LOW/MEDIUM/HIGH/CRISIS messages.
+
+    python -m benchmarks.traffic --requests 1000 --seed 1 --out traffic.jsonl
+"""
+import argparse
+import json
+import random
+import uuid
+from typing import Dict, Iterable, List, NamedTuple
+
+# Default share of each risk level in generated traffic
+DEFAULT_MIX = {"LOW_RISK": 0.70, "MEDIUM_RISK": 0.20, "HIGH_RISK": 0.07, "CRISIS": 0.03}
+
+# Phrases the fake LLM provider uses to classify a message (see fake_llm.py).
+# LOW_RISK is the default when none match.
+LEVEL_MARKERS = {
+    "CRISIS": ["he hit me", "not safe at home"],
+    "HIGH_RISK": ["panic attack", "can't stop shaking"],
+    "MEDIUM_RISK": ["furious", "should i break up"],
+}
+
+TEMPLATES = {
+    "LOW_RISK": [
+        "How do I talk to my partner about {topic}?",
+        "What's a good way to bring up {topic} without starting a fight?",
+        "My partner and I keep misunderstanding each other about {topic}. Any ideas?",
+        "How can we spend more quality time together when {topic} gets in the way?",
+    ],
+    "MEDIUM_RISK": [
+        "I'm furious that my partner keeps ignoring me about {topic}.",
+        "Should I break up with them over {topic}?",
+    ],
+    "HIGH_RISK": [
+        "Every time we argue about {topic} I have a panic attack.",
+        "I can't stop shaking after our fight about {topic}.",
+    ],
+    "CRISIS": [
+        # Caught by the LLM classifier
+        "He hit me last night after we argued about {topic}.",
+        "I'm not safe at home since the argument about {topic}.",
+        # Caught by Layer 1 keywords before any LLM call
+        "I want to die, the fight about {topic} was too much.",
+    ],
+}
+
+TOPICS = ["money", "chores", "in-laws", "screen time", "intimacy", "career moves", "holidays", "friends"]
+
+
+class TrafficItem(NamedTuple):
+    user_id: str
+    session_id: str
+    message: str
+    expected_level: str
+
+
+def generate(requests: int, seed: int = 1, users: int = 200, mix: Dict[str, float] = None) -> List[TrafficItem]:
+    """Deterministic for a given seed, so runs can be compared."""
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    levels, weights = zip(*mix.items())
+    user_ids = [str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(users)]
+    sessions = {u: str(uuid.UUID(int=rng.getrandbits(128), version=4)) for u in user_ids}
+
+    items = []
+    for _ in range(requests):
+        level = rng.choices(levels, weights)[0]
+        user_id = rng.choice(user_ids)
+        message = rng.choice(TEMPLATES[level]).format(topic=rng.choice(TOPICS))
+        items.append(TrafficItem(user_id, sessions[user_id], message, level))
+    return items
+
+
+def save(items: Iterable[TrafficItem], path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        for item in items:
+            f.write(json.dumps(item._asdict()) + "\n")
+
+
+def load(path: str) -> List[TrafficItem]:
+    with open(path, encoding="utf-8") as f:
+        return [TrafficItem(**json.loads(line)) for line in f if line.strip()]
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """'LOW_RISK=0.7,MEDIUM_RISK=0.2,...' -> dict"""
+    mix = {}
+    for part in value.split(","):
+        level, weight = part.split("=")
+        if level not in TEMPLATES:
+            raise argparse.ArgumentTypeError(f"unknown risk level: {level}")
+        mix[level] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a replayable traffic file.")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mix", type=parse_mix, default=None)
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+    save(generate(args.requests, args.seed, args.users, args.mix), args.out)
+
+
+if __name__ == "__main__":
+    main()
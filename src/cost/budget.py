@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+import redis.asyncio as redis # type: ignore
+
+from config.settings import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# The user LLM usage is charged to. Set by the orchestrator per request; tasks
+# spawned from the request (e.g. memory updates) inherit it.
+usage_owner: ContextVar[Optional[str]] = ContextVar("usage_owner", default=None)
+
+RATE_WINDOW_MS = 60_000
+DAY_KEY_TTL_SECONDS = 2 * 24 * 3600
+
+# Admission for one request (after the global token budget check). Sliding
+# one-minute windows (sorted sets) per user and globally, distinct conversations
+# (sessions) per user per day, per-user daily tokens. Nothing is recorded unless
+# every check passes.
+# KEYS: user_window, global_window, user_sessions, user_tokens
+# ARGV: now_ms, window_ms, user_rpm, global_rpm, session_id, max_sessions,
+#       user_token_limit, member, day_ttl
+ADMIT_SCRIPT = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local user_rpm = tonumber(ARGV[3])
+local global_rpm = tonumber(ARGV[4])
+local max_sessions = tonumber(ARGV[6])
+local user_token_limit = tonumber(ARGV[7])
+local day_ttl = tonumber(ARGV[9])
+
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+if user_rpm > 0 and redis.call('ZCARD', KEYS[1]) >= user_rpm then return 'user_rate' end
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now - window)
+if global_rpm > 0 and redis.call('ZCARD', KEYS[2]) >= global_rpm then return 'global_rate' end
+if max_sessions > 0 and redis.call('SISMEMBER', KEYS[3], ARGV[5]) == 0
+   and redis.call('SCARD', KEYS[3]) >= max_sessions then return 'daily_conversations' end
+if user_token_limit > 0 and tonumber(redis.call('GET', KEYS[4]) or '0') >= user_token_limit then
+    return 'user_tokens'
+end
+
+redis.call('ZADD', KEYS[1], now, ARGV[8])
+redis.call('PEXPIRE', KEYS[1], window)
+redis.call('ZADD', KEYS[2], now, ARGV[8])
+redis.call('PEXPIRE', KEYS[2], window)
+redis.call('SADD', KEYS[3], ARGV[5])
+redis.call('EXPIRE', KEYS[3], day_ttl)
+return 'ok'
+"""
+
+# Reserve up to ARGV[2] tokens of the global daily budget for this worker.
+# KEYS: global_tokens. ARGV: limit, wanted, day_ttl.
+# Returns {tokens granted, tokens reserved by all workers today}.
+LEASE_SCRIPT = """
+local used = tonumber(redis.call('GET', KEYS[1]) or '0')
+local grant = math.min(tonumber(ARGV[2]), tonumber(ARGV[1]) - used)
+if grant <= 0 then return {0, used} end
+redis.call('INCRBY', KEYS[1], grant)
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[3]))
+return {grant, used + grant}
+"""
+
+# Add per-user token usage in one round trip. KEYS: user_tokens...
+# ARGV: day_ttl, amount per key...
+CHARGE_SCRIPT = """
+for i, key in ipairs(KEYS) do
+    redis.call('INCRBY', key, tonumber(ARGV[i + 1]))
+    redis.call('EXPIRE', key, tonumber(ARGV[1]))
+end
+return #KEYS
+"""
+
+
+def _day() -> str:
+    return datetime.now(timezone.utc).strftime("%Y%m%d")
+
+
+class BudgetLimiter:
+    """
+    Distributed per-user and global rate limits and token budgets.
+
+    - Admission is one atomic Lua call per request.
+    - The global daily token budget is consumed through a local lease: each
+      worker reserves TOKEN_LEASE_SIZE tokens at a time, so charging usage
+      rarely touches Redis.
+    - Per-user token usage is accumulated locally and flushed in batches.
+    Counters are keyed by UTC day, which gives the daily rollover.
+    Redis errors fail open (logged), like the response cache.
+    """
+
+    def __init__(self, redis_client=None):
+        self.redis = redis_client or redis.from_url(settings.REDIS_URL, decode_responses=True)
+        self._admit = self.redis.register_script(ADMIT_SCRIPT)
+        self._lease = self.redis.register_script(LEASE_SCRIPT)
+        self._charge = self.redis.register_script(CHARGE_SCRIPT)
+
+        self._lease_day = _day()
+        self._lease_remaining = 0
+        self._lease_debt = 0 # usage beyond the current lease, settled on the next lease
+        self._lease_lock = asyncio.Lock()
+        self._global_exhausted_day: Optional[str] = None
+        self._global_reserved = 0 # across all workers, as of this worker's last lease
+
+        self._pending_user_tokens: Dict[Tuple[str, str], int] = {}
+        self._last_flush = time.monotonic()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def admit(self, user_id: str, session_id: str) -> Tuple[bool, str]:
+        """
+        Returns (allowed, reason). Reasons: ok, user_rate, global_rate,
+        daily_conversations, user_tokens, global_tokens.
+        """
+        day = _day()
+        try:
+            # The global budget goes first (it is usually answered from the local
+            # lease), so a request it rejects never takes a rate-limit slot
+            if not await self._has_global_budget():
+                return False, "global_tokens"
+            reason = await self._admit(
+                keys=[
+                    f"rl:user:{user_id}:req",
+                    "rl:global:req",
+                    f"budget:{day}:user:{user_id}:sessions",
+                    f"budget:{day}:user:{user_id}:tokens"
+                ],
+                args=[
+                    int(time.time() * 1000),
+                    RATE_WINDOW_MS,
+                    settings.USER_REQUESTS_PER_MINUTE,
+                    settings.GLOBAL_REQUESTS_PER_MINUTE,
+                    session_id,
+                    settings.MAX_DAILY_CONVERSATIONS,
+                    settings.USER_TOKEN_BUDGET_PER_DAY,
+                    uuid.uuid4().hex,
+                    DAY_KEY_TTL_SECONDS
+                ]
+            )
+            return reason == "ok", reason
+        except Exception as e:
+            logger.warning(f"Budget check failed, allowing request: {e}")
+            return True, "ok"
+
+    async def _has_global_budget(self) -> bool:
+        day = _day()
+        if day != self._lease_day:
+            # Daily rollover: the old lease belongs to yesterday's budget
+            self._lease_day, self._lease_remaining, self._lease_debt = day, 0, 0
+            self._global_reserved = 0
+        if self._lease_remaining > 0:
+            return True
+        if self._global_exhausted_day == day:
+            return False
+        await self._refill_lease()
+        return self._lease_remaining > 0
+
+    async def _refill_lease(self):
+        async with self._lease_lock:
+            if self._lease_remaining > 0:
+                return
+            wanted = settings.TOKEN_LEASE_SIZE + self._lease_debt
+            granted, reserved = await self._lease(
+                keys=[f"budget:{self._lease_day}:global:tokens"],
+                args=[settings.TOKEN_BUDGET_PER_DAY, wanted, DAY_KEY_TTL_SECONDS]
+            )
+            granted, self._global_reserved = int(granted), int(reserved)
+            if granted <= 0:
+                logger.warning("Daily token budget exceeded!")
+                self._global_exhausted_day = self._lease_day
+                return
+            self._lease_remaining = granted - self._lease_debt
+            self._lease_debt = max(0, -self._lease_remaining)
+            self._lease_remaining = max(0, self._lease_remaining)
+
+    def remaining_fraction(self) -> float:
+        """
+        Share of today's global token budget not yet used, as seen by this
+        worker: Redis' count at the last lease, minus what this worker has
+        used of its lease since. Other workers' usage shows up at the next lease.
+        """
+        if settings.TOKEN_BUDGET_PER_DAY <= 0:
+            return 1.0
+        if self._lease_day != _day():
+            return 1.0
+        unused = settings.TOKEN_BUDGET_PER_DAY - self._global_reserved + self._lease_remaining - self._lease_debt
+        return min(1.0, max(0.0, unused / settings.TOKEN_BUDGET_PER_DAY))
+
+    def charge(self, user_id: Optional[str], tokens: int):
+        """Record actual token usage. Local only; Redis is updated in batches."""
+        if tokens <= 0:
+            return
+        if tokens <= self._lease_remaining:
+            self._lease_remaining -= tokens
+        else:
+            self._lease_debt += tokens - self._lease_remaining
+            self._lease_remaining = 0
+
+        if user_id:
+            key = (_day(), user_id)
+            self._pending_user_tokens[key] = self._pending_user_tokens.get(key, 0) + tokens
+        if time.monotonic() - self._last_flush >= settings.USAGE_FLUSH_SECONDS:
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flush_task is not None and not self._flush_task.done():
+            return
+        try:
+            self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+        except RuntimeError:
+            pass # No running loop; the next charge inside one will flush
+
+    async def flush(self):
+        """Push accumulated per-user usage to Redis in one round trip."""
+        self._last_flush = time.monotonic()
+        pending, self._pending_user_tokens = self._pending_user_tokens, {}
+        if not pending:
+            return
+        keys = [f"budget:{day}:user:{user_id}:tokens" for day, user_id in pending]
+        try:
+            await self._charge(keys=keys, args=[DAY_KEY_TTL_SECONDS, *pending.values()])
+        except Exception as e:
+            logger.warning(f"Failed to record token usage: {e}")
+            # Keep it for the next flush
+            for key, tokens in pending.items():
+                self._pending_user_tokens[key] = self._pending_user_tokens.get(key, 0) + tokens
+
+    async def close(self):
+        await self.flush()
+        await self.redis.close()
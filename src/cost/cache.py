@@ -1,36 +1,234 @@
+import asyncio
+import hashlib
 import json
 import logging
-from typing import Optional
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
 import redis.asyncio as redis # type: ignore
 
+from src.cost.single_flight import SingleFlight
+from src.monitoring.client import MonitoringClient
 from config.settings import get_settings
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
+RESPONSE_TTL_SECONDS = 3600
+INVALIDATION_CHANNEL = "resp:invalidate"
+INVALIDATION_RETRY_SECONDS = 5
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_message(message: str) -> str:
+    """Case- and whitespace-insensitive form of a message, used for cache keys."""
+    return _WHITESPACE.sub(" ", message).strip().lower()
+
+def make_cache_key(message: str, context: str = "") -> str:
+    """
+    Stable digest of (message, context). Unlike hash(), this is identical across
+    workers and restarts (hash() is salted per process by PYTHONHASHSEED).
+    """
+    payload = f"{normalize_message(message)}\x00{context}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+class LocalLRUCache:
+    """
+    Bounded in-process LRU with per-entry TTL.
+    Evicts least recently used entries beyond `max_entries` or `max_bytes`.
+    Values are strings unless `size` is given to `set`.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict() # key -> (value, expires_at, size)
+        self.size_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at, _ = entry
+        if time.monotonic() >= expires_at:
+            self.delete(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None, size: Optional[int] = None):
+        self.delete(key)
+        size = len(key) + (len(value.encode("utf-8")) if size is None else size)
+        if size > self.max_bytes:
+            return
+        ttl = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_seconds)
+        self._entries[key] = (value, time.monotonic() + ttl, size)
+        self.size_bytes += size
+        while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self.size_bytes -= evicted_size
+
+    def delete(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size_bytes -= entry[2]
+
+    def clear(self):
+        self._entries.clear()
+        self.size_bytes = 0
+
+
 class ResponseCache:
-    def __init__(self):
+    """
+    Two-tier response cache: a per-worker LocalLRUCache (L1) in front of Redis (L2).
+
+    - Lookups that hit L1 skip the Redis round-trip.
+    - `single_flight` lets one request regenerate a missing entry while
+      concurrent requests for the same key await its result.
+    - `invalidate` drops entries everywhere; other workers evict their L1
+      copy via Redis pub/sub. Entries cached for a user are indexed under
+      that user, so `invalidate_user` can drop them all when the user's
+      memory changes.
+    """
+
+    def __init__(self, monitor: Optional[MonitoringClient] = None):
         self.redis = redis.from_url(settings.REDIS_URL, decode_responses=True)
+        self.local = LocalLRUCache(
+            max_entries=settings.CACHE_L1_MAX_ENTRIES,
+            max_bytes=settings.CACHE_L1_MAX_BYTES,
+            ttl_seconds=settings.CACHE_L1_TTL_SECONDS
+        )
+        self.single_flight = SingleFlight(
+            (lambda: self.redis) if settings.SINGLE_FLIGHT_DISTRIBUTED else None, namespace="sf:resp"
+        )
+        self.monitor = monitor or MonitoringClient()
+        self._counts = {"lookups": 0, "l1_hits": 0, "l2_hits": 0}
+        self._listener_task: Optional[asyncio.Task] = None
 
     async def get_cached_response(self, prompt_hash: str) -> Optional[str]:
+        self._ensure_listener()
+        self._counts["lookups"] += 1
+
+        cached = self.local.get(prompt_hash)
+        if cached is not None:
+            self._record_tier("l1")
+            return cached
+
         try:
-            return await self.redis.get(f"resp:{prompt_hash}")
+            cached = await self.redis.get(f"resp:{prompt_hash}")
         except Exception:
             # Fail open if cache is down
-            return None
+            cached = None
+
+        if cached is not None:
+            self.local.set(prompt_hash, cached)
+            self._record_tier("l2")
+        else:
+            self._record_tier("miss")
+        return cached
 
-    async def cache_response(self, prompt_hash: str, response: str, risk_level: str):
+    async def cache_response(self, prompt_hash: str, response: str, risk_level: str, user_id: Optional[str] = None):
         """
         Cache rules:
         - LOW_RISK: Cache for 1 hour (common general advice)
         - MEDIUM/HIGH/CRISIS: DO NOT CACHE (Unique context matters)
+        `user_id` is the user whose memory context the response was generated with.
         """
         if risk_level == "LOW_RISK":
+            self.local.set(prompt_hash, response, ttl_seconds=RESPONSE_TTL_SECONDS)
             try:
-                # 1 hour TTL
-                await self.redis.setex(f"resp:{prompt_hash}", 3600, response)
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    # 1 hour TTL
+                    pipe.set(f"resp:{prompt_hash}", response, ex=RESPONSE_TTL_SECONDS)
+                    if user_id is not None:
+                        pipe.sadd(f"resp:user:{user_id}", prompt_hash)
+                        pipe.expire(f"resp:user:{user_id}", RESPONSE_TTL_SECONDS)
+                    await pipe.execute()
             except Exception as e:
                 logger.warning(f"Failed to cache response: {e}")
 
+    async def invalidate(self, prompt_hashes: Iterable[str]):
+        """Remove entries from Redis and from every worker's L1."""
+        prompt_hashes = list(prompt_hashes)
+        if not prompt_hashes:
+            return
+        for prompt_hash in prompt_hashes:
+            self.local.delete(prompt_hash)
+        try:
+            await self.redis.delete(*(f"resp:{h}" for h in prompt_hashes))
+            await self.redis.publish(INVALIDATION_CHANNEL, " ".join(prompt_hashes))
+        except Exception as e:
+            logger.warning(f"Failed to invalidate cached responses: {e}")
+
+    async def invalidate_user(self, user_id: str):
+        """Remove every entry cached with this user's (now outdated) memory context."""
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.smembers(f"resp:user:{user_id}")
+                pipe.delete(f"resp:user:{user_id}")
+                prompt_hashes, _ = await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to invalidate cached responses for {user_id}: {e}")
+            return
+        await self.invalidate(prompt_hashes)
+
+    def _record_tier(self, tier: str):
+        if tier != "miss":
+            self._counts[f"{tier}_hits"] += 1
+        self.monitor.increment(f"response_cache_{tier}")
+
+        lookups = self._counts["lookups"]
+        l2_lookups = lookups - self._counts["l1_hits"]
+        self.monitor.set_gauge("response_cache_l1_hit_ratio", self._counts["l1_hits"] / lookups)
+        if l2_lookups:
+            self.monitor.set_gauge("response_cache_l2_hit_ratio", self._counts["l2_hits"] / l2_lookups)
+
+    def tier_stats(self) -> Dict[str, Any]:
+        lookups = self._counts["lookups"]
+        l2_lookups = lookups - self._counts["l1_hits"]
+        return {
+            **self._counts,
+            "l1_hit_ratio": self._counts["l1_hits"] / lookups if lookups else 0.0,
+            "l2_hit_ratio": self._counts["l2_hits"] / l2_lookups if l2_lookups else 0.0,
+            "l1_entries": len(self.local),
+            "l1_bytes": self.local.size_bytes,
+            "in_flight": len(self.single_flight)
+        }
+
+    def _ensure_listener(self):
+        """Start the invalidation subscriber on first use (needs a running loop)."""
+        if self._listener_task is None or self._listener_task.done():
+            self._listener_task = asyncio.create_task(self._listen_for_invalidations())
+
+    async def _listen_for_invalidations(self):
+        while True:
+            try:
+                pubsub = self.redis.pubsub()
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                try:
+                    async for message in pubsub.listen():
+                        if message.get("type") == "message":
+                            for prompt_hash in message["data"].split():
+                                self.local.delete(prompt_hash)
+                finally:
+                    await pubsub.close()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # L1 entries are still bounded by their TTL while we reconnect
+                logger.warning(f"Cache invalidation listener error: {e}")
+                await asyncio.sleep(INVALIDATION_RETRY_SECONDS)
+
     async def close(self):
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except (asyncio.CancelledError, Exception):
+                pass
         await self.redis.close()
@@ -1,30 +1,51 @@
 import logging
-import tiktoken
+from typing import Any, Dict, List, Optional, Tuple
+from src.cost import tokens
+from src.cost.budget import BudgetLimiter, usage_owner
 from config.settings import get_settings
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
 class CostOptimizer:
-    def __init__(self):
-        self.enc = tiktoken.get_encoding("cl100k_base")
-        # In memory tracker for demo purposes. In production, use Redis.
-        self._daily_usage = 0 
+    def __init__(self, limiter: Optional[BudgetLimiter] = None):
+        # Encodings are loaded lazily and shared process-wide (see src/cost/tokens.py)
+        # Shared across workers via Redis (see src/cost/budget.py)
+        self.limiter = limiter or BudgetLimiter()
 
-    def estimate_tokens(self, text: str) -> int:
-        return len(self.enc.encode(text))
+    def estimate_tokens(self, text: str, model: Optional[str] = None, exact: bool = True) -> int:
+        if exact:
+            return tokens.count_tokens(text, model)
+        return tokens.approx_tokens(text, model)
 
-    def check_budget(self, user_id: str) -> bool:
+    def estimate_prompt_tokens(self, messages: List[Dict[str, str]], model: Optional[str] = None, exact: bool = True) -> int:
+        if exact:
+            return tokens.count_message_tokens(messages, model)
+        return tokens.approx_message_tokens(messages, model)
+
+    async def check_budget(self, user_id: str, session_id: str = "") -> bool:
         """
-        Check if system-wide or user-specific budget is exceeded.
+        Check if system-wide or user-specific budget or rate limits are exceeded.
         """
-        if self._daily_usage > settings.TOKEN_BUDGET_PER_DAY:
-            logger.warning("Daily token budget exceeded!")
-            # In a real app, we might switch to cheapest model ONLY or stop.
-            # For this counseling app, we might degrade to 'unavailable' if strict budget.
-            return False
-        return True
-
-    def track_usage(self, input_tokens: int, output_tokens: int):
+        allowed, reason = await self.limiter.admit(user_id, session_id)
+        if not allowed:
+            logger.warning(f"Request refused by budget/rate limit: user={user_id} reason={reason}")
+        return allowed
+
+    def budget_remaining(self) -> float:
+        """Share of the global daily token budget left (see BudgetLimiter.remaining_fraction)."""
+        return self.limiter.remaining_fraction()
+
+    def track_usage(self, input_tokens: int, output_tokens: int, user_id: Optional[str] = None):
         total = input_tokens + output_tokens
-        self._daily_usage += total
+        self.limiter.charge(user_id or usage_owner.get(), total)
+
+    def record_llm_usage(self, model: str, usage: Dict[str, Any]):
+        """
+        LLMClient usage listener: charges the `usage` block of a completion
+        to the user of the current request.
+        """
+        self.track_usage(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+
+    async def close(self):
+        await self.limiter.close()
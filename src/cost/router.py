@@ -1,6 +1,21 @@
+import logging
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
 from config.settings import get_settings
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+NORMAL, DEGRADED, CRITICAL = "normal", "degraded", "critical"
+MODES = (NORMAL, DEGRADED, CRITICAL)
+
+MAX_SAMPLES_PER_MODEL = 1000
+
+# Called with (old mode, new mode, reason)
+ModeListener = Callable[[str, str, str], None]
+
 
 class ModelRouter:
     @staticmethod
@@ -22,3 +37,126 @@ class ModelRouter:
     def get_classification_model() -> str:
         """Always use the cheaper model for classification tasks."""
         return settings.MODEL_MEDIUM_RISK
+
+
+class LoadAwareRouter:
+    """
+    ModelRouter plus degradation modes driven by live signals.
+
+    Signals: p95 latency and error rate of each model's generations in the
+    last ROUTER_WINDOW_SECONDS (errors include calls shed by the LLM
+    scheduler), and the share of the daily token budget left.
+
+    - normal: the static ModelRouter mapping.
+    - degraded: MEDIUM_RISK moves to MODEL_DEGRADED_MEDIUM_RISK (a no-op while
+      that is the same model as MODEL_MEDIUM_RISK, the default), non-crisis
+      generations get ROUTER_DEGRADED_MAX_TOKENS, and LOW_RISK semantic cache
+      hits are accepted at ROUTER_DEGRADED_CACHE_THRESHOLD.
+    - critical: additionally, messages the local classifier defers are not
+      sent to the LLM classifier (see LocalRiskClassifier.classify_degraded).
+
+    CRISIS is never downgraded: same model, same max_tokens in every mode.
+    A worse mode is entered as soon as a signal crosses its threshold; a
+    better one only after ROUTER_MIN_MODE_SECONDS in the current mode.
+    """
+
+    def __init__(self, budget_remaining: Optional[Callable[[], float]] = None):
+        self.budget_remaining = budget_remaining
+        self.mode = NORMAL
+        self.reason = ""
+        self.listeners: List[ModeListener] = []
+        self._generations: Dict[str, Deque[Tuple[float, float, bool]]] = {} # (time, seconds, ok)
+        self._changed_at = time.monotonic()
+        self._evaluated_at = 0.0
+
+    def add_listener(self, listener: ModeListener):
+        self.listeners.append(listener)
+
+    def observe_generation(self, model: str, seconds: float, ok: bool):
+        window = self._generations.get(model)
+        if window is None:
+            window = self._generations[model] = deque(maxlen=MAX_SAMPLES_PER_MODEL)
+        window.append((time.monotonic(), seconds, ok))
+
+    def _signals(self) -> List[Tuple[str, str]]:
+        """(mode, reason) for every signal past a degraded or critical threshold."""
+        signals = []
+        cutoff = time.monotonic() - settings.ROUTER_WINDOW_SECONDS
+        for model, window in self._generations.items():
+            while window and window[0][0] < cutoff:
+                window.popleft()
+            if len(window) < settings.ROUTER_MIN_SAMPLES:
+                continue
+            error_rate = sum(1 for _, _, ok in window if not ok) / len(window)
+            latencies = sorted(seconds for _, seconds, ok in window if ok)
+            p95_ms = latencies[int(0.95 * (len(latencies) - 1))] * 1000 if latencies else 0.0
+            for mode, max_p95, max_errors in (
+                (CRITICAL, settings.ROUTER_CRITICAL_P95_MS, settings.ROUTER_CRITICAL_ERROR_RATE),
+                (DEGRADED, settings.ROUTER_DEGRADED_P95_MS, settings.ROUTER_DEGRADED_ERROR_RATE),
+            ):
+                if p95_ms > max_p95:
+                    signals.append((mode, f"{model} p95 {p95_ms:.0f}ms"))
+                    break
+                if error_rate > max_errors:
+                    signals.append((mode, f"{model} error rate {error_rate:.0%}"))
+                    break
+        if self.budget_remaining is not None:
+            remaining = self.budget_remaining()
+            if remaining < settings.ROUTER_CRITICAL_BUDGET_REMAINING:
+                signals.append((CRITICAL, f"budget {remaining:.0%} left"))
+            elif remaining < settings.ROUTER_DEGRADED_BUDGET_REMAINING:
+                signals.append((DEGRADED, f"budget {remaining:.0%} left"))
+        return signals
+
+    def refresh(self) -> str:
+        """Re-evaluate the mode (at most once per ROUTER_EVAL_SECONDS) and return it."""
+        now = time.monotonic()
+        if not settings.ROUTER_ENABLED or now - self._evaluated_at < settings.ROUTER_EVAL_SECONDS:
+            return self.mode
+        self._evaluated_at = now
+
+        target, reason = NORMAL, "signals recovered"
+        for mode, signal in self._signals():
+            if MODES.index(mode) > MODES.index(target):
+                target, reason = mode, signal
+        current = MODES.index(self.mode)
+        if MODES.index(target) > current or (
+            MODES.index(target) < current and now - self._changed_at >= settings.ROUTER_MIN_MODE_SECONDS
+        ):
+            self._set_mode(target, reason, now)
+        return self.mode
+
+    def _set_mode(self, mode: str, reason: str, now: float):
+        old, self.mode, self.reason, self._changed_at = self.mode, mode, reason, now
+        logger.warning(f"Routing mode {old} -> {mode} ({reason})")
+        for listener in self.listeners:
+            try:
+                listener(old, mode, reason)
+            except Exception as e:
+                logger.warning(f"Routing mode listener failed: {e}")
+
+    @property
+    def degraded(self) -> bool:
+        return self.mode != NORMAL
+
+    def get_model_for_risk_level(self, risk_level: str) -> str:
+        model = ModelRouter.get_model_for_risk_level(risk_level)
+        if risk_level == "MEDIUM_RISK" and self.degraded and settings.MODEL_DEGRADED_MEDIUM_RISK != model:
+            return settings.MODEL_DEGRADED_MEDIUM_RISK
+        return model
+
+    def is_downgrade(self, risk_level: str, model: str) -> bool:
+        """True if `model` is not what normal routing would use for `risk_level`."""
+        return model != ModelRouter.get_model_for_risk_level(risk_level)
+
+    def max_tokens(self, risk_level: str, default: int) -> int:
+        if risk_level == "CRISIS" or not self.degraded:
+            return default
+        return min(default, settings.ROUTER_DEGRADED_MAX_TOKENS)
+
+    def cache_threshold(self) -> Optional[float]:
+        """Semantic cache similarity to accept for LOW_RISK; None = the cache's own setting."""
+        return settings.ROUTER_DEGRADED_CACHE_THRESHOLD if self.degraded else None
+
+    def skip_llm_classification(self) -> bool:
+        return self.mode == CRITICAL
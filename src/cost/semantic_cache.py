@@ -0,0 +1,423 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import redis.asyncio as redis # type: ignore
+
+from src.cost.cache import RESPONSE_TTL_SECONDS, ResponseCache, make_cache_key, normalize_message
+from src.llm.client import LLMClient
+from config.settings import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Bound on how many context partitions keep an in-process index
+MAX_PARTITIONS = 1024
+
+# A vector is only useful while the response it points to is cached
+VECTOR_TTL_SECONDS = RESPONSE_TTL_SECONDS
+
+# (key, vector, added_at) with added_at in wall-clock seconds, shared across workers
+StoredVector = Tuple[str, np.ndarray, float]
+
+
+class CacheLookup(NamedTuple):
+    response: Optional[str]
+    key: str                          # exact (stable digest) cache key
+    partition: str                    # digest of the memory context
+    embedding: Optional[List[float]]  # reused when the response gets stored
+    tier: str                         # "exact" | "semantic" | "miss"
+    user_id: Optional[str] = None     # whose memory context; their entries are dropped when it changes
+
+
+def _unit(vector: Sequence[float]) -> np.ndarray:
+    vec = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm > 0 else vec
+
+
+class VectorIndex:
+    """
+    Brute-force cosine-similarity index (one matrix-vector product per query).
+    Vectors are unit-normalized on insert; the oldest entry is evicted once
+    `max_entries` is reached, and `expire` drops entries added before a cutoff.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._matrix: Optional[np.ndarray] = None
+        self._row_keys: List[str] = []
+        self._rows: "OrderedDict[str, int]" = OrderedDict() # key -> row, in insertion order
+        self._added: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._row_keys)
+
+    def add(self, key: str, vector: Sequence[float], added_at: Optional[float] = None):
+        vec = _unit(vector)
+        if self._matrix is not None and self._matrix.shape[1] != vec.shape[0]:
+            # Embedding model changed; old vectors are not comparable
+            self.clear()
+
+        self._added[key] = time.time() if added_at is None else added_at
+        if key in self._rows:
+            self._matrix[self._rows[key]] = vec
+            return
+
+        if len(self) >= self.max_entries:
+            self.remove(next(iter(self._rows)))
+
+        if self._matrix is None:
+            self._matrix = np.empty((min(64, self.max_entries), vec.shape[0]), dtype=np.float32)
+        elif len(self) == self._matrix.shape[0]:
+            capacity = min(self._matrix.shape[0] * 2, self.max_entries)
+            grown = np.empty((capacity, vec.shape[0]), dtype=np.float32)
+            grown[:len(self)] = self._matrix[:len(self)]
+            self._matrix = grown
+
+        row = len(self)
+        self._matrix[row] = vec
+        self._row_keys.append(key)
+        self._rows[key] = row
+
+    def remove(self, key: str):
+        row = self._rows.pop(key, None)
+        self._added.pop(key, None)
+        if row is None:
+            return
+        last = len(self._row_keys) - 1
+        if row != last:
+            # Move the last row into the hole
+            moved_key = self._row_keys[last]
+            self._matrix[row] = self._matrix[last]
+            self._row_keys[row] = moved_key
+            self._rows[moved_key] = row
+        self._row_keys.pop()
+
+    def clear(self):
+        self._matrix = None
+        self._row_keys = []
+        self._rows = OrderedDict()
+        self._added = {}
+
+    def expire(self, cutoff: float):
+        """Drop entries added before `cutoff` (wall-clock seconds)."""
+        for key in [k for k, added_at in self._added.items() if added_at < cutoff]:
+            self.remove(key)
+
+    def search(self, vector: Sequence[float]) -> Optional[Tuple[str, float]]:
+        """Nearest entry and its cosine similarity, or None if empty."""
+        if not self._row_keys:
+            return None
+        vec = _unit(vector)
+        if vec.shape[0] != self._matrix.shape[1]:
+            return None
+        scores = self._matrix[:len(self)] @ vec
+        best = int(np.argmax(scores))
+        return self._row_keys[best], float(scores[best])
+
+
+class RedisVectorStore:
+    """
+    Persists vectors in one Redis hash per partition (field = cache key), with
+    a sorted set of insertion times beside it.
+
+    Vectors expire with the responses they point to (VECTOR_TTL_SECONDS), each
+    partition keeps at most SEMANTIC_CACHE_MAX_ENTRIES, and `load(since=...)`
+    fetches only entries added since the last refresh.
+    """
+
+    # KEYS: vectors hash, times zset. ARGV: key, vector, now ms, ttl ms, max entries
+    ADD_SCRIPT = """
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+    redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+    local stale = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', '(' .. (tonumber(ARGV[3]) - tonumber(ARGV[4])))
+    local excess = redis.call('ZCARD', KEYS[2]) - #stale - tonumber(ARGV[5])
+    if excess > 0 then
+        for _, key in ipairs(redis.call('ZRANGE', KEYS[2], #stale, #stale + excess - 1)) do
+            table.insert(stale, key)
+        end
+    end
+    for _, key in ipairs(stale) do
+        redis.call('HDEL', KEYS[1], key)
+        redis.call('ZREM', KEYS[2], key)
+    end
+    redis.call('PEXPIRE', KEYS[1], ARGV[4])
+    redis.call('PEXPIRE', KEYS[2], ARGV[4])
+    return #stale
+    """
+
+    def __init__(self):
+        # Raw bytes: vectors are stored as float32 buffers
+        self.redis = redis.from_url(settings.REDIS_URL)
+
+    def _hash_key(self, partition: str) -> str:
+        return f"semcache:vec:{partition}"
+
+    def _times_key(self, partition: str) -> str:
+        return f"semcache:vec_t:{partition}"
+
+    async def load(self, partition: str, since: float = 0.0) -> List[StoredVector]:
+        cutoff = max(since, time.time() - VECTOR_TTL_SECONDS)
+        members = await self.redis.zrangebyscore(self._times_key(partition), int(cutoff * 1000), "+inf", withscores=True)
+        if not members:
+            return []
+        vectors = await self.redis.hmget(self._hash_key(partition), [key for key, _ in members])
+        return [
+            (key.decode(), np.frombuffer(vector, dtype=np.float32), score / 1000)
+            for (key, score), vector in zip(members, vectors) if vector is not None
+        ]
+
+    async def add(self, partition: str, key: str, vector: Sequence[float]):
+        await self.redis.eval(
+            self.ADD_SCRIPT, 2, self._hash_key(partition), self._times_key(partition),
+            key, np.asarray(vector, dtype=np.float32).tobytes(), int(time.time() * 1000),
+            VECTOR_TTL_SECONDS * 1000, settings.SEMANTIC_CACHE_MAX_ENTRIES
+        )
+
+    async def remove(self, partition: str, key: str):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hdel(self._hash_key(partition), key)
+            pipe.zrem(self._times_key(partition), key)
+            await pipe.execute()
+
+    async def close(self):
+        await self.redis.close()
+
+
+class FileVectorStore:
+    """
+    Persists vectors as one .npz file per partition under `path`, with the same
+    expiry and per-partition cap as RedisVectorStore.
+    Writes are batched and flushed every `flush_every` changes and on close.
+    """
+
+    def __init__(self, path: str, flush_every: int = 100):
+        self.path = path
+        self.flush_every = flush_every
+        self._partitions: Dict[str, "OrderedDict[str, Tuple[np.ndarray, float]]"] = {}
+        self._dirty: Dict[str, int] = {}
+
+    def _file(self, partition: str) -> str:
+        return os.path.join(self.path, f"{partition}.npz")
+
+    def _read(self, partition: str) -> "OrderedDict[str, Tuple[np.ndarray, float]]":
+        if partition not in self._partitions:
+            entries: "OrderedDict[str, Tuple[np.ndarray, float]]" = OrderedDict()
+            if os.path.exists(self._file(partition)):
+                with np.load(self._file(partition)) as data:
+                    keys, vectors = data["keys"].tolist(), data["vectors"]
+                    # Files written before vectors had timestamps count as fresh
+                    added = data["added"] if "added" in data.files else np.full(len(keys), time.time())
+                    for key, vector, added_at in sorted(zip(keys, vectors, added), key=lambda e: e[2]):
+                        entries[key] = (vector, float(added_at))
+            self._partitions[partition] = entries
+        entries = self._partitions[partition]
+        cutoff = time.time() - VECTOR_TTL_SECONDS
+        while entries and next(iter(entries.values()))[1] < cutoff:
+            entries.popitem(last=False)
+        return entries
+
+    def _mark_dirty(self, partition: str):
+        self._dirty[partition] = self._dirty.get(partition, 0) + 1
+        if self._dirty[partition] >= self.flush_every:
+            self._write(partition)
+
+    def _write(self, partition: str):
+        entries = self._read(partition)
+        os.makedirs(self.path, exist_ok=True)
+        keys = np.array(list(entries.keys()))
+        vectors = np.stack([v for v, _ in entries.values()]) if entries else np.empty((0, 0), dtype=np.float32)
+        added = np.array([t for _, t in entries.values()], dtype=np.float64)
+        np.savez(self._file(partition), keys=keys, vectors=vectors, added=added)
+        self._dirty.pop(partition, None)
+
+    async def load(self, partition: str, since: float = 0.0) -> List[StoredVector]:
+        return [(key, vector, added_at) for key, (vector, added_at) in self._read(partition).items() if added_at >= since]
+
+    async def add(self, partition: str, key: str, vector: Sequence[float]):
+        entries = self._read(partition)
+        entries.pop(key, None)
+        entries[key] = (np.asarray(vector, dtype=np.float32), time.time())
+        while len(entries) > settings.SEMANTIC_CACHE_MAX_ENTRIES:
+            entries.popitem(last=False)
+        self._mark_dirty(partition)
+
+    async def remove(self, partition: str, key: str):
+        if self._read(partition).pop(key, None) is not None:
+            self._mark_dirty(partition)
+
+    async def close(self):
+        for partition in list(self._dirty):
+            self._write(partition)
+
+
+@dataclass
+class _PartitionIndex:
+    index: VectorIndex
+    refreshed_at: float = 0.0 # monotonic
+    cursor: float = 0.0 # newest added_at loaded from the store
+
+
+class SemanticResponseCache:
+    """
+    Response cache tier in front of ResponseCache.
+
+    1. Exact: stable digest of normalized message + context.
+    2. Semantic (LOW_RISK only, the only level that is cached): nearest
+       neighbour over embeddings of previously cached messages.
+
+    Vectors are partitioned by a digest of the memory context, so an answer
+    generated with one user's context is never served for a different context.
+    """
+
+    def __init__(self, response_cache: ResponseCache, llm: LLMClient, store=None):
+        self.response_cache = response_cache
+        self.llm = llm
+        self.enabled = settings.SEMANTIC_CACHE_ENABLED
+        if self.enabled and not llm.supports_embeddings:
+            # e.g. Groq only: decided once here rather than failing every lookup
+            logger.warning("Semantic cache disabled: no configured LLM provider supports embeddings")
+            self.enabled = False
+        self.threshold = settings.SEMANTIC_CACHE_THRESHOLD
+        if store is None and self.enabled:
+            if settings.SEMANTIC_CACHE_BACKEND == "file":
+                store = FileVectorStore(settings.SEMANTIC_CACHE_PATH)
+            else:
+                store = RedisVectorStore()
+        self.store = store
+
+        self._indexes: "OrderedDict[str, _PartitionIndex]" = OrderedDict()
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self._counts = {"exact": 0, "semantic": 0, "miss": 0}
+        self._lookup_ms: deque = deque(maxlen=1000)
+
+    @staticmethod
+    def partition_for(context: str) -> str:
+        return hashlib.sha256(context.encode("utf-8")).hexdigest()[:16]
+
+    async def _get_index(self, partition: str) -> VectorIndex:
+        entry = self._indexes.get(partition)
+        if entry is None:
+            # First use in this worker: one load, bounded by the store's cap
+            entry = _PartitionIndex(VectorIndex(settings.SEMANTIC_CACHE_MAX_ENTRIES))
+            await self._refresh(partition, entry)
+            self._indexes[partition] = entry
+            while len(self._indexes) > MAX_PARTITIONS:
+                self._indexes.popitem(last=False)
+        elif (time.monotonic() - entry.refreshed_at >= settings.SEMANTIC_CACHE_REFRESH_SECONDS
+              and partition not in self._refreshing):
+            # Vectors added by other workers, fetched off the request path
+            task = asyncio.create_task(self._refresh_in_background(partition, entry))
+            self._refreshing[partition] = task
+            task.add_done_callback(lambda t: self._refreshing.pop(partition, None))
+        self._indexes.move_to_end(partition)
+        return entry.index
+
+    async def _refresh(self, partition: str, entry: _PartitionIndex):
+        """Add entries stored since the last refresh, and expire old ones locally."""
+        entry.refreshed_at = time.monotonic()
+        for key, vector, added_at in await self.store.load(partition, since=entry.cursor):
+            entry.index.add(key, vector, added_at)
+            entry.cursor = max(entry.cursor, added_at)
+        entry.index.expire(time.time() - VECTOR_TTL_SECONDS)
+
+    async def _refresh_in_background(self, partition: str, entry: _PartitionIndex):
+        try:
+            await self._refresh(partition, entry)
+        except Exception as e:
+            logger.warning(f"Semantic cache refresh failed: {e}")
+
+    def _result(self, tier: str, response: Optional[str], key: str, partition: str, embedding,
+                user_id: Optional[str]) -> CacheLookup:
+        self._counts[tier] += 1
+        return CacheLookup(response, key, partition, embedding, tier, user_id)
+
+    async def lookup(
+        self, message: str, context: str, threshold: Optional[float] = None, user_id: Optional[str] = None
+    ) -> CacheLookup:
+        """
+        `threshold` overrides SEMANTIC_CACHE_THRESHOLD (degraded routing accepts
+        looser matches). `user_id` is the user `context` belongs to.
+        """
+        key = make_cache_key(message, context)
+        partition = self.partition_for(context)
+
+        cached = await self.response_cache.get_cached_response(key)
+        if cached:
+            return self._result("exact", cached, key, partition, None, user_id)
+        if not self.enabled:
+            return self._result("miss", None, key, partition, None, user_id)
+
+        started = time.perf_counter()
+        try:
+            embedding = await self.llm.embed(normalize_message(message))
+            index = await self._get_index(partition)
+            nearest = index.search(embedding)
+        except Exception as e:
+            # Fail open: semantic lookup is an optimization
+            logger.warning(f"Semantic cache lookup failed: {e}")
+            return self._result("miss", None, key, partition, None, user_id)
+        finally:
+            self._lookup_ms.append((time.perf_counter() - started) * 1000)
+
+        if nearest and nearest[1] >= (self.threshold if threshold is None else threshold):
+            neighbour_key, score = nearest
+            response = await self.response_cache.get_cached_response(neighbour_key)
+            if response:
+                logger.info(f"Semantic cache hit (similarity={score:.3f})")
+                # Promote the phrasing to an exact entry for next time
+                await self.response_cache.cache_response(key, response, "LOW_RISK", user_id)
+                return self._result("semantic", response, key, partition, embedding, user_id)
+            # The response expired; drop its vector
+            index.remove(neighbour_key)
+            await self._safe_store_call(self.store.remove(partition, neighbour_key))
+
+        return self._result("miss", None, key, partition, embedding, user_id)
+
+    async def store_response(self, lookup: CacheLookup, response: str, risk_level: str):
+        if risk_level != "LOW_RISK":
+            return
+        await self.response_cache.cache_response(lookup.key, response, risk_level, lookup.user_id)
+        if self.enabled and lookup.embedding is not None:
+            # Loading an evicted partition hits the store too; the answer is already made
+            await self._safe_store_call(self._add_vector(lookup))
+
+    async def _add_vector(self, lookup: CacheLookup):
+        index = await self._get_index(lookup.partition)
+        index.add(lookup.key, lookup.embedding, time.time())
+        await self.store.add(lookup.partition, lookup.key, lookup.embedding)
+
+    async def _safe_store_call(self, awaitable):
+        try:
+            await awaitable
+        except Exception as e:
+            logger.warning(f"Semantic cache store failed: {e}")
+
+    def stats(self) -> Dict[str, float]:
+        total = sum(self._counts.values())
+        hits = self._counts["exact"] + self._counts["semantic"]
+        latencies = sorted(self._lookup_ms)
+        return {
+            "exact_hits": self._counts["exact"],
+            "semantic_hits": self._counts["semantic"],
+            "misses": self._counts["miss"],
+            "hit_rate": hits / total if total else 0.0,
+            "lookup_ms_p50": latencies[len(latencies) // 2] if latencies else 0.0,
+            "lookup_ms_p95": latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+            "indexed_vectors": sum(len(entry.index) for entry in self._indexes.values())
+        }
+
+    async def close(self):
+        for task in list(self._refreshing.values()):
+            task.cancel()
+        if self._refreshing:
+            await asyncio.gather(*self._refreshing.values(), return_exceptions=True)
+        if self.store is not None:
+            await self.store.close()
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from config.settings import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Delete the lock only if we still hold it. KEYS: lock. ARGV: token.
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+
+class SingleFlight:
+    """
+    Per-key duplicate suppression for concurrent work within one event loop.
+
+    The first caller for a key (the leader) runs `factory`; callers arriving
+    while it is in flight await the same result (or exception) instead of
+    repeating the work. The work runs in its own task, so a leader that is
+    cancelled does not cancel it for the followers.
+
+    With `redis` (a callable returning the client) the leader also takes a
+    short Redis lock, so other workers wait for it too: a worker that finds
+    the lock taken polls for the leader's published result, and only does the
+    work itself if none appears before the lock expires. Results must then be
+    JSON-serializable; None is never published. Redis errors fail open.
+    """
+
+    def __init__(self, redis: Optional[Callable[[], Any]] = None, namespace: str = "sf"):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._redis = redis
+        self.namespace = namespace
+        self.counts = {"leader": 0, "follower": 0, "remote_follower": 0, "remote_fallback": 0}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            self.counts["leader"] += 1
+            work = factory() if self._redis is None else self._run_distributed(str(key), factory)
+            task = asyncio.ensure_future(work)
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self.counts["follower"] += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the exception retrieved even if every waiter went away
+            task.exception()
+
+    async def _run_distributed(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        client = self._redis()
+        lock_key, result_key = f"{self.namespace}:lock:{key}", f"{self.namespace}:result:{key}"
+        token = uuid.uuid4().hex
+        try:
+            cached = await client.get(result_key)
+            if cached is not None:
+                self.counts["remote_follower"] += 1
+                return json.loads(cached)
+            acquired = await client.set(lock_key, token, nx=True, px=int(settings.SINGLE_FLIGHT_LOCK_MS))
+        except Exception as e:
+            logger.warning(f"Single-flight lock unavailable, running locally: {e}")
+            return await factory()
+
+        if not acquired:
+            result = await self._await_remote(client, lock_key, result_key)
+            if result is not None:
+                self.counts["remote_follower"] += 1
+                return result
+            # The leader failed, was blocked, or is too slow: do the work ourselves
+            self.counts["remote_fallback"] += 1
+            return await factory()
+
+        try:
+            result = await factory()
+            if result is not None:
+                # Published before the lock is released, so waiting workers find it
+                try:
+                    await client.set(result_key, json.dumps(result), px=int(settings.SINGLE_FLIGHT_RESULT_TTL_MS))
+                except Exception as e:
+                    logger.warning(f"Failed to publish single-flight result: {e}")
+            return result
+        finally:
+            try:
+                await client.eval(RELEASE_SCRIPT, 1, lock_key, token)
+            except Exception as e:
+                logger.warning(f"Failed to release single-flight lock: {e}")
+
+    async def _await_remote(self, client: Any, lock_key: str, result_key: str) -> Any:
+        """The result another worker publishes, or None once its lock is gone or expires."""
+        deadline = time.monotonic() + settings.SINGLE_FLIGHT_LOCK_MS / 1000
+        poll = settings.SINGLE_FLIGHT_POLL_MS / 1000
+        try:
+            while time.monotonic() < deadline:
+                await asyncio.sleep(poll)
+                cached = await client.get(result_key)
+                if cached is not None:
+                    return json.loads(cached)
+                if not await client.exists(lock_key):
+                    return None
+        except Exception as e:
+            logger.warning(f"Single-flight poll failed: {e}")
+        return None
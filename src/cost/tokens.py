@@ -0,0 +1,112 @@
+import math
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+import tiktoken
+
+DEFAULT_ENCODING = "cl100k_base"
+
+# Model prefix -> encoding. Checked in order, so longer prefixes come first.
+MODEL_ENCODINGS = [
+    ("gpt-4o", "o200k_base"),
+    ("o1", "o200k_base"),
+    ("o3", "o200k_base"),
+    ("gpt-4", "cl100k_base"),
+    ("gpt-3.5", "cl100k_base"),
+    ("text-embedding-3", "cl100k_base"),
+]
+
+# Chat format overhead (OpenAI cookbook): per message, and for priming the reply
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_NAME = 1
+REPLY_PRIMING_TOKENS = 3
+
+# Strings longer than this are counted without memoization
+MAX_MEMOIZED_LENGTH = 16_384
+
+# Average characters per token for approx_tokens(); see calibrate()
+_chars_per_token: Dict[str, float] = {"cl100k_base": 4.0, "o200k_base": 4.2}
+
+
+def encoding_name_for_model(model: Optional[str]) -> str:
+    """Encoding used by `model`. Non-OpenAI models (e.g. Groq Llama) fall back to cl100k."""
+    if model:
+        for prefix, name in MODEL_ENCODINGS:
+            if model.startswith(prefix):
+                return name
+    return DEFAULT_ENCODING
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name: str = DEFAULT_ENCODING) -> "tiktoken.Encoding":
+    """Process-wide encoder cache. Loaded on first use, not at import."""
+    return tiktoken.get_encoding(name)
+
+
+def get_encoding_for_model(model: Optional[str]) -> "tiktoken.Encoding":
+    return get_encoding(encoding_name_for_model(model))
+
+
+@lru_cache(maxsize=4096)
+def _count_memoized(text: str, encoding_name: str) -> int:
+    return len(get_encoding(encoding_name).encode(text, disallowed_special=()))
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    Exact token count. Repeated strings (system prompt, templates) are memoized.
+    """
+    if not text:
+        return 0
+    name = encoding_name_for_model(model)
+    if len(text) > MAX_MEMOIZED_LENGTH:
+        return len(get_encoding(name).encode(text, disallowed_special=()))
+    return _count_memoized(text, name)
+
+
+def approx_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    Cheap estimate for budget pre-checks: character length over a calibrated
+    characters-per-token ratio. No encoding is loaded.
+    """
+    if not text:
+        return 0
+    ratio = _chars_per_token.get(encoding_name_for_model(model), 4.0)
+    return math.ceil(len(text) / ratio)
+
+
+def calibrate(samples: Iterable[str], model: Optional[str] = None) -> float:
+    """
+    Fit approx_tokens() for `model`'s encoding to representative text.
+    Returns the new characters-per-token ratio.
+    """
+    name = encoding_name_for_model(model)
+    chars = tokens = 0
+    for sample in samples:
+        chars += len(sample)
+        tokens += count_tokens(sample, model)
+    if tokens:
+        _chars_per_token[name] = chars / tokens
+    return _chars_per_token.get(name, 4.0)
+
+
+def count_message_tokens(messages: List[Dict[str, str]], model: Optional[str] = None) -> int:
+    """
+    Prompt tokens for a chat request. Message contents go through the memoized
+    counter, so constant parts are only encoded once per process.
+    """
+    total = REPLY_PRIMING_TOKENS
+    for message in messages:
+        total += TOKENS_PER_MESSAGE
+        for key, value in message.items():
+            total += count_tokens(value, model)
+            if key == "name":
+                total += TOKENS_PER_NAME
+    return total
+
+
+def approx_message_tokens(messages: List[Dict[str, str]], model: Optional[str] = None) -> int:
+    total = REPLY_PRIMING_TOKENS
+    for message in messages:
+        total += TOKENS_PER_MESSAGE + sum(approx_tokens(v, model) for v in message.values())
+    return total
@@ -1,7 +1,7 @@
 import asyncpg
 import json
 import logging
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Callable
 from uuid import UUID
 from datetime import datetime
 
@@ -10,9 +10,78 @@ from config.settings import get_settings
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
+MAX_PROGRESS_NOTES = 10 # matches check_progress_notes in schema.sql
+
+# NOTIFY channel of the user_memory_updated trigger (schema.sql); payload is the user_id
+MEMORY_UPDATED_CHANNEL = "user_memory_updated"
+
+# One round trip per update: create-or-merge the row and write the audit entry.
+# JSONB fields are merged key by key (||); progress notes are appended and only the
+# newest MAX_PROGRESS_NOTES are kept. The audit row references the upserted row,
+# so it can't be written for an update that did not happen. asyncpg prepares the
+# statement once per connection and reuses it.
+# $1 user_id, $2-$4 jsonb, $5 text[] of new notes, $6 audit details
+UPSERT_MEMORY_SQL = f"""
+WITH upserted AS (
+    INSERT INTO user_memory AS m (user_id, relationship_context, recurring_themes, emotional_patterns, progress_notes)
+    VALUES ($1, $2::jsonb, $3::jsonb, $4::jsonb, $5::text[])
+    ON CONFLICT (user_id) DO UPDATE SET
+        relationship_context = COALESCE(m.relationship_context, '{{}}'::jsonb) || EXCLUDED.relationship_context,
+        recurring_themes = COALESCE(m.recurring_themes, '{{}}'::jsonb) || EXCLUDED.recurring_themes,
+        emotional_patterns = COALESCE(m.emotional_patterns, '{{}}'::jsonb) || EXCLUDED.emotional_patterns,
+        progress_notes = (COALESCE(m.progress_notes, '{{}}') || EXCLUDED.progress_notes)[
+            GREATEST(cardinality(COALESCE(m.progress_notes, '{{}}') || EXCLUDED.progress_notes) - {MAX_PROGRESS_NOTES - 1}, 1):
+        ],
+        updated_at = NOW()
+    RETURNING user_id
+)
+INSERT INTO memory_audit_log (user_id, action, details)
+SELECT user_id, 'UPDATE', $6::jsonb FROM upserted
+"""
+
+def _merge_updates(updates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Fold updates per user (later values win per key; notes accumulate), ordered by user_id."""
+    merged: Dict[UUID, Dict[str, Any]] = {}
+    for update in updates:
+        entry = merged.setdefault(update["user_id"], {
+            "user_id": update["user_id"],
+            "relationship_context": {},
+            "recurring_themes": {},
+            "emotional_patterns": {},
+            "progress_notes": []
+        })
+        for field in ("relationship_context", "recurring_themes", "emotional_patterns"):
+            value = update.get(field)
+            if isinstance(value, dict):
+                entry[field].update(value)
+            elif value:
+                raise ValueError(f"Memory field {field} must be a dict, got {type(value).__name__}")
+        if update.get("new_progress_note"):
+            entry["progress_notes"].append(update["new_progress_note"])
+    # Consistent lock order across concurrent batches avoids deadlocks
+    return [merged[user_id] for user_id in sorted(merged, key=str)]
+
+def _upsert_args(entry: Dict[str, Any]) -> tuple:
+    notes = entry["progress_notes"][-MAX_PROGRESS_NOTES:]
+    updated_fields = [
+        field for field in ("relationship_context", "recurring_themes", "emotional_patterns")
+        if entry[field]
+    ] + (["progress_notes"] if notes else [])
+    return (
+        entry["user_id"],
+        json.dumps(entry["relationship_context"]),
+        json.dumps(entry["recurring_themes"]),
+        json.dumps(entry["emotional_patterns"]),
+        notes,
+        json.dumps({"updated_fields": updated_fields})
+    )
+
 class DatabaseClient:
     def __init__(self):
         self.pool: Optional[asyncpg.Pool] = None
+        # Dedicated connection for LISTEN (pooled connections are reset on release)
+        self._listen_conn: Optional[asyncpg.Connection] = None
+        self._memory_listeners: List[Callable[[Optional[UUID]], None]] = []
 
     async def connect(self):
         if not self.pool:
@@ -28,9 +97,52 @@ class DatabaseClient:
                 raise
 
     async def close(self):
+        if self._listen_conn is not None and not self._listen_conn.is_closed():
+            await self._listen_conn.close()
         if self.pool:
             await self.pool.close()
 
+    @property
+    def memory_listener_active(self) -> bool:
+        """True while memory change notifications are being received."""
+        return self._listen_conn is not None and not self._listen_conn.is_closed()
+
+    async def listen_memory_updates(self, callback: Callable[[Optional[UUID]], None]):
+        """
+        Call `callback(user_id)` whenever a user_memory row changes (in any worker),
+        after the change commits. `callback(None)` means the listener connection was
+        lost and changes may have been missed.
+        """
+        if callback not in self._memory_listeners:
+            self._memory_listeners.append(callback)
+        if self.memory_listener_active:
+            return
+        conn = await asyncpg.connect(dsn=settings.DATABASE_URL)
+        await conn.add_listener(MEMORY_UPDATED_CHANNEL, self._on_memory_notification)
+        conn.add_termination_listener(self._on_listener_terminated)
+        self._listen_conn = conn
+        logger.info(f"Listening for {MEMORY_UPDATED_CHANNEL} notifications")
+
+    def _notify_memory_listeners(self, user_id: Optional[UUID]):
+        for listener in self._memory_listeners:
+            try:
+                listener(user_id)
+            except Exception as e:
+                logger.warning(f"Memory update listener failed: {e}")
+
+    def _on_memory_notification(self, conn, pid, channel, payload: str):
+        try:
+            user_id = UUID(payload)
+        except ValueError:
+            logger.warning(f"Ignoring malformed {channel} payload: {payload!r}")
+            return
+        self._notify_memory_listeners(user_id)
+
+    def _on_listener_terminated(self, conn):
+        logger.warning("Memory notification listener disconnected")
+        self._listen_conn = None
+        self._notify_memory_listeners(None)
+
     async def get_user_memory(self, user_id: UUID) -> Optional[Dict[str, Any]]:
         """Retrieve user memory summaries."""
         if not self.pool:
@@ -67,57 +179,31 @@ class DatabaseClient:
         new_progress_note: Optional[str] = None
     ):
         """
-        Update memory fields safely.
+        Merge one update into the user's memory (creating the row if needed) and
+        audit it, in a single statement.
+        """
+        await self.bulk_update_user_memory([{
+            "user_id": user_id,
+            "relationship_context": relationship_context,
+            "recurring_themes": recurring_themes,
+            "emotional_patterns": emotional_patterns,
+            "new_progress_note": new_progress_note
+        }])
+
+    async def bulk_update_user_memory(self, updates: List[Dict[str, Any]]):
+        """
+        Apply many memory updates (dicts with update_user_memory's arguments) in one
+        pipelined executemany. Updates for the same user are merged first, in order.
         """
+        if not updates:
+            return
         if not self.pool:
             await self.connect()
-            
+
+        rows = [_upsert_args(merged) for merged in _merge_updates(updates)]
         async with self.pool.acquire() as conn:
             async with conn.transaction():
-                # 1. Update JSON fields if provided
-                if relationship_context:
-                    await conn.execute(
-                        "UPDATE user_memory SET relationship_context = $2, updated_at = NOW() WHERE user_id = $1",
-                        user_id, json.dumps(relationship_context) # asyncpg handles dict to jsonb auto? usually needs json.dumps or type codec
-                    )
-                
-                if recurring_themes:
-                    await conn.execute(
-                        "UPDATE user_memory SET recurring_themes = $2, updated_at = NOW() WHERE user_id = $1",
-                        user_id, json.dumps(recurring_themes)
-                    )
-                    
-                if emotional_patterns:
-                    await conn.execute(
-                        "UPDATE user_memory SET emotional_patterns = $2, updated_at = NOW() WHERE user_id = $1",
-                        user_id, json.dumps(emotional_patterns)
-                    )
-                
-                # 2. Append progress note (sliding window logic done in DB or App? Doing simple append here)
-                if new_progress_note:
-                    # Enforce max 10 via array slicing in update
-                    await conn.execute(
-                        """
-                        UPDATE user_memory 
-                        SET progress_notes = (progress_notes || $2)[1:10], 
-                            updated_at = NOW() 
-                        WHERE user_id = $1
-                        """,
-                        user_id, new_progress_note
-                    )
-                
-                # 3. Log Audit
-                await conn.execute(
-                    """
-                    INSERT INTO memory_audit_log (user_id, action, details)
-                    VALUES ($1, 'UPDATE', $2)
-                    """,
-                    user_id, json.dumps({"updated_fields": list(filter(None, [
-                        "relationship_context" if relationship_context else None,
-                        "recurring_themes" if recurring_themes else None,
-                        "progress_notes" if new_progress_note else None
-                    ]))})
-                )
+                await conn.executemany(UPSERT_MEMORY_SQL, rows)
 
     async def log_crisis_event(self, user_id: UUID, details: str):
         if not self.pool:
@@ -49,3 +49,20 @@ CREATE TABLE IF NOT EXISTS memory_audit_log (
 -- Index for faster lookups
 CREATE INDEX IF NOT EXISTS idx_memory_audit_user_id ON memory_audit_log(user_id);
 CREATE INDEX IF NOT EXISTS idx_user_memory_updated_at ON user_memory(updated_at);
+
+-- Notify listeners (per-worker memory context caches) when a user's memory changes.
+-- Delivered on commit; the payload is the user_id.
+CREATE OR REPLACE FUNCTION notify_user_memory_updated() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify(
+        'user_memory_updated',
+        (CASE WHEN TG_OP = 'DELETE' THEN OLD.user_id ELSE NEW.user_id END)::text
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS user_memory_updated ON user_memory;
+CREATE TRIGGER user_memory_updated
+    AFTER INSERT OR UPDATE OR DELETE ON user_memory
+    FOR EACH ROW EXECUTE FUNCTION notify_user_memory_updated();
@@ -1,50 +1,127 @@
 import asyncio
+import json
 import logging
-from typing import Optional, Dict, Any, List
-from openai import AsyncOpenAI, APIError, RateLimitError, APITimeoutError
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type, before_sleep_log
+import time
+from typing import Optional, Dict, Any, List, AsyncIterator, Callable, Tuple
+from openai import APIError, RateLimitError, APITimeoutError
 
+from src.llm import prompts
+from src.llm.batching import MicroBatcher
+from src.llm.connections import ConnectionListener, get_connection_manager
+from src.llm.providers import Provider, ProviderListener, ProviderPool, is_retryable
+from src.llm.scheduler import LLMScheduler, SchedulerListener, Slot
+from src.cost.budget import usage_owner
 from config.settings import get_settings
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
+CLASSIFICATION_TIMEOUT = 5.0
+# Output allowance per message in a batched classification call
+BATCH_CLASSIFICATION_TOKENS_PER_ITEM = 200
+PARSE_ERROR_CLASSIFICATION = {
+    "risk_level": "MEDIUM_RISK",
+    "confidence_score": 0.0,
+    "recommended_action": "Fallback due to parse error"
+}
+
 class LLMClient:
-    def __init__(self):
-        if settings.OPENAI_API_KEY:
-            self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-            self.provider = "openai"
-            logger.info("Using OpenAI Provider")
-        elif settings.GROQ_API_KEY:
-            self.client = AsyncOpenAI(
-                api_key=settings.GROQ_API_KEY,
-                base_url="https://api.groq.com/openai/v1"
-            )
-            self.provider = "groq"
-            logger.info("Using Groq Provider")
-        else:
+    def __init__(self, pool: Optional[ProviderPool] = None):
+        # Every provider with an API key, in LLM_PROVIDER_ORDER (see src/llm/providers.py)
+        self.pool = pool or ProviderPool.from_settings()
+        if not self.pool.providers:
             raise ValueError("No valid LLM API Key found (OpenAI or Groq)")
 
-    def _map_model(self, model: str) -> str:
-        """Map OpenAI models to Groq equivalents if needed."""
-        if self.provider == "openai":
-            return model
-        
-        # Groq Mapping
-        # High intellingence -> Llama 3 70B
-        if "gpt-4" in model:
-            return "llama3-70b-8192"
-        # Low/Medium -> Llama 3 8B or Mixtral
-        elif "gpt-3.5" in model or "mini" in model:
-            return "llama3-8b-8192" 
-        return "llama3-70b-8192" # Default fallback
-        
-    @retry(
-        retry=retry_if_exception_type((RateLimitError, APITimeoutError, APIError)),
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=10),
-        before_sleep=before_sleep_log(logger, logging.WARNING)
-    )
+        # Called with (model, usage dict) after every call that reports token usage
+        self.usage_listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+        # Called with (model, error class name) before each retry (failover to the next provider)
+        self.retry_listeners: List[Callable[[str, str], None]] = []
+        # One coalescer per classification prompt
+        self._classify_batchers: Dict[str, MicroBatcher] = {}
+        # Per-model adaptive concurrency limits and priority queue (src/llm/scheduler.py)
+        self.scheduler = LLMScheduler() if settings.LLM_SCHEDULER_ENABLED else None
+
+    def add_usage_listener(self, listener: Callable[[str, Dict[str, Any]], None]):
+        self.usage_listeners.append(listener)
+
+    def add_retry_listener(self, listener: Callable[[str, str], None]):
+        self.retry_listeners.append(listener)
+
+    def add_provider_listener(self, listener: ProviderListener):
+        self.pool.add_listener(listener)
+
+    def add_connection_listener(self, listener: ConnectionListener):
+        get_connection_manager().add_listener(listener)
+
+    def add_scheduler_listener(self, listener: SchedulerListener):
+        if self.scheduler is not None:
+            self.scheduler.add_listener(listener)
+
+    async def prewarm(self):
+        await self.pool.prewarm(settings.LLM_HTTP_PREWARM_CONNECTIONS)
+
+    async def close(self):
+        await self.pool.close()
+
+    def _emit_retry(self, model: str, error: str):
+        for listener in self.retry_listeners:
+            try:
+                listener(model, error)
+            except Exception as e:
+                logger.warning(f"Retry listener failed: {e}")
+
+    async def _acquire_slot(self, model: str, priority: str) -> Optional[Slot]:
+        if self.scheduler is None:
+            return None
+        return await self.scheduler.acquire(model, priority)
+
+    async def _call_pool(self, model: str, kind: str, fn: Callable[[Provider], Any], slot: Optional[Slot], **kwargs) -> Any:
+        """
+        `pool.call` for a generation, feeding its latency and any congestion
+        signal (including errors that were failed over) to the scheduler slot.
+        """
+        def _on_failover(error: BaseException):
+            self._emit_retry(model, type(error).__name__)
+            if slot is not None:
+                slot.record_overload()
+
+        started = time.perf_counter()
+        try:
+            result = await self.pool.call(f"{kind}:{model}", fn, on_failover=_on_failover, **kwargs)
+        except Exception as e:
+            if slot is not None and is_retryable(e):
+                slot.record_overload()
+            raise
+        if slot is not None:
+            slot.record_success(kind, time.perf_counter() - started)
+        return result
+
+    def _emit_usage(self, model: str, usage: Any, owners: Optional[List[Optional[str]]] = None):
+        """
+        Pass a usage block to the listeners. With `owners` (a call made on behalf
+        of several users), it is split evenly and emitted once per owner, with
+        `usage_owner` set so each user is charged their share.
+        """
+        if usage is None:
+            return
+        usage_dict = usage.model_dump() if hasattr(usage, "model_dump") else dict(usage)
+        if not owners:
+            self._notify_usage(model, usage_dict)
+            return
+        for i, owner in enumerate(owners):
+            token = usage_owner.set(owner)
+            try:
+                self._notify_usage(model, _usage_share(usage_dict, i, len(owners)))
+            finally:
+                usage_owner.reset(token)
+
+    def _notify_usage(self, model: str, usage_dict: Dict[str, Any]):
+        for listener in self.usage_listeners:
+            try:
+                listener(model, usage_dict)
+            except Exception as e:
+                logger.warning(f"Usage listener failed: {e}")
+
     async def generate_response(
         self, 
         model: str, 
@@ -52,14 +129,21 @@ class LLMClient:
         temperature: float = 0.7,
         max_tokens: int = 500,
         response_format: Optional[Dict[str, str]] = None,
-        timeout: float = 15.0
+        timeout: float = 15.0,
+        usage_owners: Optional[List[Optional[str]]] = None,
+        priority: str = "MEDIUM_RISK"
     ) -> str:
         """
-        Generate a completion with robust error handling and retries.
+        Generate a completion on the provider pool: hedged past the primary's
+        p95 latency, failing over to the next provider on retryable errors.
+
+        `priority` (a risk level, "CLASSIFICATION" or "BACKGROUND") orders the
+        call in the model's scheduler queue; raises LLMOverloadedError if it
+        cannot start before that priority's queue deadline.
         """
-        target_model = self._map_model(model)
-        try:
-            response = await self.client.chat.completions.create(
+        async def _complete(provider: Provider) -> str:
+            target_model = provider.map_model(model)
+            response = await provider.client.chat.completions.create(
                 model=target_model,
                 messages=messages,
                 temperature=temperature,
@@ -67,7 +151,12 @@ class LLMClient:
                 response_format=response_format,
                 timeout=timeout
             )
+            self._emit_usage(target_model, response.usage, usage_owners)
             return response.choices[0].message.content
+
+        slot = await self._acquire_slot(model, priority)
+        try:
+            return await self._call_pool(model, "complete", _complete, slot)
         except APITimeoutError:
             logger.error(f"LLM Timeout Error (model={model})")
             raise
@@ -80,12 +169,138 @@ class LLMClient:
         except Exception as e:
             logger.error(f"Unexpected LLM Error: {str(e)}")
             raise
+        finally:
+            if slot is not None:
+                slot.release()
+
+    async def stream_response(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 500,
+        timeout: float = 15.0,
+        priority: str = "MEDIUM_RISK"
+    ) -> AsyncIterator[str]:
+        """
+        Stream a completion token-by-token (stream=True).
+        Hedging and failover apply until the first token arrives; after that the
+        stream is not retried, since a retry would duplicate output. The
+        scheduler slot is held until the stream ends.
+        """
+        async def _open(provider: Provider) -> Tuple[Any, AsyncIterator, str, List[str]]:
+            target_model = provider.map_model(model)
+            stream = await provider.client.chat.completions.create(
+                model=target_model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=timeout,
+                stream=True,
+                # Final chunk carries the usage block so streamed calls are charged too
+                stream_options={"include_usage": True}
+            )
+            chunks = stream.__aiter__()
+            try:
+                # Read up to the first token, so a slow provider can still be hedged
+                head = await self._read_until_content(chunks, target_model)
+            except BaseException:
+                await stream.close()
+                raise
+            return stream, chunks, target_model, head
+
+        async def _close(opened: Tuple[Any, AsyncIterator, str, List[str]]):
+            await opened[0].close()
+
+        slot = await self._acquire_slot(model, priority)
+        try:
+            try:
+                stream, chunks, target_model, head = await self._call_pool(model, "stream", _open, slot, discard=_close)
+            except APITimeoutError:
+                logger.error(f"LLM Timeout Error (model={model}, stream)")
+                raise
+            except RateLimitError:
+                logger.error(f"LLM Rate Limit Error (model={model}, stream)")
+                raise
+            except APIError as e:
+                logger.error(f"LLM API Error (stream): {str(e)}")
+                raise
+
+            try:
+                for delta in head:
+                    yield delta
+                async for chunk in chunks:
+                    for delta in self._chunk_content(chunk, target_model):
+                        yield delta
+            finally:
+                # Release the HTTP connection if the consumer stops early (e.g. Layer 2 block)
+                await stream.close()
+        finally:
+            if slot is not None:
+                slot.release()
+
+    def _chunk_content(self, chunk: Any, target_model: str) -> List[str]:
+        if getattr(chunk, "usage", None):
+            self._emit_usage(target_model, chunk.usage)
+        if not chunk.choices:
+            return []
+        delta = chunk.choices[0].delta.content
+        return [delta] if delta else []
+
+    async def _read_until_content(self, chunks: AsyncIterator, target_model: str) -> List[str]:
+        async for chunk in chunks:
+            content = self._chunk_content(chunk, target_model)
+            if content:
+                return content
+        return []
+
+    @property
+    def supports_embeddings(self) -> bool:
+        """True if any configured provider can serve `embed`."""
+        return any(p.supports_embeddings for p in self.pool.providers)
+
+    async def embed(self, text: str, timeout: float = 5.0) -> List[float]:
+        """
+        Embedding vector for `text` (used by the semantic response cache).
+        Check `supports_embeddings` first; without it the pool has no candidate.
+        """
+
+        async def _embed(provider: Provider) -> List[float]:
+            response = await provider.client.embeddings.create(
+                model=settings.EMBEDDING_MODEL,
+                input=text,
+                timeout=timeout
+            )
+            self._emit_usage(settings.EMBEDDING_MODEL, response.usage)
+            return response.data[0].embedding
+
+        # Vectors from different embedding models are not comparable, so no hedging across providers
+        return await self.pool.call(
+            f"embed:{settings.EMBEDDING_MODEL}", _embed,
+            hedge=False,
+            predicate=lambda p: p.supports_embeddings
+        )
 
     async def classify_text(self, text: str, prompt: str) -> Dict[str, Any]:
         """
         Specialized method for JSON classification tasks.
         Uses a cheaper model for classification if appropriate, but orchestrator decides.
+
+        With CLASSIFY_BATCH_ENABLED, calls with the same prompt that arrive within
+        CLASSIFY_BATCH_MAX_WAIT_MS of each other are sent as one request.
         """
+        if not settings.CLASSIFY_BATCH_ENABLED or settings.CLASSIFY_BATCH_MAX_SIZE <= 1:
+            return await self._classify_one(text, prompt)
+        batcher = self._classify_batchers.get(prompt)
+        if batcher is None:
+            batcher = self._classify_batchers[prompt] = MicroBatcher(
+                lambda items: self._classify_batch(items, prompt),
+                settings.CLASSIFY_BATCH_MAX_SIZE,
+                settings.CLASSIFY_BATCH_MAX_WAIT_MS / 1000
+            )
+        return await batcher.submit((text, usage_owner.get()))
+
+    async def _classify_one(self, text: str, prompt: str) -> Dict[str, Any]:
         messages = [
             {"role": "system", "content": prompt},
             {"role": "user", "content": text}
@@ -97,7 +312,8 @@ class LLMClient:
             messages=messages,
             temperature=0.0,
             response_format={"type": "json_object"},
-            timeout=5.0
+            timeout=CLASSIFICATION_TIMEOUT,
+            priority="CLASSIFICATION"
         )
         
         logger.info(f"Classification Raw Output: {json_str}")
@@ -107,10 +323,87 @@ class LLMClient:
         except json.JSONDecodeError:
             logger.error("Failed to decode JSON from classification")
             # Fallback safe response
-            return {
-                "risk_level": "MEDIUM_RISK", 
-                "confidence_score": 0.0,
-                "recommended_action": "Fallback due to parse error"
-            }
-            
-import json
+            return dict(PARSE_ERROR_CLASSIFICATION)
+
+    async def _classify_owned(self, text: str, prompt: str, owner: Optional[str]) -> Dict[str, Any]:
+        token = usage_owner.set(owner)
+        try:
+            return await self._classify_one(text, prompt)
+        finally:
+            usage_owner.reset(token)
+
+    async def _classify_batch(self, items: List[Tuple[str, Optional[str]]], prompt: str) -> List[Dict[str, Any]]:
+        """
+        MicroBatcher handler: classify (text, usage owner) pairs with one call.
+        Items missing from (or malformed in) the batched answer are classified
+        again on their own.
+        """
+        if len(items) == 1:
+            text, owner = items[0]
+            return [await self._classify_owned(text, prompt, owner)]
+
+        payload = json.dumps([{"id": i, "message": text} for i, (text, _) in enumerate(items)], ensure_ascii=False)
+        json_str = await self.generate_response(
+            model=settings.MODEL_MEDIUM_RISK,
+            messages=[
+                {"role": "system", "content": prompts.get_batch_classification_prompt(prompt)},
+                {"role": "user", "content": payload}
+            ],
+            temperature=0.0,
+            max_tokens=BATCH_CLASSIFICATION_TOKENS_PER_ITEM * len(items),
+            response_format={"type": "json_object"},
+            timeout=CLASSIFICATION_TIMEOUT * 2,
+            usage_owners=[owner for _, owner in items],
+            priority="CLASSIFICATION"
+        )
+        logger.info(f"Batched classification of {len(items)} messages")
+
+        by_id = _parse_batch_results(json_str)
+        results: List[Optional[Dict[str, Any]]] = [by_id.get(i) for i in range(len(items))]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            logger.warning(f"Batched classification returned no usable result for {len(missing)}/{len(items)} messages; classifying them individually")
+            retried = await asyncio.gather(
+                *(self._classify_owned(items[i][0], prompt, items[i][1]) for i in missing),
+                return_exceptions=True
+            )
+            for i, result in zip(missing, retried):
+                if isinstance(result, BaseException):
+                    logger.error(f"Individual classification fallback failed: {result}")
+                    result = dict(PARSE_ERROR_CLASSIFICATION)
+                results[i] = result
+        return results
+
+
+def _parse_batch_results(json_str: str) -> Dict[int, Dict[str, Any]]:
+    """Per-id results of a batched classification; unparseable entries are left out."""
+    try:
+        parsed = json.loads(json_str)
+    except (json.JSONDecodeError, TypeError):
+        logger.error("Failed to decode JSON from batched classification")
+        return {}
+    entries = parsed.get("results") if isinstance(parsed, dict) else parsed
+    if not isinstance(entries, list):
+        return {}
+    by_id = {}
+    for entry in entries:
+        if not isinstance(entry, dict) or "risk_level" not in entry:
+            continue
+        try:
+            by_id[int(entry.pop("id"))] = entry
+        except (KeyError, TypeError, ValueError):
+            continue
+    return by_id
+
+
+def _usage_share(usage: Dict[str, Any], index: int, parts: int) -> Dict[str, Any]:
+    """The `index`-th of `parts` near-equal shares of every count in `usage` (shares sum to the total)."""
+    share: Dict[str, Any] = {}
+    for key, value in usage.items():
+        if isinstance(value, dict):
+            share[key] = _usage_share(value, index, parts)
+        elif isinstance(value, int) and not isinstance(value, bool):
+            share[key] = value * (index + 1) // parts - value * index // parts
+        else:
+            share[key] = value
+    return share
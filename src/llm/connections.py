@@ -0,0 +1,177 @@
+import logging
+import time
+from functools import lru_cache
+from typing import Any, AsyncIterator, Callable, Dict, List
+
+import httpx
+
+from config.settings import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Called with (provider name, event, value):
+#   "connect" / "tls" / "pool_wait": seconds spent on that part of connection setup
+#   "in_flight": requests currently holding (or waiting for) a connection
+#   "saturation": in_flight / LLM_HTTP_MAX_CONNECTIONS (above 1, requests queue for a connection)
+ConnectionListener = Callable[[str, str, float], None]
+
+
+def _http2_available() -> bool:
+    try:
+        import h2 # noqa: F401  (optional: pip install httpx[http2])
+    except ImportError:
+        return False
+    return True
+
+
+class _TrackedStream(httpx.AsyncByteStream):
+    """Response body that reports when it is closed (the connection goes back to the pool)."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close: Callable[[], None]):
+        self._stream = stream
+        self._on_close = on_close
+        self._closed = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._closed:
+                self._closed = True
+                self._on_close()
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport that times connection setup from httpcore's trace events
+    (TCP connect, TLS handshake, and the wait for a free pooled connection)
+    and tracks how many requests hold a connection.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        transport: httpx.AsyncBaseTransport,
+        max_connections: int,
+        emit: Callable[[str, str, float], None]
+    ):
+        self.provider = provider
+        self._transport = transport
+        self.max_connections = max_connections
+        self._emit = emit
+        self.in_flight = 0
+
+    def _set_in_flight(self, delta: int):
+        self.in_flight += delta
+        self._emit(self.provider, "in_flight", self.in_flight)
+        self._emit(self.provider, "saturation", self.in_flight / self.max_connections)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        phase_started: Dict[str, float] = {}
+        setup = {"connect": 0.0, "tls": 0.0}
+        sent = False
+        outer_trace = request.extensions.get("trace")
+
+        async def trace(event: str, info: Dict[str, Any]):
+            nonlocal sent
+            now = time.perf_counter()
+            name, _, stage = event.rpartition(".")
+            if stage == "started":
+                phase_started[name] = now
+                if not sent and name.endswith("send_request_headers"):
+                    # Everything before the first byte that wasn't connection setup was pool wait
+                    sent = True
+                    self._emit(self.provider, "pool_wait", max(0.0, now - started - setup["connect"] - setup["tls"]))
+            elif stage == "complete" and name in phase_started:
+                phase = {"connection.connect_tcp": "connect", "connection.start_tls": "tls"}.get(name)
+                if phase is not None:
+                    setup[phase] = now - phase_started[name]
+                    self._emit(self.provider, phase, setup[phase])
+            if outer_trace is not None:
+                await outer_trace(event, info)
+
+        request.extensions["trace"] = trace
+        self._set_in_flight(1)
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            self._set_in_flight(-1)
+            raise
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_TrackedStream(response.stream, lambda: self._set_in_flight(-1)),
+            extensions=response.extensions
+        )
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class ConnectionManager:
+    """
+    Process-wide HTTP clients for the LLM providers: one pooled httpx client per
+    provider, shared by every LLMClient in the process, so keep-alive
+    connections (and their TLS sessions) are reused across requests.
+    """
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._transports: Dict[str, InstrumentedTransport] = {}
+        self.listeners: List[ConnectionListener] = []
+        self.http2 = settings.LLM_HTTP2 and _http2_available()
+        if settings.LLM_HTTP2 and not self.http2:
+            logger.warning("LLM_HTTP2 is set but the h2 package is not installed; using HTTP/1.1")
+
+    def add_listener(self, listener: ConnectionListener):
+        self.listeners.append(listener)
+
+    def _emit(self, provider: str, event: str, value: float):
+        for listener in self.listeners:
+            try:
+                listener(provider, event, value)
+            except Exception as e:
+                logger.warning(f"Connection listener failed: {e}")
+
+    def client(self, provider: str) -> httpx.AsyncClient:
+        client = self._clients.get(provider)
+        if client is None or client.is_closed:
+            limits = httpx.Limits(
+                max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY_SECONDS
+            )
+            transport = InstrumentedTransport(
+                provider,
+                httpx.AsyncHTTPTransport(limits=limits, http2=self.http2),
+                settings.LLM_HTTP_MAX_CONNECTIONS,
+                self._emit
+            )
+            # Per-call timeouts are passed by LLMClient; this only bounds calls that don't set one
+            client = httpx.AsyncClient(transport=transport, timeout=httpx.Timeout(60.0, connect=5.0))
+            self._clients[provider] = client
+            self._transports[provider] = transport
+        return client
+
+    def in_flight(self, provider: str) -> int:
+        transport = self._transports.get(provider)
+        return transport.in_flight if transport else 0
+
+    async def close(self):
+        clients, self._clients, self._transports = self._clients, {}, {}
+        for provider, client in clients.items():
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"Closing HTTP client for {provider} failed: {e}")
+
+
+@lru_cache()
+def get_connection_manager() -> ConnectionManager:
+    return ConnectionManager()
@@ -0,0 +1,51 @@
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from src.llm import prompts
+from src.cost import tokens
+
+# Prompts are laid out for provider-side prefix caching: everything static goes
+# first, as one system message that is byte-identical across requests of the same
+# kind, and all per-request content (memory context, the user's message) comes
+# last. OpenAI caches prefixes from 1024 tokens in 128-token steps; the usage
+# block reports the hit as prompt_tokens_details.cached_tokens.
+
+# Built once at import: SYSTEM_PROMPT followed by the risk level's protocol, so the
+# SYSTEM_PROMPT part is shared by every response prompt.
+RESPONSE_SYSTEM_PROMPTS: Dict[str, str] = {
+    risk_level: f"{prompts.get_system_prompt().rstrip()}\n\n{protocol.strip()}"
+    for risk_level, protocol in prompts.RESPONSE_PROTOCOLS.items()
+}
+# Sent as-is; LLMClient.classify_text puts the message in the user turn
+CLASSIFICATION_SYSTEM_PROMPT = prompts.get_classification_prompt()
+
+
+def response_system_prompt(risk_level: str) -> str:
+    return RESPONSE_SYSTEM_PROMPTS.get(risk_level, RESPONSE_SYSTEM_PROMPTS["LOW_RISK"])
+
+
+def build_response_messages(risk_level: str, user_message: str, context: str = "") -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": response_system_prompt(risk_level)},
+        {"role": "user", "content": prompts.get_response_prompt(risk_level, user_message, context)}
+    ]
+
+
+@lru_cache(maxsize=64)
+def static_prefix_tokens(risk_level: str, model: Optional[str] = None) -> int:
+    """
+    Tokens of a response prompt's static system message (with its chat framing).
+    Counted once per (risk level, model).
+    """
+    return tokens.TOKENS_PER_MESSAGE + tokens.count_tokens(response_system_prompt(risk_level), model)
+
+
+def prompt_tokens(messages: List[Dict[str, str]], risk_level: str, model: Optional[str] = None) -> int:
+    """
+    Prompt size of messages from build_response_messages: the precomputed static
+    prefix plus an exact count of the variable turns only.
+    """
+    total = tokens.REPLY_PRIMING_TOKENS + static_prefix_tokens(risk_level, model)
+    for message in messages[1:]:
+        total += tokens.TOKENS_PER_MESSAGE + tokens.count_tokens(message["content"], model)
+    return total
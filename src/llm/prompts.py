@@ -35,21 +35,32 @@ RISK LEVELS:
 -   **LOW_RISK**: General relationship questions, dating advice, communication issues, healthy venting.
 
 OUTPUT FORMAT (JSON ONLY):
-{{
+{
     "risk_level": "CRISIS" | "HIGH_RISK" | "MEDIUM_RISK" | "LOW_RISK",
     "confidence_score": 0.0 to 1.0,
     "topic_categorization": "string",
     "crisis_indicators": ["list", "of", "indicators"],
     "recommended_action": "brief description"
-}}
+}
 
-USER MESSAGE:
-{user_message}
+The user's message is sent as the next message.
+"""
+
+# Appended to a classification prompt when several users' messages are
+# classified in one call (LLMClient.classify_text micro-batching)
+BATCH_CLASSIFICATION_INSTRUCTIONS = """
+BATCHED INPUT:
+This time the next message is a JSON array of independent messages from different users, each {"id": <number>, "message": "<text>"}.
+Classify every message on its own, as if it were the only one; never let one message influence another's risk level.
+Respond with a single JSON object: {"results": [<one object per id, in the OUTPUT FORMAT above, plus its "id">]}
 """
 
 # ============================================================================
 # RESPONSE GENERATION PROMPTS
 # ============================================================================
+# Static per risk level: they are appended to the system prompt so the whole
+# system message is an identical prefix across requests (see prompt_assembly.py).
+# The variable context and user message go in the user turn.
 
 # 1. CRISIS PROTOCOL
 CRISIS_RESPONSE_PROMPT = """The user is in a CRISIS situation.
@@ -61,8 +72,6 @@ RULES:
 -   Do NOT provide relationship advice.
 -   Use a serious, compassionate, but firm tone.
 -   Provide the standard resource block: "If you are in immediate danger or need urgent help, please contact: 988 (Suicide & Crisis Lifeline) or text HOME to 741741."
-
-User Input: {user_message}
 """
 
 # 2. HIGH_RISK PROTOCOL
@@ -75,9 +84,6 @@ RULES:
 -   Avoid any language that could be interpreted as a diagnosis.
 -   Remind them you are an AI support tool, not a therapist.
 -   End with a soft bridge to professional help: "Given how heavy this feels, have you considered sharing this with a therapist?"
-
-Context: {context_summary}
-User Input: {user_message}
 """
 
 # 3. MEDIUM_RISK PROTOCOL
@@ -90,9 +96,6 @@ RULES:
 -   Avoid taking sides in arguments.
 -   If they ask for specific advice ("Should I break up?"), deflect: "That's a big decision. What are your main fears about staying vs. leaving?"
 -   Monitor for escalation.
-
-Context: {context_summary}
-User Input: {user_message}
 """
 
 # 4. LOW_RISK PROTOCOL (Standard)
@@ -104,23 +107,32 @@ RULES:
 -   Reflect back their feelings to show active listening.
 -   Offer general communication frameworks (e.g., "I" statements) if appropriate.
 -   Keep the conversation constructive and forward-looking.
-
-Context: {context_summary}
-User Input: {user_message}
 """
 
+RESPONSE_PROTOCOLS = {
+    "CRISIS": CRISIS_RESPONSE_PROMPT,
+    "HIGH_RISK": HIGH_RISK_RESPONSE_PROMPT,
+    "MEDIUM_RISK": MEDIUM_RISK_RESPONSE_PROMPT,
+    "LOW_RISK": LOW_RISK_RESPONSE_PROMPT,
+}
+
 def get_system_prompt() -> str:
     return SYSTEM_PROMPT
 
-def get_classification_prompt(user_message: str) -> str:
-    return SAFETY_CLASSIFICATION_PROMPT.format(user_message=user_message)
+def get_classification_prompt() -> str:
+    """Static system prompt for classification; the message is sent as the user turn."""
+    return SAFETY_CLASSIFICATION_PROMPT
+
+def get_batch_classification_prompt(prompt: str) -> str:
+    """`prompt` extended to classify a JSON array of messages in one call."""
+    return f"{prompt.rstrip()}\n{BATCH_CLASSIFICATION_INSTRUCTIONS}"
+
+def get_response_protocol(risk_level: str) -> str:
+    return RESPONSE_PROTOCOLS.get(risk_level, LOW_RISK_RESPONSE_PROMPT)
 
 def get_response_prompt(risk_level: str, user_message: str, context_summary: str = "") -> str:
+    """The variable user turn for a response."""
     if risk_level == "CRISIS":
-        return CRISIS_RESPONSE_PROMPT.format(user_message=user_message)
-    elif risk_level == "HIGH_RISK":
-        return HIGH_RISK_RESPONSE_PROMPT.format(user_message=user_message, context_summary=context_summary)
-    elif risk_level == "MEDIUM_RISK":
-        return MEDIUM_RISK_RESPONSE_PROMPT.format(user_message=user_message, context_summary=context_summary)
-    else: # LOW_RISK
-        return LOW_RISK_RESPONSE_PROMPT.format(user_message=user_message, context_summary=context_summary)
+        # The crisis protocol deliberately ignores memory context
+        return f"User Input: {user_message}"
+    return f"Context: {context_summary}\nUser Input: {user_message}"
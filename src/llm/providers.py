@@ -0,0 +1,387 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError, RateLimitError
+
+from config.settings import get_settings
+from src.llm.connections import get_connection_manager
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+LATENCY_WINDOW = 200 # recent latencies kept per (provider, call kind) for the p95
+MIN_LATENCY_SAMPLES = 20 # before this many, the hedge delay is derived from the EWMA
+PREWARM_TIMEOUT = 5.0
+
+# Called with (provider name, event, latency in seconds for "success")
+ProviderListener = Callable[[str, str, Optional[float]], None]
+
+
+class ProviderUnavailableError(Exception):
+    """No configured provider can serve the call."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Errors that say something about the provider's health (and are worth a failover)."""
+    if isinstance(error, (APIConnectionError, RateLimitError, asyncio.TimeoutError)): # includes APITimeoutError
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code >= 500
+    return False
+
+
+@dataclass(frozen=True)
+class ProviderSpec:
+    name: str
+    api_key: Optional[str]
+    base_url: Optional[str]
+    model_map: Dict[str, str] = field(default_factory=dict) # empty = model names are used as-is
+    default_model: Optional[str] = None # for models missing from model_map
+    supports_embeddings: bool = False
+
+
+def provider_specs() -> Dict[str, ProviderSpec]:
+    return {
+        "openai": ProviderSpec(
+            "openai", settings.OPENAI_API_KEY, settings.OPENAI_BASE_URL,
+            supports_embeddings=True
+        ),
+        "groq": ProviderSpec(
+            "groq", settings.GROQ_API_KEY, settings.GROQ_BASE_URL,
+            model_map=dict(settings.GROQ_MODEL_MAP),
+            default_model=settings.GROQ_DEFAULT_MODEL
+        ),
+    }
+
+
+class LatencyTracker:
+    """EWMA of a call's latency plus a sliding window for its p95."""
+
+    def __init__(self, alpha: float, window: int = LATENCY_WINDOW):
+        self.alpha = alpha
+        self.ewma: Optional[float] = None
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._p95: Optional[float] = None
+
+    def observe(self, seconds: float):
+        self.ewma = seconds if self.ewma is None else self.alpha * seconds + (1 - self.alpha) * self.ewma
+        self._samples.append(seconds)
+        self._p95 = None
+
+    def p95(self) -> Optional[float]:
+        if len(self._samples) < MIN_LATENCY_SAMPLES:
+            return None
+        if self._p95 is None:
+            ordered = sorted(self._samples)
+            self._p95 = ordered[int(0.95 * (len(ordered) - 1))]
+        return self._p95
+
+
+class CircuitBreaker:
+    """
+    Error-rate circuit breaker.
+
+    Opens when at least `error_rate` of the last `window` calls failed (once
+    `min_calls` have been seen), stays open for `cooldown` seconds, then lets a
+    single trial call through (half-open): success closes it, failure reopens it.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, window: int, error_rate: float, min_calls: int, cooldown: float):
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self._outcomes: Deque[bool] = deque(maxlen=window) # True = failure
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def available(self) -> bool:
+        if self.state == self.OPEN and time.monotonic() >= self._opened_at + self.cooldown:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN:
+            return not self._probe_in_flight
+        return self.state == self.CLOSED
+
+    def acquire(self):
+        """A call is starting (the trial call when half-open)."""
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = True
+
+    def release(self):
+        """A call ended without telling us anything about the provider's health."""
+        self._probe_in_flight = False
+
+    def record_success(self) -> bool:
+        """Returns True if this closed the circuit."""
+        self._probe_in_flight = False
+        if self.state == self.OPEN:
+            return False # a call from before the circuit opened; only the trial call decides
+        if self.state == self.HALF_OPEN:
+            self.state = self.CLOSED
+            self._outcomes.clear()
+            return True
+        self._outcomes.append(False)
+        return False
+
+    def record_failure(self) -> bool:
+        """Returns True if this opened the circuit."""
+        self._probe_in_flight = False
+        self._outcomes.append(True)
+        if self.state == self.OPEN:
+            return False
+        failures = sum(self._outcomes)
+        if self.state == self.HALF_OPEN or (
+            len(self._outcomes) >= self.min_calls and failures >= self.error_rate * len(self._outcomes)
+        ):
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            return True
+        return False
+
+
+class Provider:
+    """One OpenAI-compatible backend with its health and latency state."""
+
+    def __init__(self, spec: ProviderSpec, client: Any):
+        self.spec = spec
+        self.name = spec.name
+        self.client = client
+        self.breaker = CircuitBreaker(
+            settings.LLM_BREAKER_WINDOW,
+            settings.LLM_BREAKER_ERROR_RATE,
+            settings.LLM_BREAKER_MIN_CALLS,
+            settings.LLM_BREAKER_COOLDOWN_SECONDS
+        )
+        self._latency: Dict[str, LatencyTracker] = {}
+
+    @property
+    def supports_embeddings(self) -> bool:
+        return self.spec.supports_embeddings
+
+    def map_model(self, model: str) -> str:
+        """The provider's name for an (OpenAI) model name."""
+        if not self.spec.model_map and self.spec.default_model is None:
+            return model
+        return self.spec.model_map.get(model, self.spec.default_model or model)
+
+    def latency(self, key: str) -> LatencyTracker:
+        tracker = self._latency.get(key)
+        if tracker is None:
+            tracker = self._latency[key] = LatencyTracker(settings.LLM_LATENCY_EWMA_ALPHA)
+        return tracker
+
+
+def _reap(task: asyncio.Task):
+    # Mark exceptions of abandoned attempts as retrieved
+    if not task.cancelled():
+        task.exception()
+
+
+class ProviderPool:
+    """
+    All configured LLM providers, tried in LLM_PROVIDER_ORDER.
+
+    - Providers whose circuit breaker is open are skipped (if every circuit is
+      open, all providers are tried anyway rather than failing outright).
+    - Hedging: if the first provider has not answered within its p95 latency
+      for this kind of call, the next provider is started too; the first
+      successful answer wins and the other attempt is cancelled.
+    - Failover: a retryable error moves on to the next healthy provider
+      immediately, up to LLM_MAX_ATTEMPTS attempts per call. When the provider
+      that failed is the only one left, the retry waits LLM_FAILOVER_BACKOFF_MS
+      (with jitter) first.
+    """
+
+    def __init__(self, providers: List[Provider]):
+        self.providers = providers
+        self.listeners: List[ProviderListener] = []
+        self._discards: Set[asyncio.Task] = set() # the loop only keeps weak references to tasks
+
+    @classmethod
+    def from_settings(cls) -> "ProviderPool":
+        specs = provider_specs()
+        providers = []
+        for name in settings.LLM_PROVIDER_ORDER.split(","):
+            spec = specs.get(name.strip())
+            if spec is None or not spec.api_key:
+                continue
+            # Failover and hedging replace the SDK's own retries; connections come
+            # from the process-wide pool for this provider
+            client = AsyncOpenAI(
+                api_key=spec.api_key,
+                base_url=spec.base_url,
+                max_retries=0,
+                http_client=get_connection_manager().client(spec.name)
+            )
+            providers.append(Provider(spec, client))
+            logger.info(f"LLM provider enabled: {spec.name}")
+        return cls(providers)
+
+    def add_listener(self, listener: ProviderListener):
+        self.listeners.append(listener)
+
+    def _emit(self, provider: Provider, event: str, latency: Optional[float] = None):
+        for listener in self.listeners:
+            try:
+                listener(provider.name, event, latency)
+            except Exception as e:
+                logger.warning(f"Provider listener failed: {e}")
+
+    def candidates(self, predicate: Optional[Callable[[Provider], bool]] = None) -> List[Provider]:
+        usable = [p for p in self.providers if predicate is None or predicate(p)]
+        healthy = [p for p in usable if p.breaker.available()]
+        return healthy or usable
+
+    def hedge_delay(self, provider: Provider, key: str) -> float:
+        tracker = provider.latency(key)
+        delay = tracker.p95()
+        if delay is None:
+            delay = settings.LLM_HEDGE_DEFAULT_DELAY_MS / 1000 if tracker.ewma is None else 2 * tracker.ewma
+        return max(settings.LLM_HEDGE_MIN_DELAY_MS / 1000, delay)
+
+    async def _attempt(self, provider: Provider, key: str, fn: Callable[[Provider], Awaitable[Any]]) -> Any:
+        start = time.perf_counter()
+        try:
+            result = await fn(provider)
+        except asyncio.CancelledError:
+            provider.breaker.release()
+            raise
+        except Exception as e:
+            if not is_retryable(e):
+                provider.breaker.release()
+                raise
+            self._emit(provider, "error")
+            if provider.breaker.record_failure():
+                logger.warning(f"Circuit opened for LLM provider {provider.name}")
+                self._emit(provider, "circuit_open")
+            raise
+        latency = time.perf_counter() - start
+        provider.latency(key).observe(latency)
+        if provider.breaker.record_success():
+            logger.info(f"Circuit closed for LLM provider {provider.name}")
+            self._emit(provider, "circuit_closed")
+        self._emit(provider, "success", latency)
+        return result
+
+    async def call(
+        self,
+        key: str,
+        fn: Callable[[Provider], Awaitable[Any]],
+        hedge: bool = True,
+        predicate: Optional[Callable[[Provider], bool]] = None,
+        on_failover: Optional[Callable[[BaseException], None]] = None,
+        discard: Optional[Callable[[Any], Awaitable[None]]] = None
+    ) -> Any:
+        """
+        Run `fn(provider)` on the pool and return the first successful result.
+
+        `key` identifies the kind of call (its latency distribution drives the
+        hedge delay). `discard` cleans up the result of an attempt that also
+        succeeded but lost the race (e.g. closes a stream).
+        """
+        candidates = self.candidates(predicate)
+        if not candidates:
+            raise ProviderUnavailableError(f"No LLM provider available for {key}")
+
+        running: Dict[asyncio.Task, Provider] = {}
+        attempts = 0
+
+        def launch(provider: Optional[Provider] = None) -> asyncio.Task:
+            nonlocal attempts
+            provider = provider or candidates[attempts % len(candidates)]
+            attempts += 1
+            provider.breaker.acquire()
+            task = asyncio.create_task(self._attempt(provider, key, fn))
+            task.add_done_callback(_reap)
+            running[task] = provider
+            return task
+
+        primary = running[launch()]
+        hedged = not (hedge and settings.LLM_HEDGE_ENABLED and len(candidates) > 1)
+        hedge_at = time.monotonic() + self.hedge_delay(primary, key)
+        hedge_task: Optional[asyncio.Task] = None
+        last_error: Optional[BaseException] = None
+        try:
+            while True:
+                timeout = None
+                if not hedged and attempts < settings.LLM_MAX_ATTEMPTS:
+                    timeout = max(0.0, hedge_at - time.monotonic())
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    hedge_task = launch()
+                    self._emit(running[hedge_task], "hedge")
+                    continue
+
+                for task in done:
+                    provider = running.pop(task)
+                    if task.exception() is None:
+                        if task is hedge_task:
+                            self._emit(provider, "hedge_won")
+                        return task.result()
+                    last_error = task.exception()
+                    if not is_retryable(last_error):
+                        raise last_error
+
+                if running:
+                    continue # the other attempt is still in flight
+                if attempts >= settings.LLM_MAX_ATTEMPTS:
+                    raise last_error
+                others = [p for p in candidates if p is not provider and p.breaker.available()]
+                if not others and not provider.breaker.available():
+                    raise last_error # its circuit just opened and nothing else is healthy
+                logger.warning(f"LLM call {key} failed on {provider.name} ({type(last_error).__name__}); failing over")
+                if on_failover is not None:
+                    on_failover(last_error)
+                if not others:
+                    # Only the provider that just failed is left: back off (with jitter)
+                    # so a 429/5xx doesn't turn into an immediate retry storm
+                    self._emit(provider, "backoff")
+                    await asyncio.sleep(settings.LLM_FAILOVER_BACKOFF_MS / 1000 * random.uniform(0.5, 1.5))
+                hedged = True # a failover is the one extra attempt; don't hedge it too
+                self._emit(running[launch(others[0] if others else provider)], "failover")
+        finally:
+            for task in running:
+                if not task.done():
+                    task.cancel()
+                elif discard is not None and not task.cancelled() and task.exception() is None:
+                    cleanup = asyncio.ensure_future(discard(task.result()))
+                    self._discards.add(cleanup)
+                    cleanup.add_done_callback(self._discards.discard)
+                    cleanup.add_done_callback(_reap)
+
+    async def prewarm(self, connections: int):
+        """
+        Open `connections` keep-alive connections to every provider up front, so
+        the first requests don't pay for TCP and TLS setup. Any HTTP answer
+        counts: the connection is what we are after.
+        """
+        async def _warm(provider: Provider):
+            client = provider.client.with_options(timeout=PREWARM_TIMEOUT)
+            results = await asyncio.gather(
+                *(client.models.list() for _ in range(connections)),
+                return_exceptions=True
+            )
+            failures = [r for r in results if isinstance(r, Exception) and not isinstance(r, APIStatusError)]
+            if failures:
+                logger.warning(f"Prewarming LLM provider {provider.name} failed for {len(failures)}/{connections} connections: {failures[0]}")
+            else:
+                logger.info(f"Prewarmed {connections} connections to LLM provider {provider.name}")
+
+        if connections > 0:
+            await asyncio.gather(*(_warm(p) for p in self.providers))
+
+    async def close(self):
+        if self._discards:
+            await asyncio.gather(*self._discards, return_exceptions=True)
+        for provider in self.providers:
+            await provider.client.close()
+        # The shared clients were closed above; drop them so a new pool opens fresh ones
+        await get_connection_manager().close()
@@ -0,0 +1,196 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Callable, Dict, List, Optional
+
+from config.settings import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Lower runs first. Classification sits with HIGH_RISK: every ambiguous message,
+# crises included, waits on it before anything else can happen.
+PRIORITIES = {
+    "CRISIS": 0,
+    "HIGH_RISK": 1,
+    "CLASSIFICATION": 1,
+    "MEDIUM_RISK": 2,
+    "LOW_RISK": 3,
+    "BACKGROUND": 4,
+}
+DEFAULT_PRIORITY = "MEDIUM_RISK"
+
+SHORT_EWMA_ALPHA = 0.3 # recent latency
+LONG_EWMA_ALPHA = 0.02 # baseline latency
+LATENCY_DECREASE = 0.9 # limit multiplier when recent latency drifts above the baseline
+MIN_DECREASE_INTERVAL = 1.0 # seconds; one burst of 429s counts as one congestion signal
+MIN_LATENCY_SAMPLES = 20 # per kind of call, before latency can lower the limit
+
+# Called with (model, priority class, event, value):
+#   "wait": seconds a call queued before it got a slot
+#   "shed": seconds a call queued before its deadline passed
+#   "limit": the model's new concurrency limit (priority class is None)
+SchedulerListener = Callable[[str, Optional[str], str, float], None]
+
+
+class LLMOverloadedError(Exception):
+    """An LLM call was shed: it could not get a slot before its queue deadline."""
+
+
+class AIMDLimiter:
+    """
+    Concurrency limit for one model with a priority wait queue.
+
+    The limit grows by 1/limit per successful call while it is the bottleneck
+    (additive increase) and is multiplied by LLM_CONCURRENCY_BACKOFF on a rate
+    limit, timeout or 5xx (multiplicative decrease). It also backs off gently
+    when the recent latency of a kind of call drifts above its long-term
+    baseline, so queueing moves out of the provider and into our priority order.
+    """
+
+    def __init__(self, model: str, initial: int, min_limit: int, max_limit: int, emit: Callable[[str, float], None]):
+        self.model = model
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.in_flight = 0
+        self._emit = emit
+        self._queue: List[list] = [] # heap of [priority, seq, future]
+        self._seq = itertools.count()
+        self._latency: Dict[str, List[float]] = {} # kind -> [short EWMA, long EWMA, samples]
+        self._last_decrease = 0.0
+
+    def __len__(self) -> int:
+        return sum(1 for _, _, future in self._queue if not future.done())
+
+    async def acquire(self, priority: int, timeout: Optional[float]):
+        """Wait for a slot; raises asyncio.TimeoutError if none frees up within `timeout`."""
+        if self.in_flight < int(self.limit) and not self._queue:
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, [priority, next(self._seq), future])
+        try:
+            await asyncio.wait_for(future, timeout)
+        except BaseException:
+            if future.done() and not future.cancelled():
+                self.release() # granted just as we gave up
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._grant()
+
+    def _grant(self):
+        while self._queue and self.in_flight < int(self.limit):
+            _, _, future = heapq.heappop(self._queue)
+            if future.done(): # timed out or cancelled while queued
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    def record_success(self, kind: str, latency: float):
+        ewma = self._latency.get(kind)
+        if ewma is None:
+            ewma = self._latency[kind] = [latency, latency, 1]
+        else:
+            ewma[0] += SHORT_EWMA_ALPHA * (latency - ewma[0])
+            ewma[1] += LONG_EWMA_ALPHA * (latency - ewma[1])
+            ewma[2] += 1
+        if ewma[2] >= MIN_LATENCY_SAMPLES and ewma[0] > settings.LLM_CONCURRENCY_LATENCY_TOLERANCE * ewma[1]:
+            self._decrease(LATENCY_DECREASE)
+        elif self._queue or self.in_flight >= int(self.limit):
+            # Only grow while the limit is what holds calls back
+            self._set_limit(self.limit + 1.0 / self.limit)
+
+    def record_overload(self):
+        self._decrease(settings.LLM_CONCURRENCY_BACKOFF)
+
+    def _decrease(self, factor: float):
+        now = time.monotonic()
+        if now - self._last_decrease < MIN_DECREASE_INTERVAL:
+            return
+        self._last_decrease = now
+        self._set_limit(self.limit * factor)
+
+    def _set_limit(self, limit: float):
+        limit = min(max(limit, self.min_limit), self.max_limit)
+        if int(limit) != int(self.limit):
+            self._emit(self.model, int(limit))
+            logger.info(f"LLM concurrency limit for {self.model}: {int(self.limit)} -> {int(limit)}")
+        self.limit = limit
+        self._grant()
+
+
+class Slot:
+    """A granted place in a model's concurrency limit; release it exactly once."""
+
+    def __init__(self, limiter: AIMDLimiter):
+        self._limiter = limiter
+        self._released = False
+
+    def record_success(self, kind: str, latency: float):
+        self._limiter.record_success(kind, latency)
+
+    def record_overload(self):
+        self._limiter.record_overload()
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._limiter.release()
+
+
+class LLMScheduler:
+    """
+    Admission control in front of the provider pool: one AIMDLimiter per
+    model, and a queue deadline per priority class (LLM_QUEUE_DEADLINES_MS)
+    after which a waiting call is shed with LLMOverloadedError.
+    """
+
+    def __init__(self):
+        self._limiters: Dict[str, AIMDLimiter] = {}
+        self.listeners: List[SchedulerListener] = []
+
+    def add_listener(self, listener: SchedulerListener):
+        self.listeners.append(listener)
+
+    def _emit(self, model: str, priority: Optional[str], event: str, value: float):
+        for listener in self.listeners:
+            try:
+                listener(model, priority, event, value)
+            except Exception as e:
+                logger.warning(f"Scheduler listener failed: {e}")
+
+    def limiter(self, model: str) -> AIMDLimiter:
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            limiter = self._limiters[model] = AIMDLimiter(
+                model,
+                settings.LLM_CONCURRENCY_INITIAL,
+                settings.LLM_CONCURRENCY_MIN,
+                settings.LLM_CONCURRENCY_MAX,
+                lambda name, limit: self._emit(name, None, "limit", limit)
+            )
+            self._emit(model, None, "limit", int(limiter.limit))
+        return limiter
+
+    async def acquire(self, model: str, priority: str) -> Slot:
+        if priority not in PRIORITIES:
+            priority = DEFAULT_PRIORITY
+        limiter = self.limiter(model)
+        deadline_ms = settings.LLM_QUEUE_DEADLINES_MS.get(priority)
+        started = time.perf_counter()
+        try:
+            await limiter.acquire(PRIORITIES[priority], deadline_ms / 1000 if deadline_ms else None)
+        except asyncio.TimeoutError:
+            waited = time.perf_counter() - started
+            self._emit(model, priority, "shed", waited)
+            raise LLMOverloadedError(
+                f"{priority} call to {model} shed after {waited * 1000:.0f}ms in queue "
+                f"(limit {int(limiter.limit)}, {len(limiter)} waiting)"
+            )
+        self._emit(model, priority, "wait", time.perf_counter() - started)
+        return Slot(limiter)
@@ -0,0 +1,159 @@
+import json
+import re
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional, Sequence
+
+from src.cost.tokens import count_tokens
+
+# Sections in render order: (memory field, header, base weight)
+SECTIONS = [
+    ("relationship_context", "Relationship Context:", 1.0),
+    ("recurring_themes", "Recurring Themes:", 0.6),
+    ("emotional_patterns", "Emotional Patterns:", 0.5),
+    ("progress_notes", "Recent Progress:", 0.4),
+]
+_SECTION_INDEX = {field: i for i, (field, _, _) in enumerate(SECTIONS)}
+_SECTION_WEIGHT = {field: weight for field, _, weight in SECTIONS}
+_HEADERS = {field: header for field, header, _ in SECTIONS}
+
+ITEM_SEPARATOR = "; "
+RECENCY_WEIGHT = 0.5
+RELEVANCE_WEIGHT = 1.5
+NOTE_HALF_LIFE = 2.0 # a note's recency score halves every this many newer notes
+
+_WORD = re.compile(r"[a-z0-9']+")
+STOPWORDS = frozenset(
+    "the and for are but not you your with that this have has had was were they them their "
+    "what when where which who how why can could would should about into from our out just "
+    "its it's i'm im he she him her his hers been being very really much more some any all".split()
+)
+
+
+class MemoryItem(NamedTuple):
+    section: str
+    text: str                # rendered item, e.g. "status: married"
+    position: int            # order within the section (notes: oldest first)
+    recency: float           # 1.0 = current / newest
+    words: FrozenSet[str]    # content words, for relevance scoring
+    tokens: int              # cost of the item including its separator
+
+
+class ContextResult(NamedTuple):
+    text: str
+    tokens: int              # exact token count of `text`
+    items_used: int
+    items_total: int
+
+
+def content_words(text: str) -> FrozenSet[str]:
+    return frozenset(w for w in _WORD.findall(text.lower()) if len(w) > 2 and w not in STOPWORDS)
+
+
+def _as_dict(value: Any) -> Dict[str, Any]:
+    # asyncpg returns JSONB as text unless a codec is registered
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return {}
+    return value if isinstance(value, dict) else {}
+
+
+def _render_entry(key: str, value: Any) -> str:
+    # `is True`: `in (True,)` would also match 1 and 1.0
+    if value is None or value == "" or value is True or value == {} or value == []:
+        return str(key)
+    if not isinstance(value, str):
+        value = json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+    return f"{key}: {value}"
+
+
+class ContextBuilder:
+    """
+    Renders user memory into a compact prompt context under an exact token budget.
+
+    `parse` turns a memory row into message-independent items once (the result is
+    what gets cached); `build` ranks them for the current message and greedily
+    packs the best ones until the budget is reached:
+
+        score = section weight + RECENCY_WEIGHT * recency + RELEVANCE_WEIGHT * overlap
+
+    where overlap is the share of an item's content words that appear in the
+    message. Included items are rendered back in section order, so the same
+    selection always produces the same text (and the same response cache key).
+    """
+
+    def __init__(self, token_budget: int, model: Optional[str] = None):
+        self.token_budget = token_budget
+        self.model = model
+        self._header_tokens: Optional[Dict[str, int]] = None # counted on first build
+
+    def _item(self, section: str, text: str, position: int, recency: float) -> MemoryItem:
+        return MemoryItem(
+            section, text, position, recency,
+            content_words(text),
+            count_tokens(ITEM_SEPARATOR + text, self.model)
+        )
+
+    def parse(self, memory: Optional[Dict[str, Any]]) -> List[MemoryItem]:
+        if not memory:
+            return []
+        items = []
+        for section in ("relationship_context", "recurring_themes", "emotional_patterns"):
+            for position, (key, value) in enumerate(_as_dict(memory.get(section)).items()):
+                items.append(self._item(section, _render_entry(key, value), position, 1.0))
+
+        notes = [n for n in (memory.get("progress_notes") or []) if n]
+        for position, note in enumerate(notes):
+            age = len(notes) - 1 - position
+            items.append(self._item("progress_notes", note, position, 0.5 ** (age / NOTE_HALF_LIFE)))
+        return items
+
+    def score(self, item: MemoryItem, message_words: FrozenSet[str]) -> float:
+        overlap = len(item.words & message_words) / len(item.words) if item.words and message_words else 0.0
+        return _SECTION_WEIGHT[item.section] + RECENCY_WEIGHT * item.recency + RELEVANCE_WEIGHT * overlap
+
+    def build(self, items: Sequence[MemoryItem], message: str = "") -> ContextResult:
+        if not items or self.token_budget <= 0:
+            return ContextResult("", 0, 0, len(items))
+
+        if self._header_tokens is None:
+            self._header_tokens = {field: count_tokens(header, self.model) for field, header in _HEADERS.items()}
+        message_words = content_words(message)
+        ranked = sorted(items, key=lambda item: self.score(item, message_words), reverse=True)
+
+        # Greedy packing on per-item counts (a section's header is paid by its first item)
+        chosen: List[MemoryItem] = []
+        sections_used = set()
+        spent = 0
+        for item in ranked:
+            cost = item.tokens
+            if item.section not in sections_used:
+                cost += self._header_tokens[item.section] + 1 # + line break
+            if spent + cost > self.token_budget:
+                continue
+            chosen.append(item)
+            sections_used.add(item.section)
+            spent += cost
+
+        # Per-piece counts can be off by a token at the joins; trim until the exact count fits
+        text = self._render(chosen)
+        tokens = count_tokens(text, self.model)
+        while tokens > self.token_budget and chosen:
+            chosen.pop() # lowest scored
+            text = self._render(chosen)
+            tokens = count_tokens(text, self.model)
+        return ContextResult(text, tokens, len(chosen), len(items))
+
+    def _render(self, chosen: Sequence[MemoryItem]) -> str:
+        by_section: Dict[str, List[MemoryItem]] = {}
+        for item in sorted(chosen, key=lambda i: (_SECTION_INDEX[i.section], i.position)):
+            by_section.setdefault(item.section, []).append(item)
+        return "\n".join(
+            f"{_HEADERS[section]} {ITEM_SEPARATOR.join(item.text for item in section_items)}"
+            for section, section_items in by_section.items()
+        )
+
+
+def items_size(items: Sequence[MemoryItem]) -> int:
+    """Approximate in-memory size, for the LRU byte bound."""
+    return sum(len(item.text) * 2 + 64 * (1 + len(item.words)) for item in items)
@@ -1,41 +1,97 @@
-from typing import List, Dict, Any
+import asyncio
+import logging
+import time
+from typing import List, Dict, Any, Optional
+from uuid import UUID
 from src.database.client import DatabaseClient
+from src.cost.cache import LocalLRUCache
+from src.memory.context_builder import ContextBuilder, ContextResult, items_size
+from src.monitoring.client import MonitoringClient
+from config.settings import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Minimum time between attempts to re-establish the invalidation listener
+LISTENER_RETRY_SECONDS = 30
 
 class MemoryRetrieval:
-    def __init__(self, db_client: DatabaseClient):
+    """
+    Builds the memory context for a user, with a per-worker read-through cache.
+
+    Memory only changes when a background summary is written, so the parsed
+    memory items are cached per user and evicted when the database reports a change
+    (LISTEN/NOTIFY, so writes from any worker are seen). The cache is only used
+    while that listener is connected; otherwise every call reads the database.
+    """
+
+    def __init__(self, db_client: DatabaseClient, monitor: Optional[MonitoringClient] = None):
         self.db = db_client
+        self.monitor = monitor or MonitoringClient()
+        self.builder = ContextBuilder(settings.MEMORY_CONTEXT_TOKEN_BUDGET, settings.MODEL_LOW_RISK)
+        self.cache = LocalLRUCache(
+            max_entries=settings.MEMORY_CONTEXT_CACHE_MAX_ENTRIES,
+            max_bytes=settings.MEMORY_CONTEXT_CACHE_MAX_BYTES,
+            ttl_seconds=settings.MEMORY_CONTEXT_CACHE_TTL_SECONDS
+        )
+        # Bumped on every invalidation; a read that overlaps one is not cached
+        self._generation = 0
+        self._listener_attempted_at = float("-inf")
+        self._listener_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Subscribe to memory change notifications (enables the cache)."""
+        self._listener_attempted_at = time.monotonic()
+        try:
+            await self.db.listen_memory_updates(self.invalidate)
+        except Exception as e:
+            logger.warning(f"Memory context cache disabled, listener unavailable: {e}")
+
+    def _ensure_listener(self):
+        if self.db.memory_listener_active:
+            return
+        if self._listener_task is not None and not self._listener_task.done():
+            return
+        if time.monotonic() - self._listener_attempted_at < LISTENER_RETRY_SECONDS:
+            return
+        self._listener_task = asyncio.create_task(self.start())
 
-    async def get_context(self, user_id, session_id: str) -> str:
+    def invalidate(self, user_id: Optional[UUID] = None):
+        """Drop one user's cached context, or everything if `user_id` is None."""
+        self._generation += 1
+        if user_id is None:
+            self.cache.clear()
+        else:
+            self.cache.delete(str(user_id))
+
+    async def get_context(self, user_id, session_id: str, message: str = "") -> str:
         """
-        Constructs a context string from user memory for the LLM.
-        Budgets tokens to ~500.
+        Memory context for the LLM, ranked by relevance to `message` and packed
+        into MEMORY_CONTEXT_TOKEN_BUDGET tokens.
         """
+        return (await self.get_context_result(user_id, session_id, message)).text
+
+    async def get_context_result(self, user_id, session_id: str, message: str = "") -> ContextResult:
+        items = await self._get_items(user_id)
+        result = self.builder.build(items, message)
+        self.monitor.record_context_tokens(result.tokens, result.items_used, result.items_total)
+        return result
+
+    async def _get_items(self, user_id):
+        self._ensure_listener()
+        use_cache = self.db.memory_listener_active
+        if use_cache:
+            cached = self.cache.get(str(user_id))
+            if cached is not None:
+                self.monitor.increment("memory_context_cache_hit")
+                return cached
+            self.monitor.increment("memory_context_cache_miss")
+
+        generation = self._generation
         memory = await self.db.get_user_memory(user_id)
-        if not memory:
-            return ""
-
-        # Format context
-        # We prioritize: 
-        # 1. Immediate relationship context
-        # 2. Recent progress notes
-        # 3. Recurring themes
-        
-        context_parts = []
-        
-        # 1. Context
-        rel_ctx = memory.get("relationship_context", {})
-        if rel_ctx:
-            context_parts.append(f"Relationship Context: {rel_ctx}")
-
-        # 2. Themes
-        themes = memory.get("recurring_themes", {})
-        if themes:
-            context_parts.append(f"Recurring Themes: {themes}")
-
-        # 3. Notes (Last 3 only to save tokens)
-        notes = memory.get("progress_notes", [])
-        if notes:
-            recent_notes = notes[-3:]
-            context_parts.append(f"Recent Progress: {'; '.join(recent_notes)}")
-            
-        return "\n".join(context_parts)
+        items = self.builder.parse(memory)
+
+        # Only cache if no change notification arrived while we were reading
+        if use_cache and generation == self._generation and self.db.memory_listener_active:
+            self.cache.set(str(user_id), items, size=items_size(items))
+        return items
@@ -1,11 +1,20 @@
 import logging
-import re
 from typing import Dict, Any, List
 from src.llm.client import LLMClient
+from src.orchestration.patterns import compile_rules
 from config.settings import get_settings
 
 logger = logging.getLogger(__name__)
 
+PROHIBITED_MEMORY_PATTERNS = [
+    r"\d{3}-\d{2}-\d{4}", # SSN like
+    r"suicid",
+    r"kill myself",
+    # Add more patterns
+]
+
+_prohibited_memory_matcher = compile_rules(PROHIBITED_MEMORY_PATTERNS)
+
 class MemorySummarizer:
     def __init__(self, llm_client: LLMClient):
         self.llm = llm_client
@@ -39,7 +48,8 @@ class MemorySummarizer:
                     {"role": "system", "content": prompt},
                     {"role": "user", "content": history_text}
                 ],
-                response_format={"type": "json_object"}
+                response_format={"type": "json_object"},
+                priority="BACKGROUND" # queued behind every user-facing call
             )
             # Should stick to a Pydantic model in real life but dict is fine here
             import json
@@ -59,14 +69,4 @@ class MemorySummarizer:
         """
         Regex + Keyword blocking for safety in memory.
         """
-        prohibited_patterns = [
-            r"\d{3}-\d{2}-\d{4}", # SSN like
-            r"suicid",
-            r"kill myself",
-            # Add more patterns
-        ]
-        
-        for p in prohibited_patterns:
-            if re.search(p, text, re.IGNORECASE):
-                return True
-        return False
+        return _prohibited_memory_matcher.any(text)
@@ -0,0 +1,288 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+from uuid import UUID
+
+from src.memory.summarizer import MemorySummarizer
+from src.database.client import DatabaseClient
+from src.cost.budget import usage_owner
+from src.cost.cache import ResponseCache
+from src.monitoring.client import MonitoringClient
+from src.monitoring.timing import StageTimer
+from config.settings import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+# Summary keys (see MemorySummarizer) of the JSONB memory fields
+MEMORY_FIELDS = (("relationship_context", "1"), ("recurring_themes", "2"), ("emotional_patterns", "3"))
+
+
+def _summary_update(user_id: UUID, summary: Dict) -> Dict:
+    """
+    The memory update for a summary. Fields the model returned in the wrong
+    shape (not a JSON object, or a note that isn't a string) are left out, so
+    one malformed summary can't fail a bulk write for everyone in its batch.
+    """
+    update = {"user_id": user_id}
+    for name, key in MEMORY_FIELDS:
+        value = summary.get(key)
+        if value and not isinstance(value, dict):
+            logger.warning(f"Dropping malformed memory field {name} ({type(value).__name__}) for {user_id}")
+            value = None
+        update[name] = value or {}
+    note = summary.get("4")
+    if note and not isinstance(note, str):
+        logger.warning(f"Dropping malformed progress note ({type(note).__name__}) for {user_id}")
+        note = None
+    update["new_progress_note"] = note or ""
+    return update
+
+
+@dataclass
+class _PendingUpdate:
+    user_id: UUID
+    turns: List[Dict[str, str]] = field(default_factory=list)
+    first_at: float = field(default_factory=time.monotonic)
+    ready: bool = False
+    timer: Optional[asyncio.TimerHandle] = None
+
+
+class MemoryUpdateWorker:
+    """
+    Background pipeline for step 11 (memory update).
+
+    Turns are buffered per user and summarized together once the user has been
+    quiet for MEMORY_DEBOUNCE_SECONDS (or after MEMORY_MAX_DELAY_SECONDS, or
+    MEMORY_MAX_TURNS_PER_SUMMARY turns), so an active chat costs one summary
+    call and one DB write per burst instead of per turn.
+
+    - At most MEMORY_WORKERS summaries run at once, and one user's updates are
+      never processed concurrently (so writes stay in order).
+    - The buffer is bounded by MEMORY_QUEUE_MAX_TURNS; when it is full new turns
+      are dropped (and counted) rather than slowing down chat responses.
+    - Finished summaries are written with one bulk upsert per
+      MEMORY_WRITE_BATCH_SIZE summaries or MEMORY_WRITE_FLUSH_SECONDS. If a
+      bulk write fails, its updates are retried one by one.
+    - Once a user's memory is written, responses cached with their old memory
+      context are dropped from `response_cache`.
+    - `close()` flushes everything still buffered before shutdown.
+    """
+
+    def __init__(
+        self,
+        summarizer: MemorySummarizer,
+        db: DatabaseClient,
+        monitor: Optional[MonitoringClient] = None,
+        response_cache: Optional[ResponseCache] = None
+    ):
+        self.summarizer = summarizer
+        self.db = db
+        self.monitor = monitor or MonitoringClient()
+        self.response_cache = response_cache
+
+        self._pending: Dict[UUID, _PendingUpdate] = {}
+        self._pending_turns = 0
+        self._active: Set[UUID] = set()
+        self._ready: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._idle: Optional[asyncio.Event] = None
+        self._closing = False
+
+        self._writes: List[Dict] = []
+        self._write_lock = asyncio.Lock() # bulk writes go out in order
+        self._write_timer: Optional[asyncio.TimerHandle] = None
+        self._write_tasks: Set[asyncio.Task] = set()
+
+    @property
+    def pending_turns(self) -> int:
+        return self._pending_turns
+
+    def _ensure_workers(self):
+        if self._workers:
+            return
+        self._ready = asyncio.Queue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._workers = [
+            asyncio.create_task(self._run(), name=f"memory-worker-{i}")
+            for i in range(settings.MEMORY_WORKERS)
+        ]
+
+    def submit(self, user_id: UUID, user_msg: str, bot_msg: str) -> bool:
+        """
+        Buffer one turn for summarization. Never blocks; returns False if the
+        turn was dropped because the buffer is full or the worker is closing.
+        """
+        if self._closing or self._pending_turns >= settings.MEMORY_QUEUE_MAX_TURNS:
+            self.monitor.increment("memory_turns_dropped")
+            return False
+        self._ensure_workers()
+
+        entry = self._pending.get(user_id)
+        if entry is None:
+            entry = self._pending[user_id] = _PendingUpdate(user_id)
+        entry.turns.append({"role": "user", "content": user_msg})
+        entry.turns.append({"role": "assistant", "content": bot_msg})
+        self._pending_turns += 1
+        self._idle.clear()
+        self.monitor.increment("memory_turns_submitted")
+        self.monitor.set_gauge("memory_pending_turns", self._pending_turns)
+
+        if entry.ready:
+            return True
+        if len(entry.turns) // 2 >= settings.MEMORY_MAX_TURNS_PER_SUMMARY:
+            self._mark_ready(user_id)
+            return True
+
+        # Trailing debounce, capped so a non-stop chat still gets summarized
+        if entry.timer is not None:
+            entry.timer.cancel()
+        delay = min(
+            settings.MEMORY_DEBOUNCE_SECONDS,
+            entry.first_at + settings.MEMORY_MAX_DELAY_SECONDS - time.monotonic()
+        )
+        entry.timer = asyncio.get_running_loop().call_later(max(0.0, delay), self._mark_ready, user_id)
+        return True
+
+    def _mark_ready(self, user_id: UUID):
+        entry = self._pending.get(user_id)
+        if entry is None or entry.ready:
+            return
+        entry.ready = True
+        if entry.timer is not None:
+            entry.timer.cancel()
+            entry.timer = None
+        if user_id not in self._active:
+            self._ready.put_nowait(user_id)
+        # Otherwise the worker busy with this user picks it up when it finishes
+
+    async def _run(self):
+        while True:
+            user_id = await self._ready.get()
+            entry = self._pending.pop(user_id, None)
+            if entry is None:
+                continue
+            self._active.add(user_id)
+            self._pending_turns -= len(entry.turns) // 2
+            self.monitor.set_gauge("memory_pending_turns", self._pending_turns)
+            try:
+                await self._process(entry)
+            except Exception as e:
+                self.monitor.increment("memory_update_failed")
+                self.monitor.log_error("MemoryUpdateWorker", f"Memory update failed: {e}")
+            finally:
+                self._active.discard(user_id)
+                follow_up = self._pending.get(user_id)
+                if follow_up is not None and follow_up.ready:
+                    self._ready.put_nowait(user_id)
+                if not self._pending and not self._active:
+                    self._idle.set()
+
+    async def _process(self, entry: _PendingUpdate):
+        # Charge the summarization call to the user it is for
+        owner_token = usage_owner.set(str(entry.user_id))
+        timer = StageTimer()
+        try:
+            with timer.stage("memory_update"):
+                summary = await self.summarizer.generate_summary(entry.turns)
+                self.monitor.increment("memory_summaries")
+        finally:
+            usage_owner.reset(owner_token)
+            self.monitor.observe_stage("memory_update", timer.timings["memory_update"])
+        if isinstance(summary, dict) and summary:
+            self._queue_write(_summary_update(entry.user_id, summary))
+        elif summary:
+            self.monitor.increment("memory_update_failed")
+            logger.warning(f"Ignoring malformed memory summary ({type(summary).__name__}) for {entry.user_id}")
+
+    def _queue_write(self, update: Dict):
+        self._writes.append(update)
+        if len(self._writes) >= settings.MEMORY_WRITE_BATCH_SIZE:
+            self._start_write()
+        elif self._write_timer is None:
+            self._write_timer = asyncio.get_running_loop().call_later(
+                settings.MEMORY_WRITE_FLUSH_SECONDS, self._start_write
+            )
+
+    def _start_write(self):
+        task = asyncio.get_running_loop().create_task(self._write_batch())
+        self._write_tasks.add(task)
+        task.add_done_callback(self._write_tasks.discard)
+
+    async def _write_batch(self):
+        if self._write_timer is not None:
+            self._write_timer.cancel()
+            self._write_timer = None
+        batch, self._writes = self._writes, []
+        if not batch:
+            return
+        async with self._write_lock:
+            timer = StageTimer()
+            try:
+                with timer.stage("memory_write"):
+                    await self.db.bulk_update_user_memory(batch)
+                self.monitor.increment("memory_writes")
+            except Exception as e:
+                logger.warning(f"Bulk memory write failed ({len(batch)} updates), retrying one by one: {e}")
+                batch = await self._write_one_by_one(batch)
+            finally:
+                self.monitor.observe_stage("memory_write", timer.timings["memory_write"])
+            await self._invalidate_responses(batch)
+
+    async def _write_one_by_one(self, batch: List[Dict]) -> List[Dict]:
+        """
+        After a failed bulk write: isolate the bad updates so the rest still land.
+        Returns the updates that were written.
+        """
+        written = []
+        for update in batch:
+            try:
+                await self.db.bulk_update_user_memory([update])
+                self.monitor.increment("memory_writes")
+                written.append(update)
+            except Exception as e:
+                self.monitor.increment("memory_update_failed")
+                self.monitor.log_error("MemoryUpdateWorker", f"Memory write failed for {update.get('user_id')}: {e}")
+        return written
+
+    async def _invalidate_responses(self, written: List[Dict]):
+        # Responses cached with the user's previous memory context no longer reflect it
+        if self.response_cache is None:
+            return
+        for user_id in {str(update["user_id"]) for update in written}:
+            await self.response_cache.invalidate_user(user_id)
+
+    async def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Summarize everything buffered now, without waiting for debounce timers.
+        Returns False if the work did not finish within `timeout`.
+        """
+        if not self._workers:
+            return True
+        for user_id in list(self._pending):
+            self._mark_ready(user_id)
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _drain(self):
+        await self._idle.wait()
+        await self._write_batch()
+        if self._write_tasks:
+            await asyncio.gather(*self._write_tasks, return_exceptions=True)
+
+    async def close(self):
+        """Stop accepting turns, drain the buffer, then stop the workers."""
+        self._closing = True
+        if not await self.flush(settings.MEMORY_DRAIN_TIMEOUT_SECONDS):
+            logger.warning(f"Memory worker shutdown timed out; {self._pending_turns} turns not summarized")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
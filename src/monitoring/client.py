@@ -1,16 +1,157 @@
 import logging
 import time
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+
+from src.monitoring.metrics import MetricsRegistry
 
 logger = logging.getLogger("monitoring")
 
+METRIC_PREFIX = "counseling"
+
 class MonitoringClient:
     def __init__(self):
-        # In production this would connect to Datadog/Prometheus
-        pass
+        # Exposed in Prometheus text format at /metrics
+        self.metrics = MetricsRegistry()
+        self.counters: Dict[str, int] = {}
+        self.gauges: Dict[str, float] = {}
+
+        self._events = self.metrics.counter(
+            f"{METRIC_PREFIX}_events_total", "Named pipeline events (see MonitoringClient.increment).", ["event"])
+        self._request_seconds = self.metrics.histogram(
+            f"{METRIC_PREFIX}_request_duration_seconds", "End-to-end request latency.", ["risk_level", "model"])
+        self._stage_seconds = self.metrics.histogram(
+            f"{METRIC_PREFIX}_stage_duration_seconds", "Latency of each pipeline stage.", ["stage", "risk_level", "model"])
+        self._cache_lookups = self.metrics.counter(
+            f"{METRIC_PREFIX}_cache_lookups_total", "Response cache lookups by result tier.", ["tier"])
+        self._layer2_blocks = self.metrics.counter(
+            f"{METRIC_PREFIX}_layer2_blocks_total", "Responses blocked by Layer 2 validation.", ["reason", "mode"])
+        self._llm_retries = self.metrics.counter(
+            f"{METRIC_PREFIX}_llm_retries_total", "LLM calls retried after an error.", ["model", "error"])
+        self._provider_events = self.metrics.counter(
+            f"{METRIC_PREFIX}_llm_provider_events_total",
+            "LLM provider pool events (success, error, hedge, hedge_won, failover, backoff, circuit_open, circuit_closed).",
+            ["provider", "event"])
+        self._provider_seconds = self.metrics.histogram(
+            f"{METRIC_PREFIX}_llm_provider_latency_seconds", "Latency of successful LLM provider calls.", ["provider"])
+        self._circuit_open = self.metrics.gauge(
+            f"{METRIC_PREFIX}_llm_circuit_open", "1 while the provider's circuit breaker is open.", ["provider"])
+        self._http_setup_seconds = self.metrics.histogram(
+            f"{METRIC_PREFIX}_llm_http_setup_seconds",
+            "LLM HTTP connection setup by phase (connect, tls, pool_wait).", ["provider", "phase"])
+        self._http_connections = self.metrics.counter(
+            f"{METRIC_PREFIX}_llm_http_connections_opened_total", "New connections opened to the LLM provider.", ["provider"])
+        self._http_in_flight = self.metrics.gauge(
+            f"{METRIC_PREFIX}_llm_http_in_flight", "LLM requests holding or waiting for a pooled connection.", ["provider"])
+        self._http_saturation = self.metrics.gauge(
+            f"{METRIC_PREFIX}_llm_http_pool_saturation",
+            "In-flight LLM requests / LLM_HTTP_MAX_CONNECTIONS (above 1, requests queue).", ["provider"])
+        self._llm_queue_seconds = self.metrics.histogram(
+            f"{METRIC_PREFIX}_llm_queue_wait_seconds", "Time LLM calls waited for a scheduler slot.", ["model", "priority"])
+        self._llm_shed = self.metrics.counter(
+            f"{METRIC_PREFIX}_llm_shed_total", "LLM calls shed at their queue deadline.", ["model", "priority"])
+        self._llm_concurrency_limit = self.metrics.gauge(
+            f"{METRIC_PREFIX}_llm_concurrency_limit", "Adaptive concurrency limit per model.", ["model"])
+        self._routing_mode = self.metrics.gauge(
+            f"{METRIC_PREFIX}_routing_mode", "1 for the current load-aware routing mode (normal, degraded, critical).", ["mode"])
+        self._routing_mode_changes = self.metrics.counter(
+            f"{METRIC_PREFIX}_routing_mode_changes_total", "Routing mode transitions.", ["from_mode", "to_mode"])
+        self._context_tokens = self.metrics.histogram(
+            f"{METRIC_PREFIX}_memory_context_tokens", "Tokens of memory context added to the prompt.",
+            buckets=(0, 50, 100, 200, 300, 400, 500, 750, 1000, 2000))
+        self._context_items_dropped = self.metrics.counter(
+            f"{METRIC_PREFIX}_memory_context_items_dropped_total", "Memory items left out by the context token budget.")
+        self._llm_tokens = self.metrics.counter(
+            f"{METRIC_PREFIX}_llm_tokens_total", "Tokens reported by the LLM provider.", ["model", "kind"])
+        self._prompt_tokens = self.metrics.histogram(
+            f"{METRIC_PREFIX}_prompt_tokens", "Prompt size of response generations.", ["risk_level"],
+            buckets=(250, 500, 750, 1000, 1250, 1500, 2000, 3000, 4000, 8000))
+
+    def increment(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+        self._events.labels(name).inc(amount)
+
+    def get_counters(self) -> Dict[str, int]:
+        return dict(self.counters)
+
+    def set_gauge(self, name: str, value: float):
+        self.gauges[name] = value
+        self.metrics.gauge(f"{METRIC_PREFIX}_{name}", name.replace("_", " ").capitalize() + ".").set(value)
+
+    def log_request(self, latency_ms: float, risk_level: str, model: str, stages: Optional[Dict[str, float]] = None):
+        self._request_seconds.labels(risk_level, model).observe(latency_ms / 1000)
+        for name, ms in (stages or {}).items():
+            self.observe_stage(name, ms, risk_level, model)
+        stage_str = " ".join(f"{name}={ms:.1f}ms" for name, ms in (stages or {}).items())
+        logger.info(f"REQUEST METRICS: latency={latency_ms}ms risk={risk_level} model={model} {stage_str}".rstrip())
+
+    def observe_stage(self, stage: str, duration_ms: float, risk_level: str = "", model: str = ""):
+        """Record one stage timing (StageTimer ms) outside of log_request, e.g. background work."""
+        self._stage_seconds.labels(stage, risk_level, model).observe(duration_ms / 1000)
+
+    def record_cache_lookup(self, tier: str):
+        self.increment(f"cache_{tier}")
+        self._cache_lookups.labels(tier).inc()
+
+    def record_layer2_block(self, reason: str, mode: str = "blocking"):
+        self._layer2_blocks.labels(reason, mode).inc()
+
+    def record_llm_retry(self, model: str, error: str):
+        """LLMClient retry listener."""
+        self._llm_retries.labels(model, error).inc()
+
+    def record_provider_event(self, provider: str, event: str, latency: Optional[float] = None):
+        """LLMClient provider listener."""
+        self._provider_events.labels(provider, event).inc()
+        if latency is not None:
+            self._provider_seconds.labels(provider).observe(latency)
+        if event in ("circuit_open", "circuit_closed"):
+            self._circuit_open.labels(provider).set(1 if event == "circuit_open" else 0)
+
+    def record_http_event(self, provider: str, event: str, value: float):
+        """LLMClient connection listener (see src/llm/connections.py)."""
+        if event == "in_flight":
+            self._http_in_flight.labels(provider).set(value)
+        elif event == "saturation":
+            self._http_saturation.labels(provider).set(value)
+        else:
+            if event == "connect":
+                self._http_connections.labels(provider).inc()
+            self._http_setup_seconds.labels(provider, event).observe(value)
+
+    def record_scheduler_event(self, model: str, priority: Optional[str], event: str, value: float):
+        """LLMClient scheduler listener (see src/llm/scheduler.py)."""
+        if event == "limit":
+            self._llm_concurrency_limit.labels(model).set(value)
+        elif event == "shed":
+            self._llm_shed.labels(model, priority).inc()
+            self._llm_queue_seconds.labels(model, priority).observe(value)
+        else:
+            self._llm_queue_seconds.labels(model, priority).observe(value)
+
+    def record_routing_mode(self, old: str, new: str, reason: str = ""):
+        """LoadAwareRouter mode listener."""
+        if old != new:
+            self._routing_mode_changes.labels(old, new).inc()
+            self._routing_mode.labels(old).set(0)
+        self._routing_mode.labels(new).set(1)
+
+    def record_llm_usage(self, model: str, usage: Dict[str, Any]):
+        """LLMClient usage listener."""
+        self._llm_tokens.labels(model, "prompt").inc(usage.get("prompt_tokens") or 0)
+        self._llm_tokens.labels(model, "completion").inc(usage.get("completion_tokens") or 0)
+        # Prompt tokens served from the provider's prefix cache (a subset of prompt_tokens)
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+        self._llm_tokens.labels(model, "cached_prompt").inc(cached)
+
+    def record_prompt_tokens(self, risk_level: str, tokens: int):
+        self._prompt_tokens.labels(risk_level).observe(tokens)
+
+    def record_context_tokens(self, tokens: int, items_used: int, items_total: int):
+        self._context_tokens.observe(tokens)
+        self._context_items_dropped.inc(items_total - items_used)
 
-    def log_request(self, latency_ms: float, risk_level: str, model: str):
-        logger.info(f"REQUEST METRICS: latency={latency_ms}ms risk={risk_level} model={model}")
+    def render_metrics(self) -> str:
+        return self.metrics.render()
 
     def log_classification(self, user_id: str, input_hash: str, risk_dcit: Dict[str, Any]):
         logger.info(f"CLASSIFICATION: user={user_id} risk={risk_dcit.get('risk_level')}")
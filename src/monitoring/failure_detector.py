@@ -1,6 +1,19 @@
-import re
 from typing import List
 
+from src.orchestration.patterns import compile_rules
+
+# (pattern, failure label)
+EMOTIONAL_FAILURE_PATTERNS = [
+    # 1. False Reassurance
+    (r"everything will be (?:fine|okay)", "FALSE_REASSURANCE"),
+    # 2. Directive Advice
+    (r"you (?:should|must|need to) break up", "DIRECTIVE_ADVICE"),
+    # 3. Amateur Diagnosis
+    (r"you have (?:depression|anxiety|bpd)", "AMATEUR_DIAGNOSIS")
+]
+
+_emotional_failure_matcher = compile_rules(EMOTIONAL_FAILURE_PATTERNS)
+
 class FailureDetector:
     """
     Analyzes interactions for emotional and technical failures.
@@ -8,18 +21,4 @@ class FailureDetector:
     
     @staticmethod
     def detect_emotional_failure(response_text: str) -> List[str]:
-        failures = []
-        
-        # 1. False Reassurance
-        if re.search(r"everything will be (fine|okay)", response_text, re.IGNORECASE):
-            failures.append("FALSE_REASSURANCE")
-            
-        # 2. Directive Advice
-        if re.search(r"you (should|must|need to) break up", response_text, re.IGNORECASE):
-            failures.append("DIRECTIVE_ADVICE")
-            
-        # 3. Amateur Diagnosis
-        if re.search(r"you have (depression|anxiety|bpd)", response_text, re.IGNORECASE):
-            failures.append("AMATEUR_DIAGNOSIS")
-            
-        return failures
+        return _emotional_failure_matcher.matched_labels(response_text)
@@ -0,0 +1,40 @@
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Dict, Iterator, TypeVar
+
+T = TypeVar("T")
+
+class StageTimer:
+    """
+    Collects per-stage wall-clock timings (ms) for a single request.
+    Stages that run concurrently are timed independently, so their sum can
+    exceed the request latency.
+    """
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+
+    def _record(self, name: str, started: float):
+        elapsed = (time.perf_counter() - started) * 1000
+        self.timings[name] = self.timings.get(name, 0.0) + elapsed
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, started)
+
+    async def timed(self, name: str, awaitable: Awaitable[T]) -> T:
+        """Await `awaitable` and record how long it took (works inside tasks)."""
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self._record(name, started)
+
+    def mark(self, name: str):
+        """Record the time elapsed since the request started (e.g. first token)."""
+        self.timings[name] = (time.perf_counter() - self._start) * 1000
@@ -0,0 +1,327 @@
+"""
+Batch safety scoring for offline audit and replay.
+
+    python -m src.orchestration.batch_scoring responses.jsonl --field response
+    python -m src.orchestration.batch_scoring export.parquet --field text --workers 8 --out hits.npy
+
+Re-runs every Layer 1 / Layer 2 rule, the diagnostic-language check and the
+emotional-failure detector over a file of texts and reports hit rates per rule
+and per check. Input is read in chunks (JSONL, Parquet with pyarrow installed,
+CSV or plain text lines) and scored on a process pool. `--out` saves the
+packed per-text rule bitmask (see RuleCatalog.score); `--verify N` checks the
+first N texts against the per-string methods the service uses.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.orchestration.patterns import PatternSet, Rule
+from src.orchestration.safety import SafetyGuardrails
+from src.orchestration.hallucination_controls import DIAGNOSTIC_PATTERNS, HallucinationControls
+from src.monitoring.failure_detector import EMOTIONAL_FAILURE_PATTERNS, FailureDetector
+
+logger = logging.getLogger(__name__)
+
+# Texts of a chunk are scanned as one string joined with this. No shipped rule
+# can match across it; hits that would span two texts are dropped anyway.
+SEPARATOR = "\n\x00\n"
+
+DEFAULT_CHUNK_SIZE = 2000
+
+# A chunk for a worker: ("jsonl", field, raw lines) is parsed in the worker,
+# ("texts", None, texts) is scored as-is.
+Chunk = Tuple[str, Optional[str], List[str]]
+
+
+class RuleCatalog:
+    """
+    Every audited rule, grouped by the check it belongs to, scored a chunk at a time.
+
+    Bit i of a text's row is rule i of `rule_ids` (np.packbits order), so a
+    catalog with R rules stores ceil(R / 8) bytes per text.
+
+    A chunk's texts are lowercased and joined once, and each rule runs one C
+    regex pass over the whole chunk; per-text Python work is limited to the
+    few texts that hit. Rules with uppercase in the pattern (e.g. `\\S`) run
+    with IGNORECASE on the original text instead, and texts whose length
+    changes when lowercased go through PatternSet.scan one by one.
+    """
+
+    def __init__(self, groups: Sequence[Tuple[str, Sequence[Rule]]]):
+        rules: List[Tuple[str, str]] = []
+        self.groups: Dict[str, Tuple[int, int]] = {}
+        for name, group_rules in groups:
+            start = len(rules)
+            for rule in group_rules:
+                pattern, label = (rule, rule) if isinstance(rule, str) else rule
+                rules.append((pattern, f"{name}:{label}"))
+            self.groups[name] = (start, len(rules))
+        self.rule_ids = [label for _, label in rules]
+        self.row_bytes = (len(rules) + 7) // 8
+        self.pattern_set = PatternSet(rules)
+        # (regex, runs on the lowercased text)
+        self._passes = [
+            (re.compile(pattern), True) if pattern == pattern.lower() else (re.compile(pattern, re.IGNORECASE), False)
+            for pattern, _ in rules
+        ]
+
+    @classmethod
+    def default(cls) -> "RuleCatalog":
+        """The rules the service currently ships."""
+        guardrails = SafetyGuardrails()
+        return cls([
+            ("input_crisis", guardrails.crisis_keywords),
+            ("input_prohibited", guardrails.prohibited_topics),
+            ("response_forbidden", guardrails.forbidden_response_patterns),
+            ("diagnostic", DIAGNOSTIC_PATTERNS),
+            ("emotional_failure", EMOTIONAL_FAILURE_PATTERNS),
+        ])
+
+    def __len__(self) -> int:
+        return len(self.rule_ids)
+
+    def score(self, texts: Sequence[str]) -> np.ndarray:
+        """Packed rule hits: a uint8 array of shape (len(texts), ceil(rules / 8))."""
+        hits = np.zeros((len(texts), len(self.rule_ids)), dtype=bool)
+        if not texts:
+            return np.packbits(hits, axis=1)
+
+        lowered = [text.lower() for text in texts]
+        for row, (text, low) in enumerate(zip(texts, lowered)):
+            if len(low) != len(text):
+                # Positions would drift between the two joined strings
+                hits[row, [hit.index for hit in self.pattern_set.scan(text)]] = True
+                lowered[row] = ""
+        originals = [text if low or not text else "" for text, low in zip(texts, lowered)]
+
+        lengths = np.fromiter((len(t) for t in lowered), dtype=np.int64, count=len(texts))
+        starts = np.concatenate(([0], np.cumsum(lengths[:-1] + len(SEPARATOR))))
+        joined_lower = SEPARATOR.join(lowered)
+        joined = None
+
+        found_rules: List[int] = []
+        found_spans: List[Tuple[int, int]] = []
+        for index, (regex, folded) in enumerate(self._passes):
+            if not folded and joined is None:
+                joined = SEPARATOR.join(originals)
+            for m in regex.finditer(joined_lower if folded else joined):
+                found_rules.append(index)
+                found_spans.append(m.span())
+        if found_spans:
+            spans = np.array(found_spans, dtype=np.int64)
+            rules = np.array(found_rules, dtype=np.int64)
+            rows = np.searchsorted(starts, spans[:, 0], side="right") - 1
+            inside = spans[:, 1] <= starts[rows] + lengths[rows]
+            hits[rows[inside], rules[inside]] = True
+        return np.packbits(hits, axis=1)
+
+    def unpack(self, bits: np.ndarray) -> np.ndarray:
+        """(texts, rules) boolean matrix from packed rows."""
+        return np.unpackbits(bits, axis=1, count=len(self.rule_ids)).astype(bool)
+
+    def group_hits(self, unpacked: np.ndarray, group: str) -> np.ndarray:
+        """Per text: did any rule of `group` fire."""
+        start, end = self.groups[group]
+        return unpacked[:, start:end].any(axis=1)
+
+
+_worker_catalog: Optional[RuleCatalog] = None
+
+
+def _catalog() -> RuleCatalog:
+    # Built once per worker process
+    global _worker_catalog
+    if _worker_catalog is None:
+        _worker_catalog = RuleCatalog.default()
+    return _worker_catalog
+
+
+def _texts_of(chunk: Chunk) -> List[str]:
+    kind, field, items = chunk
+    if kind == "texts":
+        return [text or "" for text in items]
+    texts = []
+    for line in items:
+        value = json.loads(line).get(field) if line.strip() else None
+        texts.append(value if isinstance(value, str) else "")
+    return texts
+
+
+def score_chunk(chunk: Chunk) -> np.ndarray:
+    return _catalog().score(_texts_of(chunk))
+
+
+def score_chunks(chunks: Iterable[Chunk], workers: int) -> Iterator[np.ndarray]:
+    """Packed hits per chunk, in input order. At most 2 x `workers` chunks are in memory."""
+    if workers <= 1:
+        for chunk in chunks:
+            yield score_chunk(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending: deque = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(score_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def score_texts(texts: Iterable[str], chunk_size: int = DEFAULT_CHUNK_SIZE, workers: int = 1) -> np.ndarray:
+    """Packed rule hits for an iterable (or column) of texts, in order."""
+    parts = list(score_chunks(_batched(texts, chunk_size), workers))
+    if not parts:
+        return np.zeros((0, _catalog().row_bytes), dtype=np.uint8)
+    return np.concatenate(parts)
+
+
+def _batched(texts: Iterable[str], chunk_size: int) -> Iterator[Chunk]:
+    batch: List[str] = []
+    for text in texts:
+        batch.append(text)
+        if len(batch) >= chunk_size:
+            yield ("texts", None, batch)
+            batch = []
+    if batch:
+        yield ("texts", None, batch)
+
+
+def read_chunks(path: str, field: str, chunk_size: int) -> Iterator[Chunk]:
+    """Chunks of a JSONL, Parquet, CSV or plain-text (one text per line) file."""
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix == ".parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Reading Parquet needs pyarrow (pip install pyarrow)")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=[field]):
+            yield ("texts", None, batch.column(0).to_pylist())
+        return
+
+    with open(path, encoding="utf-8", newline="" if suffix == ".csv" else None) as f:
+        if suffix == ".csv":
+            yield from _batched((row.get(field) or "" for row in csv.DictReader(f)), chunk_size)
+        elif suffix in (".jsonl", ".json", ".ndjson"):
+            lines: List[str] = []
+            for line in f:
+                lines.append(line)
+                if len(lines) >= chunk_size:
+                    yield ("jsonl", field, lines)
+                    lines = []
+            if lines:
+                yield ("jsonl", field, lines)
+        else:
+            yield from _batched((line.rstrip("\n") for line in f), chunk_size)
+
+
+def _reference_row(text: str) -> Dict[str, Any]:
+    """What the per-string service methods say about `text`."""
+    guardrails = SafetyGuardrails()
+    return {
+        "risk_type": guardrails.detect_input_risk(text)["risk_type"],
+        "response_valid": guardrails.validate_response(text)[0],
+        "diagnostic": HallucinationControls.detect_diagnostic_language(text),
+        "emotional_failures": sorted(FailureDetector.detect_emotional_failure(text)),
+    }
+
+
+def _derived_row(catalog: RuleCatalog, unpacked_row: np.ndarray) -> Dict[str, Any]:
+    """The same answers, derived from one text's rule bits."""
+    row = unpacked_row[None, :]
+    if catalog.group_hits(row, "input_crisis")[0]:
+        risk_type = "CRISIS"
+    elif catalog.group_hits(row, "input_prohibited")[0]:
+        risk_type = "PROHIBITED"
+    else:
+        risk_type = "NONE"
+    start, end = catalog.groups["emotional_failure"]
+    return {
+        "risk_type": risk_type,
+        "response_valid": not catalog.group_hits(row, "response_forbidden")[0],
+        "diagnostic": bool(catalog.group_hits(row, "diagnostic")[0]),
+        "emotional_failures": sorted(
+            catalog.rule_ids[i].split(":", 1)[1] for i in range(start, end) if unpacked_row[i]
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-run the safety rules over a file of texts and report hit rates.")
+    parser.add_argument("path", help=".jsonl, .parquet, .csv, or plain text with one text per line")
+    parser.add_argument("--field", default="text", help="JSON key / column holding the text")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--out", help="save the packed per-text rule bitmask here (.npy)")
+    parser.add_argument("--verify", type=int, default=0, metavar="N",
+                        help="compare the first N texts against the per-string methods")
+    args = parser.parse_args()
+
+    catalog = _catalog()
+    rule_counts = np.zeros(len(catalog), dtype=np.int64)
+    group_counts = {name: 0 for name in catalog.groups}
+    total = 0
+    kept: List[np.ndarray] = []
+    verify_texts: List[str] = []
+    verify_bits: List[np.ndarray] = []
+
+    def chunks() -> Iterator[Chunk]:
+        for chunk in read_chunks(args.path, args.field, args.chunk_size):
+            if len(verify_texts) < args.verify:
+                verify_texts.extend(_texts_of(chunk)[:args.verify - len(verify_texts)])
+            yield chunk
+
+    started = time.perf_counter()
+    for bits in score_chunks(chunks(), args.workers):
+        unpacked = catalog.unpack(bits)
+        total += len(bits)
+        rule_counts += unpacked.sum(axis=0)
+        for name in catalog.groups:
+            group_counts[name] += int(catalog.group_hits(unpacked, name).sum())
+        if args.out:
+            kept.append(bits)
+        if sum(len(b) for b in verify_bits) < args.verify:
+            verify_bits.append(unpacked)
+    elapsed = time.perf_counter() - started
+
+    rate = lambda count: count / total if total else 0.0
+    print(f"texts={total} rules={len(catalog)} workers={args.workers} "
+          f"elapsed={elapsed:.2f}s ({total / elapsed if elapsed else 0:.0f} texts/s)")
+    print()
+    print(f"{'check':<40}{'hits':>12}{'rate':>10}")
+    for name, count in group_counts.items():
+        print(f"{name:<40}{count:>12}{rate(count):>10.3%}")
+    print()
+    print(f"{'rule':<40}{'hits':>12}{'rate':>10}")
+    for rule_id, count in zip(catalog.rule_ids, rule_counts):
+        print(f"{rule_id:<40}{int(count):>12}{rate(int(count)):>10.3%}")
+
+    if args.out:
+        packed = np.concatenate(kept) if kept else np.zeros((0, catalog.row_bytes), dtype=np.uint8)
+        np.save(args.out, packed)
+        with open(os.path.splitext(args.out)[0] + ".rules.json", "w", encoding="utf-8") as f:
+            json.dump(catalog.rule_ids, f, indent=2)
+        print(f"\nbitmask: {args.out} ({packed.nbytes} bytes), rule order in {os.path.splitext(args.out)[0]}.rules.json")
+
+    if args.verify:
+        unpacked = np.concatenate(verify_bits)[:len(verify_texts)] if verify_bits else np.zeros((0, len(catalog)), bool)
+        mismatches = []
+        for i, text in enumerate(verify_texts):
+            expected, got = _reference_row(text), _derived_row(catalog, unpacked[i])
+            if expected != got:
+                mismatches.append((i, expected, got))
+        print(f"\nverify: {len(verify_texts)} texts, {len(mismatches)} mismatches against the per-string methods")
+        for i, expected, got in mismatches[:10]:
+            print(f"  #{i}: expected {expected}, got {got}")
+
+
+if __name__ == "__main__":
+    main()
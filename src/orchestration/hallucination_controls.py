@@ -1,4 +1,23 @@
-import re
+from src.orchestration.patterns import compile_rules
+
+# (pattern, replacement)
+HUMILITY_REWRITES = [
+    (r"He is feeling", "It sounds like he might be feeling"),
+    (r"She thinks", "It's possible she thinks"),
+    (r"This means", "This could mean"),
+    (r"You will", "You might")
+]
+
+DIAGNOSTIC_PATTERNS = [
+    r"narcissist",
+    r"bipolar",
+    r"borderline",
+    r"sociopath",
+    r"gaslighting" # Context dependent, but often misused
+]
+
+_humility_matcher = compile_rules(HUMILITY_REWRITES)
+_diagnostic_matcher = compile_rules(DIAGNOSTIC_PATTERNS)
 
 class HallucinationControls:
     """
@@ -12,31 +31,9 @@ class HallucinationControls:
         """
         # Simple string replacements for demonstration.
         # In production, this might be another LLM pass or strict grammar rules.
-        
-        replacements = [
-            (r"He is feeling", "It sounds like he might be feeling"),
-            (r"She thinks", "It's possible she thinks"),
-            (r"This means", "This could mean"),
-            (r"You will", "You might")
-        ]
-        
-        processed_text = text
-        for pattern, replacement in replacements:
-            # Simple replace doesn't handle context well, using RegEx sub for start of sentences
-            processed_text = re.sub(pattern, replacement, processed_text, flags=re.IGNORECASE)
-            
-        return processed_text
+        # All rewrites are applied in a single pass; the rule label is the replacement.
+        return _humility_matcher.sub(text, lambda hit: hit.label)
 
     @staticmethod
     def detect_diagnostic_language(text: str) -> bool:
-        patterns = [
-            r"narcissist",
-            r"bipolar",
-            r"borderline",
-            r"sociopath",
-            r"gaslighting" # Context dependent, but often misused
-        ]
-        for p in patterns:
-            if re.search(p, text, re.IGNORECASE):
-                return True
-        return False
+        return _diagnostic_matcher.any(text)
@@ -0,0 +1,209 @@
+from typing import Dict, Iterable, List, NamedTuple, Sequence, Tuple
+
+from src.orchestration.patterns import Rule
+
+_METACHARS = set(".^$*+?{}[]|()\\")
+
+
+class KeywordMatch(NamedTuple):
+    index: int              # position of the rule in its rule set
+    label: str
+    end: int                # offset just past the match, counted from the start of the scanned stream
+
+
+def is_literal(pattern: str) -> bool:
+    """True if `pattern` is a plain keyword that matches only itself."""
+    return bool(pattern) and not any(c in _METACHARS for c in pattern)
+
+
+def _compiled_backend():
+    try:
+        import ahocorasick # optional: pip install pyahocorasick
+    except ImportError:
+        return None
+    return ahocorasick
+
+
+class _FoldTable(dict):
+    """
+    str.translate table folding each character on its own, the way re.IGNORECASE
+    compares them: "İ", "ı" and "i" all fold to "i", "ſ" to "s". Unlike
+    str.lower() it never changes the length, so offsets need no remapping.
+    """
+
+    def __missing__(self, codepoint: int) -> str:
+        ch = chr(codepoint)
+        upper = ch.upper()
+        if len(upper) == 1 and len(upper.lower()) == 1:
+            folded = upper.lower()
+        else:
+            folded = ch.lower()[0] # "İ".lower() is "i" plus a combining dot
+        self[codepoint] = folded
+        return folded
+
+
+_FOLD_TABLE = _FoldTable()
+
+
+def fold(text: str) -> str:
+    """Case-folded `text`, character for character (same length)."""
+    return text.lower() if text.isascii() else text.translate(_FOLD_TABLE)
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over case-insensitive literal keywords.
+
+    Built once; every match is found in a single left-to-right pass, whatever
+    the number of keywords. `scanner()` returns an independent stateful
+    scanner that consumes a stream chunk by chunk in O(chunk) time, so a
+    streamed text is never rescanned.
+
+    Uses pyahocorasick when it is installed (backend "auto"), otherwise the
+    pure-Python automaton. Both report the same matches.
+    """
+
+    def __init__(self, rules: Sequence[Rule], backend: str = "auto"):
+        self.keywords: List[str] = []
+        self.labels: List[str] = []
+        for rule in rules:
+            pattern, label = (rule, rule) if isinstance(rule, str) else rule
+            if not is_literal(pattern):
+                raise ValueError(f"Not a plain keyword: {pattern!r}")
+            self.keywords.append(fold(pattern))
+            self.labels.append(label)
+        self.max_length = max((len(k) for k in self.keywords), default=0)
+
+        module = _compiled_backend() if backend in ("auto", "pyahocorasick") else None
+        if backend == "pyahocorasick" and module is None:
+            raise ImportError("The pyahocorasick backend needs `pip install pyahocorasick`")
+        self.backend = "pyahocorasick" if module is not None else "python"
+
+        if module is not None:
+            self._automaton = module.Automaton()
+            for keyword, indexes in self._by_keyword().items():
+                self._automaton.add_word(keyword, indexes)
+            self._automaton.make_automaton()
+        else:
+            self._build()
+
+    def _by_keyword(self) -> Dict[str, Tuple[int, ...]]:
+        by_keyword: Dict[str, Tuple[int, ...]] = {}
+        for i, keyword in enumerate(self.keywords):
+            by_keyword[keyword] = by_keyword.get(keyword, ()) + (i,)
+        return by_keyword
+
+    def _build(self):
+        # State 0 is the root; `_out[s]` holds the rules ending at s, including via fail links
+        self._goto: List[Dict[str, int]] = [{}]
+        self._out: List[Tuple[int, ...]] = [()]
+        for keyword, indexes in self._by_keyword().items():
+            state = 0
+            for ch in keyword:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = self._goto[state][ch] = len(self._goto)
+                    self._goto.append({})
+                    self._out.append(())
+                state = nxt
+            self._out[state] = indexes
+
+        # Fail links folded into a full transition table (a DFA), so scanning
+        # costs one dict lookup per character; missing entries go to the root
+        fail = [0] * len(self._goto)
+        self._delta: List[Dict[str, int]] = [dict(self._goto[0])] + [{} for _ in self._goto[1:]]
+        queue = list(self._goto[0].values())
+        for state in queue: # breadth first, so fail targets are finished first
+            self._delta[state] = {**self._delta[fail[state]], **self._goto[state]}
+            for ch, nxt in self._goto[state].items():
+                target = self._delta[fail[state]].get(ch, 0)
+                fail[nxt] = target
+                self._out[nxt] = tuple(sorted(self._out[nxt] + self._out[target]))
+                queue.append(nxt)
+
+    def __len__(self) -> int:
+        return len(self.keywords)
+
+    def scanner(self) -> "KeywordScanner":
+        return KeywordScanner(self)
+
+    def find_all(self, text: str) -> List[KeywordMatch]:
+        """Every match in `text`, in order of end position."""
+        return self.scanner().feed(text)
+
+    def matched_labels(self, text: str) -> List[str]:
+        """Labels of all rules that fired, in rule order, without duplicates."""
+        indexes = sorted({m.index for m in self.find_all(text)})
+        return [self.labels[i] for i in indexes]
+
+    def any(self, text: str) -> bool:
+        return bool(self.find_all(text))
+
+
+class KeywordScanner:
+    """Incremental scan state for one stream; see KeywordAutomaton.scanner."""
+
+    def __init__(self, automaton: KeywordAutomaton):
+        self.automaton = automaton
+        self.position = 0 # characters consumed so far
+        self._state = 0
+        self._tail = "" # compiled backend: folded text a match may still start in
+
+    def feed(self, chunk: str) -> List[KeywordMatch]:
+        """Consume `chunk`; returns the matches that complete inside it."""
+        folded = fold(chunk)
+        base = self.position
+        self.position += len(chunk)
+        if self.automaton.backend == "python":
+            return self._feed_python(folded, base)
+        return self._feed_compiled(folded, base)
+
+    def _feed_python(self, folded: str, base: int) -> List[KeywordMatch]:
+        automaton = self.automaton
+        delta, out, labels = automaton._delta, automaton._out, automaton.labels
+        matches: List[KeywordMatch] = []
+        state = self._state
+        for offset, ch in enumerate(folded):
+            state = delta[state].get(ch, 0)
+            if out[state]:
+                matches.extend(KeywordMatch(i, labels[i], base + offset + 1) for i in out[state])
+        self._state = state
+        return matches
+
+    def _feed_compiled(self, folded: str, base: int) -> List[KeywordMatch]:
+        # pyahocorasick can't carry state between calls: rescan only the last
+        # max_length - 1 characters, which a match ending in `folded` may start in
+        automaton = self.automaton
+        text = self._tail + folded
+        skip = len(self._tail)
+        matches: List[KeywordMatch] = []
+        if automaton.max_length:
+            for last, indexes in automaton._automaton.iter(text):
+                offset = last - skip
+                if offset < 0:
+                    continue
+                matches.extend(KeywordMatch(i, automaton.labels[i], base + offset + 1) for i in indexes)
+            self._tail = text[-(automaton.max_length - 1):] if automaton.max_length > 1 else ""
+        matches.sort(key=lambda m: (m.end, m.index))
+        return matches
+
+    def reset(self):
+        self.position = 0
+        self._state = 0
+        self._tail = ""
+
+
+_REGISTRY: Dict[Tuple[Tuple[Tuple[str, str], ...], str], KeywordAutomaton] = {}
+
+
+def compile_keywords(rules: Iterable[Rule], backend: str = "auto") -> KeywordAutomaton:
+    """
+    Return the KeywordAutomaton for `rules`, building it only once per process.
+    """
+    normalized = tuple((r, r) if isinstance(r, str) else tuple(r) for r in rules)
+    key = (normalized, backend)
+    automaton = _REGISTRY.get(key)
+    if automaton is None:
+        automaton = KeywordAutomaton(normalized, backend)
+        _REGISTRY[key] = automaton
+    return automaton
@@ -1,47 +1,298 @@
 import asyncio
 import logging
 import time
+from contextlib import aclosing
 from uuid import UUID
-from typing import Optional, Dict
+from typing import Optional, Dict, Any, AsyncIterator, List, Union
 
 from src.llm.client import LLMClient
-from src.llm import prompts
+from src.llm.scheduler import LLMOverloadedError
+from src.llm import prompt_assembly
 from src.orchestration.safety import SafetyGuardrails
+from src.orchestration.risk_classifier import LocalRiskClassifier
 from src.orchestration.hallucination_controls import HallucinationControls
+from src.orchestration.streaming import StreamingResponseGuard
 from src.memory.retrieval import MemoryRetrieval
 from src.memory.summarizer import MemorySummarizer
+from src.memory.worker import MemoryUpdateWorker
 from src.cost.optimizer import CostOptimizer
-from src.cost.router import ModelRouter
-from src.cost.cache import ResponseCache
+from src.cost.budget import usage_owner
+from src.cost import tokens
+from src.cost.router import LoadAwareRouter
+from src.cost.cache import ResponseCache, make_cache_key
+from src.cost.single_flight import SingleFlight
+from src.cost.semantic_cache import SemanticResponseCache
 from src.database.client import DatabaseClient
 from src.monitoring.client import MonitoringClient
+from src.monitoring.timing import StageTimer
+from config.settings import get_settings
+
+settings = get_settings()
 
 logger = logging.getLogger(__name__)
 
+LAYER2_FALLBACK_RESPONSE = "I apologize, but I frame my response poorly. Let me try again."
+TECHNICAL_DIFFICULTIES_RESPONSE = "I am currently experiencing technical difficulties. Please try again later."
+MAX_RESPONSE_TOKENS = 300 # Strict output limit (lower in degraded routing modes)
+OVERLOADED_RESPONSE = "I'm receiving a lot of messages right now. Please try again in a moment."
+
+def _discard_task(task: asyncio.Task):
+    """Cancel a fanned-out task that is no longer needed, or reap its exception."""
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled():
+        task.exception()
+
 class ConversationOrchestrator:
     def __init__(self):
+        self.monitor = MonitoringClient()
         self.llm = LLMClient()
         self.db = DatabaseClient()
         self.safety = SafetyGuardrails()
+        self.risk_classifier = LocalRiskClassifier()
         self.hallucination = HallucinationControls()
-        self.memory_retrieval = MemoryRetrieval(self.db)
+        self.memory_retrieval = MemoryRetrieval(self.db, self.monitor)
         self.memory_summarizer = MemorySummarizer(self.llm)
+        self.cache = ResponseCache(self.monitor)
+        self.memory_worker = MemoryUpdateWorker(self.memory_summarizer, self.db, self.monitor, self.cache)
         self.cost_opt = CostOptimizer()
-        self.cache = ResponseCache()
-        self.monitor = MonitoringClient()
+        # Degradation modes from live latency, error-rate and budget signals
+        self.router = LoadAwareRouter(self.cost_opt.budget_remaining)
+        self.router.add_listener(self.monitor.record_routing_mode)
+        self.monitor.record_routing_mode(self.router.mode, self.router.mode)
+        # Charge actual token usage reported by the provider
+        self.llm.add_usage_listener(self.cost_opt.record_llm_usage)
+        self.llm.add_usage_listener(self.monitor.record_llm_usage)
+        self.llm.add_retry_listener(self.monitor.record_llm_retry)
+        self.llm.add_provider_listener(self.monitor.record_provider_event)
+        self.llm.add_connection_listener(self.monitor.record_http_event)
+        self.llm.add_scheduler_listener(self.monitor.record_scheduler_event)
+        # Identical messages classified concurrently share one LLM call
+        self.classification_flight = SingleFlight(
+            (lambda: self.cache.redis) if settings.SINGLE_FLIGHT_DISTRIBUTED else None, namespace="sf:classify"
+        )
+        self.semantic_cache = SemanticResponseCache(self.cache, self.llm)
         
+    async def startup(self):
+        """
+        Open connections on the serving event loop (ASGI lifespan startup).
+        """
+        try:
+            await self.db.connect()
+        except Exception:
+            # DatabaseClient reconnects lazily on first use
+            self.monitor.log_error("Orchestrator", "Database unavailable at startup")
+        # Memory change notifications for the context cache (retried lazily if this fails)
+        await self.memory_retrieval.start()
+        # TCP + TLS to the LLM providers now rather than on the first requests
+        await self.llm.prewarm()
+
+    async def shutdown(self):
+        """
+        Drain memory updates, flush usage and close connections (ASGI lifespan shutdown).
+        """
+        for name, close in [
+            # Drained first: it still needs the LLM, budget and database
+            ("MemoryUpdateWorker", self.memory_worker.close),
+            ("CostOptimizer", self.cost_opt.close),
+            ("SemanticResponseCache", self.semantic_cache.close),
+            ("ResponseCache", self.cache.close),
+            ("DatabaseClient", self.db.close),
+            ("LLMClient", self.llm.close),
+        ]:
+            try:
+                await close()
+            except Exception as e:
+                self.monitor.log_error(name, f"Shutdown failed: {e}")
+
     async def process_message(self, user_id: UUID, message: str, session_id: str) -> str:
         start_time = time.time()
-        risk_level = "UNKNOWN"
-        model_used = "NONE"
+        state = {"risk_level": "UNKNOWN", "model_used": "NONE"}
+        timer = StageTimer()
+        owner_token = usage_owner.set(str(user_id))
         
         try:
-            # 1. Input Validation & Budget Check
-            if not self.cost_opt.check_budget(str(user_id)):
-                return "I'm sorry, I cannot process your request at this time due to usage limits."
+            plan = await self._prepare_generation(
+                user_id, message, session_id, state, timer,
+                speculate=settings.SPECULATIVE_GENERATION
+            )
+            if isinstance(plan, str):
+                return plan
+
+            # 8-10 (+12). Concurrent LOW_RISK misses for the same cache key share
+            # one generation instead of each calling the LLM
+            if plan["risk_level"] == "LOW_RISK":
+                final_response = await self.cache.single_flight.do(
+                    plan["cache_lookup"].key,
+                    lambda: self._generate_and_cache(plan, timer)
+                )
+                if plan["draft"] is not None and not plan["draft_consumed"]:
+                    # Another request generated this answer; our draft is redundant
+                    self._discard_speculative_draft(plan["draft"])
+            else:
+                final_response = await self._generate_checked(plan, timer)
+
+            if final_response is None:
+                return LAYER2_FALLBACK_RESPONSE # Simplified retry logic
+
+            # 11. Async Memory Update
+            self._schedule_memory_update(user_id, message, final_response)
+            return final_response
+
+        except LLMOverloadedError as e:
+            logger.warning(f"Request shed: {e}")
+            return self._overloaded_response(state["risk_level"])
+
+        except Exception as e:
+            import traceback
+            logger.error(f"Orchestrator error: {e}")
+            traceback.print_exc()
+            self.monitor.log_error("Orchestrator", str(e))
+            return TECHNICAL_DIFFICULTIES_RESPONSE
+            
+        finally:
+            usage_owner.reset(owner_token)
+            latency = (time.time() - start_time) * 1000
+            self.monitor.log_request(latency, state["risk_level"], state["model_used"], timer.timings)
+
+    async def process_message_stream(self, user_id: UUID, message: str, session_id: str) -> AsyncIterator[str]:
+        """
+        Streaming variant of process_message: yields response text as it is generated.
+
+        Layer 2 validation and epistemic humility run on a sentence-buffered window
+        (see StreamingResponseGuard), so only checked sentences reach the client.
+        Short-circuit responses (budget, Layer 1, cache hits) are yielded as one chunk.
+        """
+        start_time = time.time()
+        state = {"risk_level": "UNKNOWN", "model_used": "NONE"}
+        timer = StageTimer()
+        # Not reset: a streaming generator may be resumed from different contexts
+        usage_owner.set(str(user_id))
+        released = [] # checked segments already sent to the client
+
+        try:
+            plan = await self._prepare_generation(user_id, message, session_id, state, timer)
+            if isinstance(plan, str):
+                yield plan
+                return
+
+            if plan["risk_level"] == "LOW_RISK" and self.cache.single_flight.in_flight(plan["cache_lookup"].key):
+                # A blocking request is already generating this answer: wait for it
+                # rather than streaming a duplicate (None = Layer 2 blocked it)
+                shared = await self.cache.single_flight.do(plan["cache_lookup"].key, lambda: None)
+                if shared is None:
+                    yield LAYER2_FALLBACK_RESPONSE
+                    return
+                yield shared
+                self._schedule_memory_update(user_id, message, shared)
+                return
 
+            # 8-10. Streamed generation with incremental Layer 2 + humility checks
+            guard = StreamingResponseGuard(self.safety, self.hallucination)
+            stream = self.llm.stream_response(
+                model=plan["model"],
+                messages=plan["messages"],
+                max_tokens=plan["max_tokens"],
+                priority=plan["risk_level"]
+            )
+            started = time.perf_counter()
+            # Time spent suspended in `yield` is the client reading, not the model
+            # generating; it is left out of the router's latency signal
+            suspended = 0.0
+            try:
+                with timer.stage("generate"):
+                    async with aclosing(stream):
+                        async for delta in stream:
+                            for segment in guard.feed(delta):
+                                if not released:
+                                    timer.mark("first_token")
+                                released.append(segment)
+                                yielded_at = time.perf_counter()
+                                yield segment
+                                suspended += time.perf_counter() - yielded_at
+                            if guard.is_blocked:
+                                break
+            except Exception:
+                self.router.observe_generation(plan["model"], time.perf_counter() - started - suspended, ok=False)
+                raise
+            self.router.observe_generation(plan["model"], time.perf_counter() - started - suspended, ok=True)
+
+            for segment in guard.flush():
+                released.append(segment)
+                yield segment
+
+            # Layer 1 keywords in the model's own output (found incrementally, per delta)
+            for risk_type in guard.keyword_hits:
+                self.monitor.increment(f"stream_output_{risk_type.lower()}_keyword")
+
+            if guard.is_blocked:
+                logger.warning(f"Streamed response blocked by Layer 2: {guard.blocked_reason}")
+                self.monitor.record_layer2_block(guard.blocked_reason, mode="stream")
+                yield LAYER2_FALLBACK_RESPONSE
+                return
+
+            try:
+                await self._finalize_response(user_id, message, "".join(released), plan)
+            except Exception as e:
+                # The client already has the whole answer; only the bookkeeping failed
+                logger.error(f"Post-stream update failed: {e}")
+                self.monitor.log_error("Orchestrator", f"Post-stream update failed: {e}")
+
+        except LLMOverloadedError as e:
+            logger.warning(f"Request shed: {e}")
+            yield self._overloaded_response(state["risk_level"])
+
+        except Exception as e:
+            logger.error(f"Orchestrator stream error: {e}")
+            self.monitor.log_error("Orchestrator", str(e))
+            if not released:
+                # Once part of the answer is out, appending an apology would garble it
+                yield TECHNICAL_DIFFICULTIES_RESPONSE
+
+        finally:
+            latency = (time.time() - start_time) * 1000
+            self.monitor.log_request(latency, state["risk_level"], state["model_used"], timer.timings)
+
+    async def _prepare_generation(
+        self,
+        user_id: UUID,
+        message: str,
+        session_id: str,
+        state: Dict[str, str],
+        timer: StageTimer,
+        speculate: bool = False
+    ) -> Union[str, Dict[str, Any]]:
+        """
+        Steps 1-7 of the pipeline, shared by the blocking and streaming paths.
+
+        Returns either a final response string (short-circuit) or a generation plan:
+        {"model", "messages", "prompt_tokens", "max_tokens", "risk_level", "cache_lookup", "draft"}. With `speculate`,
+        "draft" may hold an in-flight generation task started before classification
+        finished, which the classifier agreed with.
+        """
+        # 1. Input Validation & Budget Check
+        within_budget = await timer.timed("budget", self.cost_opt.check_budget(str(user_id), session_id))
+        if not within_budget:
+            # Never let a limit hide crisis resources: Layer 1 needs no LLM call
+            if self.safety.detect_input_risk(message)["risk_type"] == "CRISIS":
+                self.monitor.alert_crisis(str(user_id), message)
+                await self.db.log_crisis_event(user_id, message)
+                return self.safety.get_hard_refusal("CRISIS")
+            return "I'm sorry, I cannot process your request at this time due to usage limits."
+        self.router.refresh()
+
+        # 5. Retrieval (fanned out early: it only depends on the user, not on classification)
+        async def _retrieve() -> str:
+            return await timer.timed("retrieve", self.memory_retrieval.get_context(user_id, session_id, message))
+
+        retrieval_task = asyncio.create_task(_retrieve())
+        classify_task = None
+        draft_task = None
+        prefetched_cache = None
+        try:
             # 2. Layer 1 Safety: Input Risk
-            input_safety = self.safety.detect_input_risk(message)
+            with timer.stage("layer1"):
+                input_safety = self.safety.detect_input_risk(message)
             if not input_safety["is_safe"]:
                 response = self.safety.get_hard_refusal(input_safety["risk_type"])
                 if input_safety["risk_type"] == "CRISIS":
@@ -49,94 +300,205 @@ class ConversationOrchestrator:
                     await self.db.log_crisis_event(user_id, message)
                 return response
 
-            # 3. Safety Classification
-            classification = await self.llm.classify_text(
-                message, 
-                prompts.get_classification_prompt(message)
-            )
+            # 3. Safety Classification: local model first, the LLM only for ambiguous messages
+            with timer.stage("classify_local"):
+                classification = self.risk_classifier.classify(message)
+            if classification is not None:
+                self.monitor.increment("local_classification")
+            elif self.router.skip_llm_classification():
+                # Critical routing mode: a conservative default, MEDIUM_RISK or higher
+                classification = self.risk_classifier.classify_degraded(message)
+                self.monitor.increment("llm_classification_skipped")
+            else:
+                if self.risk_classifier.enabled:
+                    self.monitor.increment("local_classification_deferred")
+
+                async def _classify() -> Dict[str, Any]:
+                    return await timer.timed("classify", self._classify_with_llm(message))
+
+                # Runs while retrieval is in flight
+                classify_task = asyncio.create_task(_classify())
+
+                # Speculative draft: generate with the common-case prompt while classifying
+                if speculate:
+                    context = await retrieval_task
+                    draft_task, prefetched_cache = await self._start_speculative_draft(user_id, message, context, timer)
+
+                classification = await classify_task
             risk_level = classification.get("risk_level", "MEDIUM_RISK")
+            state["risk_level"] = risk_level
             
             # 4. Model Routing
-            model_name = ModelRouter.get_model_for_risk_level(risk_level)
-            model_used = model_name
-
-            # 5. Retrieval
-            context = await self.memory_retrieval.get_context(user_id, session_id)
-
-            # 6. Cache Check (Low risk only)
-            if risk_level == "LOW_RISK":
-                # specific caching logic usually involves hashing prompt + context
-                # simplified here to message hash for demo
-                msg_hash = str(hash(message + context))
-                cached = await self.cache.get_cached_response(msg_hash)
-                if cached:
-                    logger.info("Cache hit")
-                    return cached
-
-            # 7. Select Prompt Variant
-            system_prompt = prompts.get_system_prompt()
-            user_prompt = prompts.get_response_prompt(risk_level, message, context)
-            
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
-
-            # 8. Generation
-            # Token budget adjustment could happen here
-            response_text = await self.llm.generate_response(
-                model=model_name,
-                messages=messages,
-                max_tokens=300 # Strict output limit
-            )
+            with timer.stage("route"):
+                model_name = self.router.get_model_for_risk_level(risk_level)
+                if self.router.is_downgrade(risk_level, model_name):
+                    self.monitor.increment("routing_model_downgraded")
+            state["model_used"] = model_name
 
-            # 9. Layer 2 Safety: Output Validation
-            is_valid, reason = self.safety.validate_response(response_text)
-            if not is_valid:
-                logger.warning(f"Response blocked by Layer 2: {reason}")
-                return "I apologize, but I frame my response poorly. Let me try again." # Simplified retry logic
+            if draft_task is not None and risk_level != settings.SPECULATIVE_RISK_LEVEL:
+                # Escalated (or de-escalated): the draft used the wrong prompt/model
+                self._discard_speculative_draft(draft_task)
+                draft_task = None
 
-            # 10. Hallucination Control
-            final_response = self.hallucination.enforce_epistemic_humility(response_text)
+            # The CRISIS prompt ignores context, so don't wait for retrieval
+            if risk_level == "CRISIS":
+                context = ""
+            else:
+                context = await retrieval_task
+        except BaseException:
+            if draft_task is not None:
+                self._discard_speculative_draft(draft_task)
+            raise
+        finally:
+            _discard_task(retrieval_task)
+            if classify_task is not None:
+                _discard_task(classify_task)
 
-            # 11. Async Memory Update
-            # We fire and forget the summary update to reduce latency
-            asyncio.create_task(self._async_memory_update(user_id, message, final_response))
+        # 6. Cache Check (Low risk only): exact digest, then semantic near-duplicate
+        cache_lookup = None
+        if risk_level == "LOW_RISK":
+            cache_lookup = prefetched_cache
+            if cache_lookup is None:
+                cache_lookup = await timer.timed("cache", self.semantic_cache.lookup(
+                    message, context, threshold=self.router.cache_threshold(), user_id=str(user_id)
+                ))
+            self.monitor.record_cache_lookup(cache_lookup.tier)
+            if cache_lookup.response:
+                logger.info(f"Cache hit ({cache_lookup.tier})")
+                if draft_task is not None:
+                    self._discard_speculative_draft(draft_task)
+                return cache_lookup.response
 
-            # 12. Cache Update
-            if risk_level == "LOW_RISK":
-                 await self.cache.cache_response(msg_hash, final_response, risk_level)
+        # 7. Select Prompt Variant
+        messages = self._build_messages(risk_level, message, context)
+        # A metric only: estimated without loading an encoding, so a tokenizer problem can't fail the request
+        prompt_tokens = tokens.approx_message_tokens(messages, model_name)
+        self.monitor.record_prompt_tokens(risk_level, prompt_tokens)
+        return {
+            "model": model_name,
+            "messages": messages,
+            "prompt_tokens": prompt_tokens,
+            "max_tokens": self.router.max_tokens(risk_level, MAX_RESPONSE_TOKENS),
+            "risk_level": risk_level,
+            "cache_lookup": cache_lookup,
+            "draft": draft_task,
+            "draft_consumed": False
+        }
 
-            return final_response
+    async def _classify_with_llm(self, message: str) -> Dict[str, Any]:
+        """
+        LLM classification. Concurrent requests with the same normalized message
+        (the classifier sees no memory context) await one call.
+        """
+        def _classify():
+            return self.llm.classify_text(message, prompt_assembly.CLASSIFICATION_SYSTEM_PROMPT)
 
-        except Exception as e:
-            import traceback
-            logger.error(f"Orchestrator error: {e}")
-            traceback.print_exc()
-            self.monitor.log_error("Orchestrator", str(e))
-            return "I am currently experiencing technical difficulties. Please try again later."
-            
-        finally:
-            latency = (time.time() - start_time) * 1000
-            self.monitor.log_request(latency, risk_level, model_used)
+        if not settings.SINGLE_FLIGHT_CLASSIFICATION:
+            return await _classify()
+        result = await self.classification_flight.do(make_cache_key(message), _classify)
+        return dict(result) # shared with the other callers
+
+    def _overloaded_response(self, risk_level: str) -> str:
+        """Shed under load: at-risk users still get crisis resources, not a retry-later."""
+        if risk_level in ("CRISIS", "HIGH_RISK"):
+            return self.safety.get_hard_refusal("CRISIS")
+        return OVERLOADED_RESPONSE
+
+    def _build_messages(self, risk_level: str, message: str, context: str) -> List[Dict[str, str]]:
+        # Static system prefix first, per-request content last (provider prefix caching)
+        return prompt_assembly.build_response_messages(risk_level, message, context)
 
-    async def _async_memory_update(self, user_id: UUID, user_msg: str, bot_msg: str):
+    async def _start_speculative_draft(self, user_id: UUID, message: str, context: str, timer: StageTimer):
         """
-        Background task to summarize and update DB.
+        Start generating with the SPECULATIVE_RISK_LEVEL prompt before classification lands.
+        Returns (draft_task, cache_lookup). No draft is started when a LOW_RISK
+        cache entry would answer the message anyway.
         """
-        # Ideally fetch recent history from DB to append
-        # Here we just treat single turn for the summarizer demo
-        history = [
-            {"role": "user", "content": user_msg},
-            {"role": "assistant", "content": bot_msg}
-        ]
-        
-        summary = await self.memory_summarizer.generate_summary(history)
-        if summary:
-            await self.db.update_user_memory(
-                user_id=user_id,
-                relationship_context=summary.get("1", {}), # Indexing based on prompt requirement
-                recurring_themes=summary.get("2", {}),
-                emotional_patterns=summary.get("3", {}),
-                new_progress_note=summary.get("4", "")
-            )
+        risk_level = settings.SPECULATIVE_RISK_LEVEL
+        if risk_level == "LOW_RISK":
+            cache_lookup = await timer.timed("cache", self.semantic_cache.lookup(
+                message, context, threshold=self.router.cache_threshold(), user_id=str(user_id)
+            ))
+            if cache_lookup.response:
+                return None, cache_lookup
+        else:
+            cache_lookup = None
+
+        draft = self.llm.generate_response(
+            model=self.router.get_model_for_risk_level(risk_level),
+            messages=self._build_messages(risk_level, message, context),
+            max_tokens=self.router.max_tokens(risk_level, MAX_RESPONSE_TOKENS),
+            priority=risk_level
+        )
+        return asyncio.create_task(draft), cache_lookup
+
+    def _discard_speculative_draft(self, draft_task: asyncio.Task):
+        if draft_task.done():
+            # Fully generated and paid for, then thrown away
+            self.monitor.increment("speculative_wasted")
+        else:
+            self.monitor.increment("speculative_cancelled")
+        _discard_task(draft_task)
+
+    async def _generate_checked(self, plan: Dict[str, Any], timer: StageTimer) -> Optional[str]:
+        """
+        Steps 8-10: generate, validate and rewrite. Returns None if Layer 2 blocks the response.
+        """
+        # 8. Generation
+        # Token budget adjustment could happen here
+        response_text = None
+        if plan["draft"] is not None:
+            plan["draft_consumed"] = True
+            try:
+                response_text = await timer.timed("generate", plan["draft"])
+                self.monitor.increment("speculative_hit")
+            except Exception as e:
+                logger.warning(f"Speculative draft failed, regenerating: {e}")
+
+        if response_text is None:
+            started = time.perf_counter()
+            try:
+                response_text = await timer.timed("generate", self.llm.generate_response(
+                    model=plan["model"],
+                    messages=plan["messages"],
+                    max_tokens=plan["max_tokens"],
+                    priority=plan["risk_level"]
+                ))
+            except Exception:
+                self.router.observe_generation(plan["model"], time.perf_counter() - started, ok=False)
+                raise
+            self.router.observe_generation(plan["model"], time.perf_counter() - started, ok=True)
+
+        # 9. Layer 2 Safety: Output Validation
+        with timer.stage("validate"):
+            is_valid, reason = self.safety.validate_response(response_text)
+        if not is_valid:
+            logger.warning(f"Response blocked by Layer 2: {reason}")
+            self.monitor.record_layer2_block(reason)
+            return None
+
+        # 10. Hallucination Control
+        with timer.stage("humility"):
+            return self.hallucination.enforce_epistemic_humility(response_text)
+
+    async def _generate_and_cache(self, plan: Dict[str, Any], timer: StageTimer) -> Optional[str]:
+        final_response = await self._generate_checked(plan, timer)
+        # 12. Cache Update
+        if final_response is not None:
+            await self.semantic_cache.store_response(plan["cache_lookup"], final_response, plan["risk_level"])
+        return final_response
+
+    async def _finalize_response(self, user_id: UUID, message: str, final_response: str, plan: Dict[str, Any]):
+        """
+        Steps 11-12 for the streaming path: schedule the memory update and cache low-risk answers.
+        """
+        self._schedule_memory_update(user_id, message, final_response)
+
+        # 12. Cache Update
+        if plan["risk_level"] == "LOW_RISK":
+             await self.semantic_cache.store_response(plan["cache_lookup"], final_response, plan["risk_level"])
+
+    def _schedule_memory_update(self, user_id: UUID, message: str, final_response: str):
+        # 11. Async Memory Update
+        # Buffered and summarized in the background (coalesced per user)
+        self.memory_worker.submit(user_id, message, final_response)
@@ -0,0 +1,221 @@
+import re
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+# A rule is either a bare pattern or a (pattern, label) pair.
+Rule = Union[str, Tuple[str, str]]
+
+# Anchors are bucketed by (at most) this many leading characters.
+ANCHOR_KEY_LENGTH = 3
+
+_METACHARS = set(".^$*+?{}[]|()")
+_QUANTIFIERS = set("*?{+")
+
+
+class PatternMatch(NamedTuple):
+    index: int              # position of the rule in its rule set (lower = higher priority)
+    label: str              # human readable label of the rule
+    span: Tuple[int, int]
+    text: str
+
+
+def _has_top_level_alternation(pattern: str) -> bool:
+    depth, i, in_class = 0, 0, False
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            i += 2
+            continue
+        if in_class:
+            in_class = c != "]"
+        elif c == "[":
+            in_class = True
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        elif c == "|" and depth == 0:
+            return True
+        i += 1
+    return False
+
+
+def literal_anchor(pattern: str) -> str:
+    """
+    The literal text every match of `pattern` must start with ("" if there is none).
+    A leading word boundary is allowed since it does not consume characters.
+    """
+    if _has_top_level_alternation(pattern):
+        return ""
+    if pattern.startswith(r"\b"):
+        pattern = pattern[2:]
+
+    anchor, i = [], 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            # Escaped punctuation is a literal; classes such as \d or \w end the anchor
+            if i + 1 < len(pattern) and not pattern[i + 1].isalnum():
+                anchor.append(pattern[i + 1])
+                i += 2
+                continue
+            break
+        if c in _METACHARS:
+            break
+        anchor.append(c)
+        i += 1
+
+    # A quantifier applies to the last literal, which is then optional
+    if anchor and i < len(pattern) and pattern[i] in _QUANTIFIERS:
+        anchor.pop()
+    return "".join(anchor)
+
+
+def _trie_regex(keys: Iterable[str]) -> str:
+    """Factor literal keys into a prefix trie so the engine branches once per character."""
+    trie: Dict[str, dict] = {}
+    for key in keys:
+        node = trie
+        for ch in key:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node: Dict[str, dict]) -> str:
+        optional = "" in node
+        branches = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        if len(branches) == 1 and not optional:
+            return branches[0]
+        group = "(?:" + "|".join(branches) + ")"
+        return group + "?" if optional else group
+
+    return emit(trie)
+
+
+class PatternSet:
+    """
+    A rule set compiled once into a single-pass matcher.
+
+    CPython's backtracking engine tries every branch of a plain `a|b|c`
+    alternation at every position, so a big named-group alternation is no
+    faster than looping over the rules. Instead, each rule's literal anchor
+    (the text every match starts with) goes into one trie-factored
+    alternation; a single pass over the text finds anchor positions, and only
+    the rules bucketed under that anchor are tried there. Rules without a
+    literal anchor (e.g. starting with `\\d`) are searched individually.
+    """
+
+    def __init__(self, rules: Sequence[Rule], flags: int = re.IGNORECASE):
+        self.patterns: List[str] = []
+        self.labels: List[str] = []
+        for rule in rules:
+            pattern, label = (rule, rule) if isinstance(rule, str) else rule
+            self.patterns.append(pattern)
+            self.labels.append(label)
+
+        self.flags = flags
+        self._ignorecase = bool(flags & re.IGNORECASE)
+        self._compiled = [re.compile(p, flags) for p in self.patterns]
+
+        self._buckets: Dict[str, List[int]] = {}
+        self._residual: List[int] = []
+        for i, pattern in enumerate(self.patterns):
+            anchor = "" if flags & re.VERBOSE else literal_anchor(pattern)
+            key = anchor[:ANCHOR_KEY_LENGTH]
+            if self._ignorecase:
+                # Keys whose case folding changes length can't be located reliably
+                key = key.lower() if len(key.lower()) == len(key) else ""
+            if not key:
+                self._residual.append(i)
+                continue
+            self._buckets.setdefault(key, []).append(i)
+
+        # Lookahead so anchors that overlap each other are all reported
+        trie = _trie_regex(self._buckets)
+        self._anchor_regex = re.compile(f"(?=({trie}))" if trie else r"(?!)")
+        self._anchor_regex_fallback: Optional["re.Pattern[str]"] = None
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def _anchor_hits(self, text: str):
+        if not self._ignorecase:
+            return self._anchor_regex.finditer(text)
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            return self._anchor_regex.finditer(lowered)
+        # Some characters change length when lowercased; positions would drift
+        if self._anchor_regex_fallback is None:
+            self._anchor_regex_fallback = re.compile(self._anchor_regex.pattern, re.IGNORECASE)
+        return self._anchor_regex_fallback.finditer(text)
+
+    def _iter_hits(self, text: str):
+        for m in self._anchor_hits(text):
+            pos, key = m.start(), m.group(1)
+            if self._ignorecase:
+                key = key.lower()
+            # The trie reports the longest key at `pos`; shorter keys may also start there
+            for length in range(1, len(key) + 1):
+                for i in self._buckets.get(key[:length], ()):
+                    hit = self._compiled[i].match(text, pos)
+                    if hit:
+                        yield PatternMatch(i, self.labels[i], hit.span(), hit.group())
+        for i in self._residual:
+            for hit in self._compiled[i].finditer(text):
+                yield PatternMatch(i, self.labels[i], hit.span(), hit.group())
+
+    def scan(self, text: str) -> List[PatternMatch]:
+        """Every hit of every rule, ordered by position then rule priority."""
+        return sorted(self._iter_hits(text), key=lambda h: (h.span[0], h.index))
+
+    def search(self, text: str) -> Optional[PatternMatch]:
+        """Leftmost hit (ties go to the first listed rule), or None."""
+        hits = self.scan(text)
+        return hits[0] if hits else None
+
+    def first_rule(self, text: str) -> Optional[PatternMatch]:
+        """The hit of the highest-priority (first listed) rule that fired, or None."""
+        return min(self._iter_hits(text), key=lambda h: (h.index, h.span[0]), default=None)
+
+    def matched_labels(self, text: str) -> List[str]:
+        """Labels of all rules that fired, in rule order, without duplicates."""
+        indexes = sorted({h.index for h in self._iter_hits(text)})
+        return [self.labels[i] for i in indexes]
+
+    def any(self, text: str) -> bool:
+        """True as soon as any rule matches."""
+        return next(self._iter_hits(text), None) is not None
+
+    def sub(self, text: str, replacement: Callable[[PatternMatch], str]) -> str:
+        """
+        Replace hits in one pass, leftmost first; overlapping later hits are skipped.
+        `replacement` receives the PatternMatch.
+        """
+        parts, last_end = [], 0
+        for hit in self.scan(text):
+            start, end = hit.span
+            if start < last_end or start == end:
+                continue
+            parts.append(text[last_end:start])
+            parts.append(replacement(hit))
+            last_end = end
+        if not parts:
+            return text
+        parts.append(text[last_end:])
+        return "".join(parts)
+
+
+_REGISTRY: Dict[Tuple[Tuple[Tuple[str, str], ...], int], PatternSet] = {}
+
+
+def compile_rules(rules: Iterable[Rule], flags: int = re.IGNORECASE) -> PatternSet:
+    """
+    Return the compiled PatternSet for `rules`, compiling it only once per process.
+    """
+    normalized = tuple((r, r) if isinstance(r, str) else tuple(r) for r in rules)
+    key = (normalized, flags)
+    pattern_set = _REGISTRY.get(key)
+    if pattern_set is None:
+        pattern_set = PatternSet(normalized, flags)
+        _REGISTRY[key] = pattern_set
+    return pattern_set
@@ -0,0 +1,307 @@
+import json
+import logging
+import math
+import re
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config.settings import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+RISK_LEVELS = ("LOW_RISK", "MEDIUM_RISK", "HIGH_RISK", "CRISIS")
+_LEVEL_INDEX = {level: i for i, level in enumerate(RISK_LEVELS)}
+
+# Bundled model, produced by `python -m training.train_risk_classifier`
+DEFAULT_MODEL_PATH = Path(__file__).with_name("risk_classifier.npz")
+
+N_FEATURES = 2 ** 16 # hashed feature space (must match the saved model)
+CHAR_NGRAM = 4
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def ngrams(text: str) -> List[str]:
+    """Word unigrams and bigrams plus character 4-grams within words."""
+    words = _WORD.findall(text.lower())
+    grams = [f"w:{w}" for w in words]
+    grams.extend(f"b:{a} {b}" for a, b in zip(words, words[1:]))
+    for w in words:
+        padded = f"<{w}>"
+        grams.extend(f"c:{padded[i:i + CHAR_NGRAM]}" for i in range(max(1, len(padded) - CHAR_NGRAM + 1)))
+    return grams
+
+
+def hashed_counts(text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Sorted unique feature indices of `text` and their counts."""
+    grams = ngrams(text)
+    if not grams:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    # crc32 is stable across processes, unlike hash()
+    indices = np.fromiter((zlib.crc32(g.encode()) for g in grams), dtype=np.int64, count=len(grams))
+    indices, counts = np.unique(indices & (N_FEATURES - 1), return_counts=True)
+    return indices, counts.astype(np.float32)
+
+
+class LocalPrediction(NamedTuple):
+    risk_level: str           # arg-max level
+    probabilities: np.ndarray # per RISK_LEVELS
+    coverage: float           # share of the message's features seen in training
+
+    def probability(self, level: str) -> float:
+        return float(self.probabilities[_LEVEL_INDEX[level]])
+
+
+class RiskModel:
+    """
+    Multinomial logistic regression over hashed, TF-IDF weighted n-grams.
+
+    Prediction is a gather of the message's (few dozen) weight rows and a
+    softmax, so it costs microseconds on CPU. Features never seen in training
+    have an IDF of 0: they do not move the prediction, and they lower
+    `coverage` so unfamiliar messages are deferred instead of guessed.
+    """
+
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, idf: np.ndarray):
+        if weights.shape != (N_FEATURES, len(RISK_LEVELS)) or idf.shape != (N_FEATURES,):
+            raise ValueError(f"Risk model shape {weights.shape} does not match {N_FEATURES} features x {len(RISK_LEVELS)} levels")
+        self.weights = weights.astype(np.float32)
+        self.bias = bias.astype(np.float32)
+        self.idf = idf.astype(np.float32)
+
+    def vectorize(self, text: str) -> Tuple[np.ndarray, np.ndarray, float]:
+        indices, counts = hashed_counts(text)
+        if not len(indices):
+            return indices, counts, 0.0
+        idf = self.idf[indices]
+        values = (1.0 + np.log(counts)) * idf # sublinear tf
+        norm = float(np.linalg.norm(values))
+        if norm > 0:
+            values /= norm
+        coverage = float(np.count_nonzero(idf)) / len(indices)
+        return indices, values, coverage
+
+    def predict(self, text: str) -> LocalPrediction:
+        indices, values, coverage = self.vectorize(text)
+        logits = self.bias + values @ self.weights[indices]
+        probabilities = _softmax(logits)
+        return LocalPrediction(RISK_LEVELS[int(np.argmax(probabilities))], probabilities, coverage)
+
+    @classmethod
+    def fit(
+        cls,
+        texts: Sequence[str],
+        labels: Sequence[str],
+        epochs: int = 300,
+        learning_rate: float = 0.05,
+        l2: float = 1e-4
+    ) -> "RiskModel":
+        """
+        Train with full-batch Adam on softmax cross-entropy, with classes
+        weighted by inverse frequency. Data is kept sparse (one row per
+        (document, feature) pair), so memory grows with the corpus, not with
+        N_FEATURES x documents.
+        """
+        y = np.array([_LEVEL_INDEX[label] for label in labels], dtype=np.int64)
+        n_docs, n_levels = len(texts), len(RISK_LEVELS)
+
+        counted = [hashed_counts(text) for text in texts]
+        doc_ids = np.concatenate([np.full(len(idx), d, dtype=np.int64) for d, (idx, _) in enumerate(counted)])
+        indices = np.concatenate([idx for idx, _ in counted])
+        counts = np.concatenate([c for _, c in counted])
+
+        df = np.bincount(indices, minlength=N_FEATURES)
+        idf = np.where(df > 0, np.log((1.0 + n_docs) / (1.0 + df)) + 1.0, 0.0).astype(np.float32)
+
+        values = (1.0 + np.log(counts)) * idf[indices]
+        norms = np.sqrt(np.bincount(doc_ids, weights=values ** 2, minlength=n_docs))
+        values = (values / np.maximum(norms[doc_ids], 1e-12)).astype(np.float32)
+
+        class_counts = np.bincount(y, minlength=n_levels).astype(np.float32)
+        sample_weight = (n_docs / (n_levels * np.maximum(class_counts, 1.0)))[y] / n_docs
+        targets = np.eye(n_levels, dtype=np.float32)[y]
+
+        weights = np.zeros((N_FEATURES, n_levels), dtype=np.float32)
+        bias = np.zeros(n_levels, dtype=np.float32)
+        used = np.unique(indices) # only these rows ever get a gradient
+        params = [weights[used], bias]
+        moments = [(np.zeros_like(p), np.zeros_like(p)) for p in params]
+        remap = np.searchsorted(used, indices)
+        beta1, beta2 = 0.9, 0.999
+
+        for step in range(1, epochs + 1):
+            w_used, b = params
+            logits = np.tile(b, (n_docs, 1))
+            np.add.at(logits, doc_ids, values[:, None] * w_used[remap])
+            grad_logits = (_softmax(logits) - targets) * sample_weight[:, None]
+
+            grad_w = np.zeros_like(w_used)
+            np.add.at(grad_w, remap, values[:, None] * grad_logits[doc_ids])
+            grad_w += l2 * w_used
+            grads = [grad_w, grad_logits.sum(axis=0)]
+
+            for param, grad, (m, v) in zip(params, grads, moments):
+                m *= beta1
+                m += (1 - beta1) * grad
+                v *= beta2
+                v += (1 - beta2) * grad ** 2
+                m_hat = m / (1 - beta1 ** step)
+                v_hat = v / (1 - beta2 ** step)
+                param -= learning_rate * m_hat / (np.sqrt(v_hat) + 1e-8)
+
+        weights[used] = params[0]
+        return cls(weights, params[1], idf)
+
+    def save(self, path: str):
+        used = np.flatnonzero(self.idf)
+        np.savez_compressed(
+            path,
+            meta=np.array(json.dumps({"levels": RISK_LEVELS, "n_features": N_FEATURES, "char_ngram": CHAR_NGRAM})),
+            rows=used.astype(np.int32),
+            weights=self.weights[used].astype(np.float16),
+            idf=self.idf[used].astype(np.float16),
+            bias=self.bias
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "RiskModel":
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            if tuple(meta["levels"]) != RISK_LEVELS or meta["n_features"] != N_FEATURES or meta["char_ngram"] != CHAR_NGRAM:
+                raise ValueError(f"Risk model {path} was trained with a different feature scheme: {meta}")
+            rows = data["rows"]
+            weights = np.zeros((N_FEATURES, len(RISK_LEVELS)), dtype=np.float32)
+            weights[rows] = data["weights"]
+            idf = np.zeros(N_FEATURES, dtype=np.float32)
+            idf[rows] = data["idf"]
+            return cls(weights, data["bias"], idf)
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return shifted / shifted.sum(axis=-1, keepdims=True)
+
+
+def decide(prediction: LocalPrediction, crisis_threshold: float, min_coverage: float) -> Optional[str]:
+    """
+    The risk level to act on without the LLM, or None to defer. The local
+    model may only escalate: a confident CRISIS is acted on (escalating is the
+    safe error), anything else goes to the LLM. It is never trusted to say
+    LOW_RISK, since it was trained on a small templated set and is confidently
+    wrong on indirect self-harm and abuse phrasings.
+    """
+    if prediction.coverage < min_coverage:
+        return None
+    if prediction.probability("CRISIS") >= crisis_threshold:
+        return "CRISIS"
+    return None
+
+
+class LocalRiskClassifier:
+    """
+    First-pass safety classification (step 3) that runs before the LLM.
+
+    Confidently CRISIS messages are escalated here; everything else returns
+    None and goes to `LLMClient.classify_text`. If the model file is missing or
+    unreadable, every message is deferred.
+    """
+
+    def __init__(self, model: Optional[RiskModel] = None):
+        self.crisis_threshold = settings.LOCAL_CLASSIFIER_CRISIS_THRESHOLD
+        self.min_coverage = settings.LOCAL_CLASSIFIER_MIN_COVERAGE
+        self.model = model
+        if self.model is None and settings.LOCAL_CLASSIFIER_ENABLED:
+            path = settings.LOCAL_CLASSIFIER_MODEL_PATH or DEFAULT_MODEL_PATH
+            try:
+                self.model = RiskModel.load(path)
+            except Exception as e:
+                logger.warning(f"Local risk classifier disabled, could not load {path}: {e}")
+
+    @property
+    def enabled(self) -> bool:
+        return self.model is not None
+
+    def classify(self, text: str) -> Optional[Dict[str, Any]]:
+        """A classification in the `classify_text` format, or None to defer to the LLM."""
+        if self.model is None:
+            return None
+        prediction = self.model.predict(text)
+        risk_level = decide(prediction, self.crisis_threshold, self.min_coverage)
+        if risk_level is None:
+            return None
+        confidence = prediction.probability(risk_level)
+        return {
+            "risk_level": risk_level,
+            "confidence_score": round(confidence, 3),
+            "recommended_action": "Classified locally",
+            "source": "local"
+        }
+
+    def classify_degraded(self, text: str) -> Dict[str, Any]:
+        """
+        Used instead of the LLM when routing is in critical mode (Layer 1 has
+        already run). A conservative default, never a model-issued LOW_RISK:
+        MEDIUM_RISK, or higher when the local model escalates or leans
+        HIGH_RISK/CRISIS.
+        """
+        result = self.classify(text)
+        if result is not None:
+            return result
+        risk_level, confidence = "MEDIUM_RISK", 0.0
+        if self.model is not None:
+            prediction = self.model.predict(text)
+            if prediction.risk_level in ("HIGH_RISK", "CRISIS"):
+                risk_level = prediction.risk_level
+                confidence = prediction.probability(risk_level)
+        return {
+            "risk_level": risk_level,
+            "confidence_score": round(confidence, 3),
+            "recommended_action": "Conservative default (LLM classification skipped under load)",
+            "source": "local_degraded"
+        }
+
+
+def evaluate(
+    model: RiskModel,
+    texts: Sequence[str],
+    labels: Sequence[str],
+    crisis_threshold: float,
+    min_coverage: float
+) -> Dict[str, Any]:
+    """Counts of correct arg-max predictions and of local decisions made at the given thresholds."""
+    total = len(texts)
+    correct = decided = decided_correct = over_escalated = 0
+    per_level = {level: {"count": 0, "decided": 0} for level in RISK_LEVELS}
+    for text, label in zip(texts, labels):
+        prediction = model.predict(text)
+        correct += prediction.risk_level == label
+        decision = decide(prediction, crisis_threshold, min_coverage)
+        per_level[label]["count"] += 1
+        if decision is None:
+            continue
+        decided += 1
+        per_level[label]["decided"] += 1
+        decided_correct += decision == label
+        # Local decisions only escalate; this counts the ones the labels disagree with
+        over_escalated += decision != label
+    return {
+        "examples": total,
+        "correct": correct,
+        "decided": decided,
+        "decided_correct": decided_correct,
+        "over_escalated": over_escalated,
+        "per_level": per_level
+    }
+
+
+def rates(result: Dict[str, Any]) -> Dict[str, float]:
+    """Accuracy, share decided locally and accuracy of those decisions from `evaluate` counts."""
+    return {
+        "accuracy": result["correct"] / result["examples"] if result["examples"] else math.nan,
+        "decided_rate": result["decided"] / result["examples"] if result["examples"] else math.nan,
+        "decided_accuracy": result["decided_correct"] / result["decided"] if result["decided"] else math.nan
+    }
@@ -1,6 +1,8 @@
-import re
 from typing import List, Tuple, Dict, Any
 
+from src.orchestration.patterns import compile_rules
+from src.orchestration.keywords import KeywordScanner, compile_keywords, is_literal
+
 class SafetyGuardrails:
     def __init__(self):
         self.prohibited_topics = [
@@ -14,38 +16,56 @@ class SafetyGuardrails:
             r"want to die",
             r"hurt myself"
         ]
+        self.forbidden_response_patterns = [
+            (r"you should leave", "Directive advice"),
+            (r"you have \w+ disorder", "Diagnosis attempt"),
+            (r"definitely", "False certainty")
+        ]
+
+        # Compiled once per process into single-pass matchers. Plain keywords of
+        # both Layer 1 lists share one Aho-Corasick automaton (see keywords.py);
+        # only rules that are real regexes go through a PatternSet.
+        self._input_keywords = compile_keywords(
+            [(k, "CRISIS") for k in self.crisis_keywords if is_literal(k)]
+            + [(k, "PROHIBITED") for k in self.prohibited_topics if is_literal(k)]
+        )
+        self._crisis_matcher = compile_rules(k for k in self.crisis_keywords if not is_literal(k))
+        self._prohibited_matcher = compile_rules(k for k in self.prohibited_topics if not is_literal(k))
+        self._forbidden_matcher = compile_rules(self.forbidden_response_patterns)
 
     def detect_input_risk(self, text: str) -> Dict[str, Any]:
         """
         Layer 1: Input Risk Detection
         Returns: {is_safe: bool, risk_type: str, reason: str}
         """
+        keyword_hits = {m.label for m in self._input_keywords.find_all(text)}
+
         # Crisis Check
-        for p in self.crisis_keywords:
-            if re.search(p, text, re.IGNORECASE):
-                return {"is_safe": False, "risk_type": "CRISIS", "reason": "Crisis keyword detected"}
+        if "CRISIS" in keyword_hits or self._crisis_matcher.any(text):
+            return {"is_safe": False, "risk_type": "CRISIS", "reason": "Crisis keyword detected"}
 
         # Prohibited Topic Check
-        for p in self.prohibited_topics:
-            if re.search(p, text, re.IGNORECASE):
-                return {"is_safe": False, "risk_type": "PROHIBITED", "reason": "Prohibited topic detected"}
+        if "PROHIBITED" in keyword_hits or self._prohibited_matcher.any(text):
+            return {"is_safe": False, "risk_type": "PROHIBITED", "reason": "Prohibited topic detected"}
                 
         return {"is_safe": True, "risk_type": "NONE", "reason": ""}
 
+    def input_risk_scanner(self) -> KeywordScanner:
+        """
+        Incremental Layer 1 keyword scan for streamed text: each `feed(chunk)`
+        costs O(chunk) and returns matches labelled "CRISIS" or "PROHIBITED".
+        Layer 1 rules that are regexes rather than plain keywords are not covered.
+        """
+        return self._input_keywords.scanner()
+
     def validate_response(self, text: str) -> Tuple[bool, str]:
         """
         Layer 2: Response Constraints
         Checks generated text for forbidden patterns.
         """
-        forbidden = [
-            (r"you should leave", "Directive advice"),
-            (r"you have \w+ disorder", "Diagnosis attempt"),
-            (r"definitely", "False certainty")
-        ]
-        
-        for pattern, reason in forbidden:
-            if re.search(pattern, text, re.IGNORECASE):
-                return False, reason
+        hit = self._forbidden_matcher.first_rule(text)
+        if hit:
+            return False, hit.label
                 
         return True, ""
 
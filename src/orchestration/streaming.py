@@ -0,0 +1,86 @@
+import re
+from typing import List, Optional
+
+from src.orchestration.safety import SafetyGuardrails
+from src.orchestration.hallucination_controls import HallucinationControls
+
+# End of a sentence: terminal punctuation (plus closing quotes/brackets) followed by
+# whitespace, or a hard line break.
+SENTENCE_BOUNDARY = re.compile(r"[.!?][\"')\]]*\s+|\n")
+CLOSERS = "\"')]"
+
+
+class StreamingResponseGuard:
+    """
+    Applies Layer 2 validation and epistemic humility to a streamed response.
+
+    Tokens are buffered until a sentence boundary is seen; only complete
+    sentences are validated, rewritten and released. Once a window fails
+    validation nothing more is released.
+
+    Every delta is also fed to the Layer 1 keyword scanner, which carries its
+    state across deltas; `keyword_hits` lists the risk types found in the
+    response so far. Neither check rescans text it has already seen.
+    """
+
+    def __init__(self, safety: SafetyGuardrails, hallucination: HallucinationControls):
+        self.safety = safety
+        self.hallucination = hallucination
+        self._buffer = ""
+        self._resume = 0 # where the next boundary search starts in _buffer
+        self._keywords = safety.input_risk_scanner()
+        self.keyword_hits: List[str] = []
+        self.blocked_reason: Optional[str] = None
+
+    @property
+    def is_blocked(self) -> bool:
+        return self.blocked_reason is not None
+
+    def feed(self, delta: str) -> List[str]:
+        """
+        Add a streamed chunk. Returns the segments that are safe to flush.
+        """
+        if self.is_blocked:
+            return []
+
+        for match in self._keywords.feed(delta):
+            if match.label not in self.keyword_hits:
+                self.keyword_hits.append(match.label)
+
+        self._buffer += delta
+        boundary = None
+        for match in SENTENCE_BOUNDARY.finditer(self._buffer, self._resume):
+            boundary = match.end()
+        if boundary is not None:
+            window, self._buffer = self._buffer[:boundary], self._buffer[boundary:]
+        self._resume = self._resume_point()
+        if boundary is None:
+            return []
+        return self._release(window)
+
+    def _resume_point(self) -> int:
+        """
+        Earliest position where a boundary could still complete: a trailing
+        [.!?] followed only by closing quotes/brackets, else the buffer end.
+        """
+        stripped = self._buffer.rstrip(CLOSERS)
+        if stripped and stripped[-1] in ".!?":
+            return len(stripped) - 1
+        return len(self._buffer)
+
+    def flush(self) -> List[str]:
+        """
+        Validate and release whatever is left once the stream has ended.
+        """
+        if self.is_blocked or not self._buffer:
+            return []
+        window, self._buffer, self._resume = self._buffer, "", 0
+        return self._release(window)
+
+    def _release(self, window: str) -> List[str]:
+        is_valid, reason = self.safety.validate_response(window)
+        if not is_valid:
+            self.blocked_reason = reason
+            self._buffer = ""
+            return []
+        return [self.hallucination.enforce_epistemic_humility(window)]
@@ -1,27 +1,39 @@
-from flask import Flask
+import os
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
 from config.settings import get_settings
-from src.web.routes import main_bp
+from src.web.routes import routes
 from src.orchestration.orchestrator import ConversationOrchestrator
 
 settings = get_settings()
 
-def create_app():
-    app = Flask(__name__, 
-                template_folder="templates",
-                static_folder="static")
-    
-    app.config["SECRET_KEY"] = settings.FLASK_SECRET_KEY
-    
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
     # Initialize Core Services
-    # We attach the orchestrator to the app so routes can access it
-    # Note: Orchestrator init is sync, but its methods are async
-    app.orchestrator = ConversationOrchestrator()
-    
-    # Register Blueprints
-    app.register_blueprint(main_bp)
-    
-    return app
+    # One orchestrator per worker, living on the server's event loop for its whole
+    # lifetime, so the asyncpg pool and redis.asyncio connections stay valid
+    orchestrator = ConversationOrchestrator()
+    await orchestrator.startup()
+    app.state.orchestrator = orchestrator
+    try:
+        yield
+    finally:
+        await orchestrator.shutdown()
+
+def create_app() -> Starlette:
+    return Starlette(
+        debug=settings.DEBUG,
+        routes=[
+            *routes,
+            Mount("/static", app=StaticFiles(directory=STATIC_DIR), name="static")
+        ],
+        lifespan=lifespan
+    )
 
 if __name__ == "__main__":
-    app = create_app()
-    app.run(host="0.0.0.0", port=settings.PORT, debug=settings.DEBUG)
+    import uvicorn
+    uvicorn.run("src.web.app:create_app", factory=True, host="0.0.0.0", port=settings.PORT, reload=settings.DEBUG)
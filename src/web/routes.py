@@ -1,44 +1,60 @@
+import json
 import logging
+import os
 import uuid
+from typing import Any, Dict, Optional, Tuple
 import markdown
-from flask import Blueprint, render_template, request, jsonify, current_app
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from starlette.templating import Jinja2Templates
+from src.monitoring.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
 
-main_bp = Blueprint('main', __name__)
 logger = logging.getLogger(__name__)
 
-@main_bp.route('/')
-def index():
+templates = Jinja2Templates(directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates"))
+
+async def index(request: Request):
     """Render the main chat interface."""
     # Generate a fresh session ID if not present (simplified for demo)
-    return render_template('index.html')
+    return templates.TemplateResponse(request, 'index.html')
 
-@main_bp.route('/chat', methods=['POST'])
-async def chat():
+async def _parse_chat_request(request: Request) -> Optional[Tuple[str, uuid.UUID, str]]:
+    """
+    Expected JSON: {"message": "user text", "user_id": "uuid", "session_id": "uuid"}
+    Returns (message, user_id, session_id), or None if there is no message.
+    """
+    try:
+        data: Dict[str, Any] = await request.json()
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or 'message' not in data:
+        return None
+
+    # Validate or Generate UUIDs
+    try:
+        user_id = uuid.UUID(data.get('user_id'))
+    except (ValueError, TypeError, AttributeError):
+        # For demo, if invalid UUID, generate one (in prod, require auth)
+        user_id = uuid.uuid4()
+
+    session_id = data.get('session_id', str(uuid.uuid4()))
+    return data['message'], user_id, session_id
+
+async def chat(request: Request):
     """
     Handle chat messages.
     Expected JSON: {"message": "user text", "user_id": "uuid", "session_id": "uuid"}
     """
     try:
-        data = request.get_json()
-        if not data or 'message' not in data:
-            return jsonify({"error": "No message provided"}), 400
+        parsed = await _parse_chat_request(request)
+        if parsed is None:
+            return JSONResponse({"error": "No message provided"}, status_code=400)
+        user_message, user_id, session_id = parsed
 
-        user_message = data['message']
-        
-        # Validate or Generate UUIDs
-        try:
-            user_id = uuid.UUID(data.get('user_id'))
-        except (ValueError, TypeError):
-            # For demo, if invalid UUID, generate one (in prod, require auth)
-            user_id = uuid.uuid4()
-            
-        session_id = data.get('session_id', str(uuid.uuid4()))
-
-        # Access Orchestrator from app context
-        # Note: current_app is a proxy, but we attached orchestrator to the real app object
-        orchestrator = current_app.orchestrator
+        orchestrator = request.app.state.orchestrator
         
-        # Process Message (ASYNC)
+        # Process Message (ASYNC, on the server's event loop)
         response_text = await orchestrator.process_message(
             user_id=user_id,
             message=user_message,
@@ -49,7 +65,7 @@ async def chat():
         # allowed_tags can be strict for safety
         response_html = markdown.markdown(response_text)
         
-        return jsonify({
+        return JSONResponse({
             "response": response_html,
             "raw_response": response_text,
             "user_id": str(user_id),
@@ -58,4 +74,61 @@ async def chat():
 
     except Exception as e:
         logger.error(f"Chat endpoint error: {e}")
-        return jsonify({"error": "Internal Processing Error"}), 500
+        return JSONResponse({"error": "Internal Processing Error"}, status_code=500)
+
+async def chat_stream(request: Request):
+    """
+    Handle chat messages as a Server-Sent Events stream.
+    Same JSON body as /chat. Emits `data: {"delta": ...}` events while the
+    response is generated and a final `event: done` carrying the rendered HTML.
+    """
+    parsed = await _parse_chat_request(request)
+    if parsed is None:
+        return JSONResponse({"error": "No message provided"}, status_code=400)
+    user_message, user_id, session_id = parsed
+    orchestrator = request.app.state.orchestrator
+
+    async def event_stream():
+        chunks = []
+        try:
+            async for delta in orchestrator.process_message_stream(
+                user_id=user_id,
+                message=user_message,
+                session_id=session_id
+            ):
+                chunks.append(delta)
+                yield _sse({"delta": delta})
+
+            response_text = "".join(chunks)
+            yield _sse({
+                "response": markdown.markdown(response_text),
+                "raw_response": response_text,
+                "user_id": str(user_id),
+                "session_id": session_id
+            }, event="done")
+        except Exception as e:
+            logger.error(f"Chat stream endpoint error: {e}")
+            yield _sse({"error": "Internal Processing Error"}, event="error")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+async def metrics(request: Request):
+    """Prometheus scrape endpoint for this worker."""
+    monitor = request.app.state.orchestrator.monitor
+    return Response(monitor.render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+def _sse(payload: dict, event: str = None) -> str:
+    """Format one Server-Sent Event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload)}\n\n"
+
+routes = [
+    Route('/', index, methods=['GET']),
+    Route('/chat', chat, methods=['POST']),
+    Route('/chat/stream', chat_stream, methods=['POST']),
+    Route('/metrics', metrics, methods=['GET']),
+]
@@ -45,6 +45,7 @@ document.addEventListener('DOMContentLoaded', () => {
         wrapper.appendChild(bubble);
         messagesContainer.appendChild(wrapper);
         scrollToBottom();
+        return bubble;
     };
 
     // Handle Submit
@@ -76,7 +77,7 @@ document.addEventListener('DOMContentLoaded', () => {
         scrollToBottom();
 
         try {
-            const response = await fetch('/chat', {
+            const response = await fetch('/chat/stream', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({
@@ -86,19 +87,62 @@ document.addEventListener('DOMContentLoaded', () => {
                 })
             });
 
-            const data = await response.json();
-            
-            // Remove loader
-            document.getElementById(loadingId).remove();
+            if (!response.ok || !response.body) {
+                throw new Error(`Stream request failed: ${response.status}`);
+            }
+
+            // Read Server-Sent Events: plain text while streaming, HTML once done
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let bubble = null;
+            let streamedText = '';
+
+            const handleEvent = (rawEvent) => {
+                let eventName = 'message';
+                let dataLine = '';
+                rawEvent.split('\n').forEach((line) => {
+                    if (line.startsWith('event: ')) eventName = line.slice(7);
+                    else if (line.startsWith('data: ')) dataLine += line.slice(6);
+                });
+                if (!dataLine) return;
+                const data = JSON.parse(dataLine);
+
+                if (!bubble) {
+                    document.getElementById(loadingId).remove();
+                    bubble = addMessage('', false);
+                }
+
+                if (eventName === 'done') {
+                    bubble.innerHTML = data.response; // Render HTML
+                } else if (eventName === 'error') {
+                    bubble.textContent = "I'm having trouble connecting right now.";
+                } else {
+                    streamedText += data.delta;
+                    bubble.textContent = streamedText;
+                }
+                scrollToBottom();
+            };
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    handleEvent(buffer.slice(0, boundary));
+                    buffer = buffer.slice(boundary + 2);
+                }
+            }
 
-            if (data.error) {
+            if (!bubble) {
+                document.getElementById(loadingId).remove();
                 addMessage("I'm having trouble connecting right now.", false);
-            } else {
-                addMessage(data.response, false, true); // Render HTML
             }
 
         } catch (error) {
-            document.getElementById(loadingId).remove();
+            const loader = document.getElementById(loadingId);
+            if (loader) loader.remove();
             addMessage("Network connection error. Please try again.", false);
             console.error(error);
         } finally {
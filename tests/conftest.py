@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Run from anywhere: modules are imported as `src.…` / `config.…` from the repo root
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
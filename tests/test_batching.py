@@ -0,0 +1,21 @@
+import asyncio
+
+from src.llm.batching import MicroBatcher
+
+
+def test_batcher_holds_its_batch_tasks_until_done():
+    in_flight = []
+
+    async def handler(items):
+        in_flight.append(len(batcher._tasks))
+        await asyncio.sleep(0.01)
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(handler, max_size=3, max_wait=0.01)
+
+    async def main():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(4)))
+
+    assert asyncio.run(main()) == [0, 2, 4, 6]
+    assert in_flight == [1, 1] or in_flight == [1, 2]
+    assert not batcher._tasks
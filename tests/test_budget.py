@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from src.cost import budget as budget_module
+from src.cost.budget import BudgetLimiter
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def _limiter(monkeypatch, **overrides):
+    for name, value in overrides.items():
+        monkeypatch.setattr(budget_module.settings, name, value)
+    return BudgetLimiter(fakeredis.FakeAsyncRedis(decode_responses=True))
+
+
+def test_rejected_requests_do_not_take_rate_limit_slots(monkeypatch):
+    limiter = _limiter(
+        monkeypatch,
+        USER_REQUESTS_PER_MINUTE=2, GLOBAL_REQUESTS_PER_MINUTE=0,
+        MAX_DAILY_CONVERSATIONS=0, USER_TOKEN_BUDGET_PER_DAY=0,
+        TOKEN_BUDGET_PER_DAY=1000, TOKEN_LEASE_SIZE=1000
+    )
+
+    async def main():
+        assert await limiter.admit("u1", "s1") == (True, "ok")
+        limiter.charge("u1", 1000) # uses up the global budget
+        assert await limiter.admit("u1", "s1") == (False, "global_tokens")
+        assert await limiter.admit("u1", "s1") == (False, "global_tokens")
+        return await limiter.redis.zcard("rl:user:u1:req")
+
+    assert asyncio.run(main()) == 1
+
+
+def test_user_rate_limit(monkeypatch):
+    limiter = _limiter(
+        monkeypatch,
+        USER_REQUESTS_PER_MINUTE=2, GLOBAL_REQUESTS_PER_MINUTE=0,
+        MAX_DAILY_CONVERSATIONS=0, USER_TOKEN_BUDGET_PER_DAY=0,
+        TOKEN_BUDGET_PER_DAY=10_000, TOKEN_LEASE_SIZE=1000
+    )
+
+    async def main():
+        return [await limiter.admit("u1", "s1") for _ in range(3)]
+
+    assert asyncio.run(main()) == [(True, "ok"), (True, "ok"), (False, "user_rate")]
@@ -0,0 +1,20 @@
+import pytest
+
+from src.memory.context_builder import _render_entry
+
+
+@pytest.mark.parametrize("value", [None, "", True, {}, []])
+def test_flag_like_values_render_as_the_key_alone(value):
+    assert _render_entry("likes hiking", value) == "likes hiking"
+
+
+@pytest.mark.parametrize("value, rendered", [
+    (1, "sessions: 1"),
+    (1.0, "sessions: 1.0"),
+    (0, "sessions: 0"),
+    (False, "sessions: false"),
+    ("weekly", "sessions: weekly"),
+    ({"a": 1}, 'sessions: {"a":1}'),
+])
+def test_values_are_kept(value, rendered):
+    assert _render_entry("sessions", value) == rendered
@@ -0,0 +1,132 @@
+import random
+import re
+
+import pytest
+
+from src.orchestration.keywords import KeywordAutomaton, KeywordMatch, fold
+from src.orchestration.safety import SafetyGuardrails
+
+RULES = [
+    ("suicid", "CRISIS"),
+    ("kill myself", "CRISIS"),
+    ("want to die", "CRISIS"),
+    ("die", "SHORT"),
+    ("ie", "SHORT"),
+    ("buy drugs", "PROHIBITED"),
+    ("sis", "OVERLAP"),
+]
+
+# Characters that fold unusually under re.IGNORECASE ("İ", "ı" -> i; "ſ" -> s;
+# "ẞ" and "ß" don't fold to ASCII) plus the keywords' own letters
+ALPHABET = list("suicdkl mywantobrgSUICDKLMYWANTOBRG") + ["İ", "ı", "ſ", "ẞ", "ß", "K", "̇"]
+
+
+def _backends():
+    backends = ["python"]
+    try:
+        import ahocorasick # noqa: F401
+        backends.append("pyahocorasick")
+    except ImportError:
+        pass
+    return backends
+
+
+def reference(text):
+    """Every (rule, end) pair the per-regex IGNORECASE loop would find, overlaps included."""
+    found = set()
+    for index, (keyword, _) in enumerate(RULES):
+        for m in re.finditer(f"(?=({re.escape(keyword)}))", text, re.IGNORECASE):
+            found.add((index, m.start() + len(m.group(1))))
+    return found
+
+
+def random_text(rng, length):
+    words = [keyword for keyword, _ in RULES]
+    parts = []
+    while sum(map(len, parts)) < length:
+        if rng.random() < 0.3:
+            word = rng.choice(words)
+            parts.append("".join(rng.choice((c, c.upper(), "İ" if c == "i" else c)) for c in word))
+        else:
+            parts.append("".join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 8))))
+    return "".join(parts)
+
+
+def random_chunks(rng, text):
+    chunks, i = [], 0
+    while i < len(text):
+        step = rng.randint(0, 6) # empty chunks included
+        chunks.append(text[i:i + step])
+        i += step
+    return chunks
+
+
+@pytest.mark.parametrize("backend", _backends())
+def test_scanner_matches_regex_reference_on_random_chunks(backend):
+    automaton = KeywordAutomaton(RULES, backend=backend)
+    assert automaton.backend == backend
+    rng = random.Random(2024)
+    for _ in range(300):
+        text = random_text(rng, rng.randint(0, 60))
+        scanner = automaton.scanner()
+        matches = []
+        for chunk in random_chunks(rng, text):
+            matches.extend(scanner.feed(chunk))
+        assert {(m.index, m.end) for m in matches} == reference(text), text
+        assert len(matches) == len(set(matches))
+        assert [m.end for m in matches] == sorted(m.end for m in matches)
+        assert scanner.position == len(text)
+        assert sorted(automaton.find_all(text)) == sorted(matches)
+
+
+@pytest.mark.parametrize("backend", _backends())
+def test_match_across_chunk_boundary_and_reset(backend):
+    scanner = KeywordAutomaton(RULES, backend=backend).scanner()
+    assert scanner.feed("I want t") == []
+    assert KeywordMatch(2, "CRISIS", 13) in scanner.feed("o dIE")
+    scanner.reset()
+    assert scanner.position == 0
+    # After reset nothing carries over from the previous stream
+    assert scanner.feed("I want t") == []
+    scanner.reset()
+    assert {m.label for m in scanner.feed("o die")} == {"SHORT"}
+
+
+@pytest.mark.parametrize("backend", _backends())
+def test_length_changing_case_folds(backend):
+    automaton = KeywordAutomaton(RULES, backend=backend)
+    # "İ".lower() is two characters; offsets still point into the original text
+    text = "İİ SUİCİDE"
+    assert [(m.label, m.end) for m in automaton.find_all(text) if m.label == "CRISIS"] == [("CRISIS", 9)]
+    assert automaton.matched_labels("ſuıcıde") == ["CRISIS"]
+    assert fold("İıſK") == "iisk" and len(fold("İıſK")) == 4
+
+
+def _baseline_detect_input_risk(guardrails, text):
+    """detect_input_risk as it was before the compiled matchers."""
+    for p in guardrails.crisis_keywords:
+        if re.search(p, text, re.IGNORECASE):
+            return {"is_safe": False, "risk_type": "CRISIS", "reason": "Crisis keyword detected"}
+    for p in guardrails.prohibited_topics:
+        if re.search(p, text, re.IGNORECASE):
+            return {"is_safe": False, "risk_type": "PROHIBITED", "reason": "Prohibited topic detected"}
+    return {"is_safe": True, "risk_type": "NONE", "reason": ""}
+
+
+def test_detect_input_risk_matches_baseline_loop():
+    guardrails = SafetyGuardrails()
+    keywords = guardrails.crisis_keywords + guardrails.prohibited_topics
+    rng = random.Random(7)
+    texts = [
+        "", "hello", "I want to die", "SUİCİDAL thoughts", "how do I buy drugs and kill myself",
+        "revenge pornography", "I might hurt myselF", "suıcıde", "how to kıll a process",
+    ]
+    for _ in range(500):
+        keyword = rng.choice(keywords)
+        mangled = "".join(rng.choice((c, c.upper(), {"i": "İ", "s": "ſ"}.get(c, c))) for c in keyword)
+        if rng.random() < 0.3:
+            cut = rng.randint(0, len(mangled))
+            mangled = mangled[:cut] + rng.choice(" x.") + mangled[cut:]
+        texts.append(f"{random_text(rng, 10)} {mangled} {random_text(rng, 10)}")
+    for text in texts:
+        assert guardrails.detect_input_risk(text) == _baseline_detect_input_risk(guardrails, text), text
@@ -0,0 +1,88 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+
+from src.database.client import _merge_updates
+from src.memory.worker import MemoryUpdateWorker, _summary_update
+
+
+class RecordingDatabase:
+    """Accepts bulk writes, except those containing a user in `reject`."""
+
+    def __init__(self, reject=()):
+        self.reject = set(reject)
+        self.written = []
+
+    async def bulk_update_user_memory(self, updates):
+        _merge_updates(updates)
+        if any(update["user_id"] in self.reject for update in updates):
+            raise RuntimeError("constraint violation")
+        self.written.extend(updates)
+
+
+class RecordingResponseCache:
+    def __init__(self):
+        self.invalidated = []
+
+    async def invalidate_user(self, user_id):
+        self.invalidated.append(user_id)
+
+
+class FixedSummarizer:
+    def __init__(self, summary):
+        self.summary = summary
+
+    async def generate_summary(self, turns):
+        return self.summary
+
+
+def test_malformed_summary_fields_are_dropped():
+    user_id = uuid4()
+    update = _summary_update(user_id, {"1": "not a dict", "2": {"theme": "money"}, "3": ["x"], "4": {"note": 1}})
+    assert update == {
+        "user_id": user_id,
+        "relationship_context": {},
+        "recurring_themes": {"theme": "money"},
+        "emotional_patterns": {},
+        "new_progress_note": ""
+    }
+    _merge_updates([update]) # no longer raises
+
+
+def test_merge_rejects_non_dict_fields():
+    with pytest.raises(ValueError):
+        _merge_updates([{"user_id": uuid4(), "relationship_context": "oops"}])
+
+
+def test_malformed_summary_does_not_lose_the_batch():
+    async def run():
+        db = RecordingDatabase()
+        worker = MemoryUpdateWorker(FixedSummarizer({"1": "oops", "2": {"theme": "trust"}, "4": "Talked"}), db)
+        users = [uuid4() for _ in range(3)]
+        for user_id in users:
+            worker.submit(user_id, "hi", "hello")
+        assert await worker.flush(timeout=5)
+        await worker.close()
+        return users, db
+
+    users, db = asyncio.run(run())
+    assert sorted(u["user_id"] for u in db.written) == sorted(users)
+
+
+def test_failed_bulk_write_is_retried_one_by_one():
+    async def run():
+        bad, good = uuid4(), [uuid4(), uuid4()]
+        db = RecordingDatabase(reject=[bad])
+        cache = RecordingResponseCache()
+        worker = MemoryUpdateWorker(FixedSummarizer({"2": {"theme": "trust"}}), db, response_cache=cache)
+        for user_id in [bad] + good:
+            worker._queue_write(_summary_update(user_id, {"2": {"theme": "trust"}}))
+        await worker._write_batch()
+        return bad, good, db, worker, cache
+
+    bad, good, db, worker, cache = asyncio.run(run())
+    assert sorted(u["user_id"] for u in db.written) == sorted(good)
+    # Only users whose memory actually changed lose their cached responses
+    assert sorted(cache.invalidated) == sorted(str(u) for u in good)
+    assert worker.monitor.get_counters().get("memory_update_failed") == 1
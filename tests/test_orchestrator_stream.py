@@ -0,0 +1,101 @@
+import asyncio
+
+from src.cost.cache import make_cache_key
+from src.cost.router import LoadAwareRouter
+from src.cost.semantic_cache import CacheLookup
+from src.cost.single_flight import SingleFlight
+from src.monitoring.client import MonitoringClient
+from src.orchestration import orchestrator as orchestrator_module
+from src.orchestration.hallucination_controls import HallucinationControls
+from src.orchestration.orchestrator import ConversationOrchestrator
+from src.orchestration.safety import SafetyGuardrails
+
+ANSWER = ["Walking helps many people. ", "Try a short one after lunch. "]
+
+
+class FakeLLM:
+    def __init__(self, deltas, fail_after=None):
+        self.deltas = deltas
+        self.fail_after = fail_after
+
+    async def stream_response(self, **kwargs):
+        for i, delta in enumerate(self.deltas):
+            if i == self.fail_after:
+                raise ConnectionError("stream dropped")
+            yield delta
+
+
+class FakeCache:
+    single_flight = SingleFlight(None, namespace="sf:test")
+
+
+class BrokenSemanticCache:
+    async def store_response(self, lookup, response, risk_level):
+        raise ConnectionError("redis down")
+
+
+class RecordingMemoryWorker:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, user_id, user_msg, bot_msg):
+        self.submitted.append(bot_msg)
+        return True
+
+
+def _orchestrator(llm):
+    orchestrator = ConversationOrchestrator.__new__(ConversationOrchestrator)
+    orchestrator.monitor = MonitoringClient()
+    orchestrator.llm = llm
+    orchestrator.safety = SafetyGuardrails()
+    orchestrator.hallucination = HallucinationControls()
+    orchestrator.router = LoadAwareRouter(lambda: 1.0)
+    orchestrator.cache = FakeCache()
+    orchestrator.semantic_cache = BrokenSemanticCache()
+    orchestrator.memory_worker = RecordingMemoryWorker()
+
+    async def prepare(user_id, message, session_id, state, timer):
+        state["risk_level"] = "LOW_RISK"
+        lookup = CacheLookup(None, make_cache_key(message), "p", None, "miss", str(user_id))
+        return {"risk_level": "LOW_RISK", "model": "gpt-4o-mini", "messages": [], "max_tokens": 100,
+                "cache_lookup": lookup}
+
+    orchestrator._prepare_generation = prepare
+    return orchestrator
+
+
+def _stream(orchestrator):
+    async def run():
+        return [chunk async for chunk in orchestrator.process_message_stream("u1", "how do I relax?", "s1")]
+    return asyncio.run(run())
+
+
+def test_cache_store_failure_after_streaming_does_not_append_fallback():
+    orchestrator = _orchestrator(FakeLLM(ANSWER))
+    chunks = _stream(orchestrator)
+    assert "".join(chunks) == "".join(ANSWER)
+    assert orchestrator_module.TECHNICAL_DIFFICULTIES_RESPONSE not in chunks
+    assert orchestrator.memory_worker.submitted == ["".join(ANSWER)]
+
+
+def test_failure_before_first_segment_yields_fallback():
+    chunks = _stream(_orchestrator(FakeLLM(ANSWER, fail_after=0)))
+    assert chunks == [orchestrator_module.TECHNICAL_DIFFICULTIES_RESPONSE]
+
+
+def test_failure_mid_stream_does_not_append_fallback():
+    chunks = _stream(_orchestrator(FakeLLM(ANSWER, fail_after=1)))
+    assert chunks and orchestrator_module.TECHNICAL_DIFFICULTIES_RESPONSE not in chunks
+
+
+def test_slow_client_is_not_counted_as_generation_latency():
+    orchestrator = _orchestrator(FakeLLM(ANSWER * 3))
+    observed = []
+    orchestrator.router.observe_generation = lambda model, seconds, ok: observed.append(seconds)
+
+    async def run():
+        async for _ in orchestrator.process_message_stream("u1", "how do I relax?", "s1"):
+            await asyncio.sleep(0.05) # the SSE client reads slowly
+
+    asyncio.run(run())
+    assert len(observed) == 1 and observed[0] < 0.05
@@ -0,0 +1,112 @@
+import asyncio
+
+import httpx
+import pytest
+from openai import RateLimitError
+
+from src.llm import providers as providers_module
+from src.llm.providers import CircuitBreaker, Provider, ProviderPool, ProviderSpec
+
+
+def _rate_limited() -> RateLimitError:
+    request = httpx.Request("POST", "https://llm.invalid/v1/chat/completions")
+    return RateLimitError("rate limited", response=httpx.Response(429, request=request), body=None)
+
+
+def _pool(*names):
+    pool = ProviderPool([Provider(ProviderSpec(name, "key", None), client=None) for name in names])
+    events = []
+    pool.add_listener(lambda name, event, latency: events.append((name, event)))
+    return pool, events
+
+
+class FlakyCall:
+    """Fails with a 429 the first `failures` times, then answers with the provider name."""
+
+    def __init__(self, failures=1):
+        self.failures = failures
+        self.calls = []
+
+    async def __call__(self, provider):
+        self.calls.append(provider.name)
+        if len(self.calls) <= self.failures:
+            raise _rate_limited()
+        return provider.name
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    recorded = []
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay, *args, **kwargs):
+        recorded.append(delay)
+        await real_sleep(0)
+
+    monkeypatch.setattr(providers_module.asyncio, "sleep", fake_sleep)
+    return recorded
+
+
+def test_failover_moves_to_another_provider_without_backoff(sleeps):
+    pool, events = _pool("openai", "groq")
+    fn = FlakyCall()
+    result = asyncio.run(pool.call("chat", fn, hedge=False))
+    assert result == "groq"
+    assert fn.calls == ["openai", "groq"]
+    assert sleeps == []
+    assert ("groq", "failover") in events
+
+
+def test_single_provider_backs_off_before_retrying(sleeps):
+    pool, events = _pool("openai")
+    fn = FlakyCall()
+    result = asyncio.run(pool.call("chat", fn))
+    assert result == "openai"
+    assert fn.calls == ["openai", "openai"]
+    base = providers_module.settings.LLM_FAILOVER_BACKOFF_MS / 1000
+    assert len(sleeps) == 1 and 0.5 * base <= sleeps[0] <= 1.5 * base
+    assert ("openai", "backoff") in events
+
+
+def test_single_provider_gives_up_once_its_circuit_opens(sleeps):
+    pool, _ = _pool("openai")
+    pool.providers[0].breaker = CircuitBreaker(window=10, error_rate=0.5, min_calls=1, cooldown=60)
+    fn = FlakyCall(failures=10)
+    with pytest.raises(RateLimitError):
+        asyncio.run(pool.call("chat", fn))
+    assert fn.calls == ["openai"]
+    assert sleeps == []
+
+
+
+def test_losing_hedge_result_is_discarded_and_tracked(monkeypatch):
+    monkeypatch.setattr(providers_module.settings, "LLM_HEDGE_ENABLED", True)
+    monkeypatch.setattr(providers_module.settings, "LLM_HEDGE_MIN_DELAY_MS", 1)
+    pool, events = _pool("openai", "groq")
+    pool.providers[0].latency("chat").observe(0.001) # hedge almost immediately
+    discarded = []
+
+    async def main():
+        both_started = asyncio.Event()
+        started = []
+
+        async def fn(provider):
+            started.append(provider.name)
+            if len(started) == 2:
+                both_started.set()
+            await both_started.wait() # both attempts finish in the same loop iteration
+            return provider.name
+
+        async def discard(result):
+            await asyncio.sleep(0.01)
+            discarded.append(result)
+
+        result = await pool.call("chat", fn, discard=discard)
+        pending = set(pool._discards)
+        await asyncio.gather(*pending)
+        return result, pending
+
+    result, pending = asyncio.run(main())
+    assert ("groq", "hedge") in events
+    assert len(pending) == 1 and not pool._discards
+    assert discarded == [{"openai": "groq", "groq": "openai"}[result]]
@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+from src.cost.cache import ResponseCache
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def test_invalidate_user_drops_only_that_users_entries():
+    async def run():
+        cache = ResponseCache()
+        cache.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        cache._ensure_listener = lambda: None # other workers' invalidations are covered below
+        await cache.cache_response("a1", "answer 1", "LOW_RISK", user_id="alice")
+        await cache.cache_response("a2", "answer 2", "LOW_RISK", user_id="alice")
+        await cache.cache_response("b1", "answer 3", "LOW_RISK", user_id="bob")
+        await cache.invalidate_user("alice")
+        remaining = {key: await cache.get_cached_response(key) for key in ("a1", "a2", "b1")}
+        in_redis = sorted(await cache.redis.keys("resp:*"))
+        return remaining, in_redis
+
+    remaining, in_redis = asyncio.run(run())
+    assert remaining == {"a1": None, "a2": None, "b1": "answer 3"}
+    assert in_redis == ["resp:b1", "resp:user:bob"]
+
+
+def test_invalidation_message_evicts_every_key_from_l1():
+    cache = ResponseCache()
+    for key in ("a1", "a2", "b1"):
+        cache.local.set(key, "answer")
+
+    class OneMessage:
+        async def subscribe(self, channel):
+            pass
+
+        async def listen(self):
+            yield {"type": "message", "data": "a1 a2"}
+            raise asyncio.CancelledError
+
+        async def close(self):
+            pass
+
+    cache.redis.pubsub = OneMessage
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(cache._listen_for_invalidations())
+    assert [key for key in ("a1", "a2", "b1") if cache.local.get(key)] == ["b1"]
@@ -0,0 +1,26 @@
+from src.cost import router as router_module
+from src.cost.router import DEGRADED, LoadAwareRouter
+
+
+def _degraded_router():
+    router = LoadAwareRouter(lambda: 1.0)
+    router.mode = DEGRADED
+    return router
+
+
+def test_degraded_medium_risk_uses_the_configured_smaller_model(monkeypatch):
+    monkeypatch.setattr(router_module.settings, "MODEL_DEGRADED_MEDIUM_RISK", "gpt-4.1-nano")
+    router = _degraded_router()
+    model = router.get_model_for_risk_level("MEDIUM_RISK")
+    assert model == "gpt-4.1-nano"
+    assert router.is_downgrade("MEDIUM_RISK", model)
+    assert router.get_model_for_risk_level("CRISIS") == router_module.settings.MODEL_CRISIS
+
+
+def test_no_downgrade_when_degraded_model_is_the_same(monkeypatch):
+    settings = router_module.settings
+    monkeypatch.setattr(settings, "MODEL_DEGRADED_MEDIUM_RISK", settings.MODEL_MEDIUM_RISK)
+    router = _degraded_router()
+    model = router.get_model_for_risk_level("MEDIUM_RISK")
+    assert model == settings.MODEL_MEDIUM_RISK
+    assert not router.is_downgrade("MEDIUM_RISK", model)
@@ -0,0 +1,111 @@
+import asyncio
+import time
+
+import pytest
+
+from config.settings import get_settings
+from src.cost.semantic_cache import VECTOR_TTL_SECONDS, FileVectorStore, RedisVectorStore, VectorIndex
+
+settings = get_settings()
+
+
+@pytest.fixture
+def small_partitions(monkeypatch):
+    monkeypatch.setattr(settings, "SEMANTIC_CACHE_MAX_ENTRIES", 3)
+
+
+def test_index_expires_old_vectors():
+    index = VectorIndex(10)
+    index.add("old", [1.0, 0.0], added_at=time.time() - VECTOR_TTL_SECONDS - 1)
+    index.add("new", [0.0, 1.0])
+    index.expire(time.time() - VECTOR_TTL_SECONDS)
+    assert len(index) == 1
+    assert index.search([0.0, 1.0])[0] == "new"
+
+
+def test_file_store_caps_partitions_and_loads_incrementally(tmp_path, small_partitions):
+    async def run():
+        store = FileVectorStore(str(tmp_path), flush_every=1)
+        for i in range(5):
+            await store.add("p", f"k{i}", [1.0, float(i)])
+        everything = await store.load("p")
+        cursor = max(added_at for _, _, added_at in everything)
+        time.sleep(0.01)
+        await store.add("p", "k5", [0.0, 1.0])
+        newer = await store.load("p", since=cursor + 0.001)
+        reloaded = await FileVectorStore(str(tmp_path)).load("p")
+        return everything, newer, reloaded
+
+    everything, newer, reloaded = asyncio.run(run())
+    assert [key for key, _, _ in everything] == ["k2", "k3", "k4"]
+    assert [key for key, _, _ in newer] == ["k5"]
+    assert [key for key, _, _ in reloaded] == ["k3", "k4", "k5"]
+
+
+def test_redis_store_expires_and_caps_vectors(small_partitions):
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def run():
+        store = RedisVectorStore()
+        store.redis = fakeredis.FakeAsyncRedis()
+        for i in range(5):
+            await store.add("p", f"k{i}", [1.0, float(i)])
+        ttl = await store.redis.pttl(store._hash_key("p"))
+        keys = [key for key, _, _ in await store.load("p")]
+        # An entry older than the response TTL is dropped on the next add
+        await store.redis.zadd(store._times_key("p"), {"k3": 1000})
+        await store.add("p", "k5", [0.0, 1.0])
+        remaining = sorted(key.decode() for key in await store.redis.hkeys(store._hash_key("p")))
+        return ttl, keys, remaining
+
+    ttl, keys, remaining = asyncio.run(run())
+    assert 0 < ttl <= VECTOR_TTL_SECONDS * 1000
+    assert keys == ["k2", "k3", "k4"]
+    assert remaining == ["k2", "k4", "k5"]
+
+
+class NoEmbeddingsLLM:
+    supports_embeddings = False
+
+    async def embed(self, text):
+        raise AssertionError("embed should not be called")
+
+
+def test_semantic_tier_disabled_without_embedding_provider():
+    from src.cost.cache import ResponseCache
+    from src.cost.semantic_cache import SemanticResponseCache
+
+    cache = SemanticResponseCache(ResponseCache(), NoEmbeddingsLLM())
+    assert not cache.enabled
+    assert cache.store is None
+
+
+class EmbeddingLLM:
+    supports_embeddings = True
+
+
+class BrokenStore:
+    async def load(self, partition, since=0.0):
+        raise ConnectionError("redis down")
+
+    async def add(self, partition, key, vector):
+        raise ConnectionError("redis down")
+
+
+class RecordingResponseCache:
+    def __init__(self):
+        self.stored = []
+
+    async def cache_response(self, key, response, risk_level, user_id=None):
+        self.stored.append(key)
+
+
+def test_store_failure_never_fails_the_request(monkeypatch):
+    from src.cost.semantic_cache import CacheLookup, SemanticResponseCache
+
+    monkeypatch.setattr(settings, "SEMANTIC_CACHE_ENABLED", True)
+    response_cache = RecordingResponseCache()
+    cache = SemanticResponseCache(response_cache, EmbeddingLLM(), store=BrokenStore())
+    lookup = CacheLookup(None, "k1", "evicted-partition", [1.0, 0.0], "miss", "u1")
+    asyncio.run(cache.store_response(lookup, "answer", "LOW_RISK"))
+    assert response_cache.stored == ["k1"]
@@ -0,0 +1,116 @@
+"""
+Train and evaluate the local risk classifier (src/orchestration/risk_classifier.py).
+
+    python -m training.train_risk_classifier
+    python -m training.train_risk_classifier --data extra.jsonl --folds 5 --no-save
+
+Input is JSONL with {"text": ..., "label": LOW_RISK|MEDIUM_RISK|HIGH_RISK|CRISIS}.
+The bundled seed set (training/risk_examples.jsonl) is hand-written; raw user
+messages are never stored, so any additional data has to be curated the same way.
+
+Reports k-fold cross-validated accuracy and, at the thresholds from Settings,
+how many messages would be escalated to CRISIS locally and how many of those
+are labelled lower. Then trains on all examples and writes the model.
+"""
+import argparse
+import json
+import random
+from typing import Dict, List, Tuple
+
+from src.orchestration.risk_classifier import DEFAULT_MODEL_PATH, RISK_LEVELS, RiskModel, evaluate, rates
+from config.settings import get_settings
+
+settings = get_settings()
+
+DEFAULT_DATA = "training/risk_examples.jsonl"
+
+
+def load_examples(paths: List[str]) -> Tuple[List[str], List[str]]:
+    texts, labels = [], []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                if row["label"] not in RISK_LEVELS:
+                    raise ValueError(f"{path}: unknown label {row['label']!r}")
+                texts.append(row["text"])
+                labels.append(row["label"])
+    return texts, labels
+
+
+def stratified_folds(labels: List[str], folds: int, seed: int) -> List[List[int]]:
+    rng = random.Random(seed)
+    by_level: Dict[str, List[int]] = {}
+    for i, label in enumerate(labels):
+        by_level.setdefault(label, []).append(i)
+    out: List[List[int]] = [[] for _ in range(folds)]
+    for indices in by_level.values():
+        rng.shuffle(indices)
+        for n, i in enumerate(indices):
+            out[n % folds].append(i)
+    return out
+
+
+def cross_validate(texts: List[str], labels: List[str], args) -> Dict:
+    totals: Dict = {}
+    for held_out in stratified_folds(labels, args.folds, args.seed):
+        held = set(held_out)
+        train = [i for i in range(len(texts)) if i not in held]
+        model = RiskModel.fit([texts[i] for i in train], [labels[i] for i in train], epochs=args.epochs)
+        result = evaluate(
+            model, [texts[i] for i in held_out], [labels[i] for i in held_out],
+            args.crisis_threshold, args.min_coverage
+        )
+        if not totals:
+            totals = result
+            continue
+        for key, value in result.items():
+            if key == "per_level":
+                for level, counts in value.items():
+                    for name, n in counts.items():
+                        totals["per_level"][level][name] += n
+            else:
+                totals[key] += value
+    return totals
+
+
+def print_report(title: str, result: Dict):
+    summary = rates(result)
+    print(f"{title}: examples={result['examples']} accuracy={summary['accuracy']:.1%} "
+          f"decided={summary['decided_rate']:.1%} decided_accuracy={summary['decided_accuracy']:.1%} "
+          f"over_escalated={result['over_escalated']}")
+    for level in RISK_LEVELS:
+        counts = result["per_level"][level]
+        share = counts["decided"] / counts["count"] if counts["count"] else 0.0
+        print(f"  {level:<12} examples={counts['count']:<5} decided locally={share:.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the local risk classifier.")
+    parser.add_argument("--data", action="append", help=f"JSONL file (repeatable, default {DEFAULT_DATA})")
+    parser.add_argument("--out", default=str(DEFAULT_MODEL_PATH))
+    parser.add_argument("--epochs", type=int, default=300)
+    parser.add_argument("--folds", type=int, default=5, help="cross-validation folds (0 to skip)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--crisis-threshold", type=float, default=settings.LOCAL_CLASSIFIER_CRISIS_THRESHOLD)
+    parser.add_argument("--min-coverage", type=float, default=settings.LOCAL_CLASSIFIER_MIN_COVERAGE)
+    parser.add_argument("--no-save", action="store_true", help="evaluate only")
+    args = parser.parse_args()
+
+    texts, labels = load_examples(args.data or [DEFAULT_DATA])
+
+    if args.folds > 1:
+        print_report(f"{args.folds}-fold cross-validation", cross_validate(texts, labels, args))
+
+    if args.no_save:
+        return
+    model = RiskModel.fit(texts, labels, epochs=args.epochs)
+    print_report("training set", evaluate(model, texts, labels, args.crisis_threshold, args.min_coverage))
+    model.save(args.out)
+    print(f"Saved {args.out}")
+
+
+if __name__ == "__main__":
+    main()